@@ -0,0 +1,277 @@
+"""on-disk cache of per-maze predictions and eval scores for `evaluate_model`
+
+when iterating on plots we repeatedly evaluate the same checkpoints on the same
+dataset. `evaluate_model_cached` stores the predicted path and the score of every
+eval function for every maze, and on later calls only computes what is missing:
+ - mazes with no stored prediction are run through the model (which is only
+   loaded if there is at least one such maze)
+ - eval functions with no stored score are computed from the stored predictions
+"""
+
+import hashlib
+import json
+import os
+import types
+import zipfile
+from pathlib import Path
+
+import numpy as np
+from maze_dataset import MazeDataset
+from muutils.mlutils import chunks
+from muutils.statcounter import StatCounter
+from zanj.externals import ZANJ_MAIN
+
+from maze_transformer.evaluation.eval_model import predict_maze_paths
+from maze_transformer.evaluation.model_registry import ModelRegistry
+from maze_transformer.evaluation.path_evals import PathEvalFunction, PathEvals
+from maze_transformer.training.config import ConfigHolder, ZanjHookedTransformer
+from maze_transformer.utils.file_hash import file_sha256
+
+
+def read_config_holder(model_path: str | Path) -> ConfigHolder:
+    """read only the `ConfigHolder` of a saved `ZanjHookedTransformer`, without loading the weights"""
+    with zipfile.ZipFile(model_path, "r") as zipf:
+        with zipf.open(ZANJ_MAIN, "r") as fp:
+            json_data: dict = json.load(fp)
+
+    return ConfigHolder.load(json_data["zanj_model_config"])
+
+
+class EvalResultCache:
+    """directory of json files storing per-maze predictions and eval scores
+
+    each file corresponds to one key of
+    `(checkpoint file hash, dataset config hash, max_new_tokens, tokenizer name)`,
+    and maps the index of each maze in the dataset to its predicted path and a
+    dict of eval function name to score. The set of eval functions is part of the
+    lookup at the score level, so evaluating a new eval function on a cached key
+    reuses the stored predictions instead of regenerating them.
+
+    each file also stores a fingerprint of every eval function it has scores for (see
+    `eval_function_fingerprint`). when loading with the current fingerprints, scores of
+    eval functions whose code has changed since are dropped, so they get recomputed.
+    the fingerprint only covers the function's own code, so changes in helpers it calls
+    are not detected -- clear the cache directory after changing those.
+    """
+
+    def __init__(self, cache_dir: str | Path) -> None:
+        self.cache_dir: Path = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def get_key(
+        model_path: str | Path,
+        dataset: MazeDataset,
+        max_new_tokens: int,
+        tokenizer_name: str,
+    ) -> dict[str, str | int]:
+        return dict(
+            checkpoint_sha256=file_sha256(model_path),
+            dataset_cfg_hash=str(dataset.cfg.stable_hash_cfg()),
+            max_new_tokens=max_new_tokens,
+            tokenizer_name=tokenizer_name,
+        )
+
+    def get_path(self, key: dict[str, str | int]) -> Path:
+        key_hash: str = hashlib.sha256(
+            json.dumps(key, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        return self.cache_dir / f"eval.{key_hash[:32]}.json"
+
+    def load_with_fingerprints(
+        self,
+        key: dict[str, str | int],
+    ) -> tuple[dict[str, dict], dict[str, str]]:
+        """returns the stored mazes (see `load`) and eval function fingerprints"""
+        path: Path = self.get_path(key)
+        if not path.exists():
+            return dict(), dict()
+
+        with open(path, "r") as f:
+            data: dict = json.load(f)
+
+        if data["key"] != key:
+            raise ValueError(
+                f"cache file {path.as_posix()} has a mismatched key, expected {key = }, got {data['key'] = }"
+            )
+
+        return data["mazes"], data.get("eval_fingerprints", dict())
+
+    def load(
+        self,
+        key: dict[str, str | int],
+        eval_fingerprints: dict[str, str] | None = None,
+    ) -> dict[str, dict]:
+        """returns a dict of maze index (as a string) to `{"prediction": ..., "scores": ...}`
+
+        if `eval_fingerprints` is given, scores of eval functions with a different (or no)
+        stored fingerprint are removed
+        """
+        mazes, stored_fingerprints = self.load_with_fingerprints(key)
+        if eval_fingerprints is not None:
+            _drop_stale_scores(mazes, stored_fingerprints, eval_fingerprints)
+        return mazes
+
+    def save(
+        self,
+        key: dict[str, str | int],
+        mazes: dict[str, dict],
+        eval_fingerprints: dict[str, str] | None = None,
+    ) -> Path:
+        """write atomically, so an interrupted evaluation never leaves a corrupted file"""
+        path: Path = self.get_path(key)
+        path_temp: Path = path.with_suffix(f".tmp{os.getpid()}")
+        with open(path_temp, "w") as f:
+            json.dump(
+                dict(
+                    key=key, eval_fingerprints=eval_fingerprints or dict(), mazes=mazes
+                ),
+                f,
+            )
+        os.replace(path_temp, path)
+
+        return path
+
+
+def eval_function_fingerprint(func: PathEvalFunction) -> str:
+    """hash of an eval function's qualified name and bytecode (including nested functions)"""
+
+    def _code_parts(code: types.CodeType) -> list[str]:
+        parts: list[str] = [code.co_code.hex(), repr(code.co_names)]
+        for const in code.co_consts:
+            if isinstance(const, types.CodeType):
+                parts.extend(_code_parts(const))
+            else:
+                parts.append(repr(const))
+        return parts
+
+    # the values of `PathEvals` maps are `staticmethod` objects
+    func = getattr(func, "__func__", func)
+    parts: list[str] = [getattr(func, "__qualname__", type(func).__qualname__)]
+    code: types.CodeType | None = getattr(func, "__code__", None)
+    if code is not None:
+        parts.extend(_code_parts(code))
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def _drop_stale_scores(
+    mazes: dict[str, dict],
+    stored_fingerprints: dict[str, str],
+    eval_fingerprints: dict[str, str],
+) -> None:
+    stale: list[str] = [
+        name
+        for name, fingerprint in eval_fingerprints.items()
+        if stored_fingerprints.get(name) != fingerprint
+    ]
+    if stale:
+        for entry in mazes.values():
+            for name in stale:
+                entry["scores"].pop(name, None)
+
+
+def evaluate_model_cached(
+    model_path: str | Path,
+    dataset: MazeDataset,
+    cache: EvalResultCache | str | Path,
+    dataset_tokens: list[list[str]] | None = None,
+    eval_functions: dict[str, PathEvalFunction] | None = None,
+    max_new_tokens: int = 8,
+    batch_size: int = 64,
+    model: ZanjHookedTransformer | None = None,
+    verbose: bool = False,
+    registry: ModelRegistry | None = None,
+) -> dict[str, StatCounter]:
+    """like `evaluate_model`, but for a saved checkpoint and with results cached on disk
+
+    only mazes without a stored prediction are run through the model, and only eval
+    functions without a stored score are computed. The model at `model_path` is only
+    loaded if some prediction is missing, unless it is already passed as `model`.
+    Eval functions computed from stored predictions receive `model=None`.
+
+    if dataset_tokens is provided, we assume that the dataset has already been
+    tokenized with the model's tokenizer and we skip tokenization
+
+    if a `registry` is given, the model (if it needs loading) is fetched from it
+    """
+    if not isinstance(cache, EvalResultCache):
+        cache = EvalResultCache(cache)
+
+    if not eval_functions:
+        eval_functions = PathEvals.EVALS
+
+    cfg: ConfigHolder = (
+        model.zanj_model_config if model is not None else read_config_holder(model_path)
+    )
+    key: dict[str, str | int] = cache.get_key(
+        model_path=model_path,
+        dataset=dataset,
+        max_new_tokens=max_new_tokens,
+        tokenizer_name=cfg.maze_tokenizer.name,
+    )
+    eval_fingerprints: dict[str, str] = {
+        name: eval_function_fingerprint(func) for name, func in eval_functions.items()
+    }
+    cached, stored_fingerprints = cache.load_with_fingerprints(key)
+    _drop_stale_scores(cached, stored_fingerprints, eval_fingerprints)
+
+    # predictions for mazes not in the cache
+    missing_idxs: list[int] = [i for i in range(len(dataset)) if str(i) not in cached]
+    if missing_idxs:
+        if model is None:
+            model = (
+                registry.get(model_path, skip_processing=True)
+                if registry is not None
+                else ZanjHookedTransformer.read(
+                    model_path, mmap=True, skip_processing=True
+                )
+            )
+        if dataset_tokens is None:
+            dataset_tokens = dataset.as_tokens(
+                model.tokenizer._maze_tokenizer, join_tokens_individual_maze=False
+            )
+        if verbose:
+            print(
+                f"predicting {len(missing_idxs)} / {len(dataset)} mazes missing from cache"
+            )
+
+        for idxs_batch in chunks(missing_idxs, batch_size):
+            predictions: list[list[tuple[int, int]]] = predict_maze_paths(
+                tokens_batch=[dataset_tokens[i] for i in idxs_batch],
+                data_cfg=dataset.cfg,
+                model=model,
+                max_new_tokens=max_new_tokens,
+                verbose=verbose,
+            )
+            for i, prediction in zip(idxs_batch, predictions):
+                cached[str(i)] = dict(
+                    prediction=[list(coord) for coord in prediction],
+                    scores=dict(),
+                )
+
+    # scores for eval functions not in the cache
+    n_computed: int = 0
+    for i in range(len(dataset)):
+        entry: dict = cached[str(i)]
+        for name, func in eval_functions.items():
+            if name not in entry["scores"]:
+                solved_maze = dataset[i]
+                entry["scores"][name] = float(
+                    func(
+                        maze=solved_maze,
+                        solution=np.array(solved_maze.solution),
+                        prediction=np.array(entry["prediction"]),
+                        model=model,
+                    )
+                )
+                n_computed += 1
+
+    if missing_idxs or n_computed:
+        cache.save(key, cached, {**stored_fingerprints, **eval_fingerprints})
+
+    score_counters: dict[str, StatCounter] = {
+        name: StatCounter(cached[str(i)]["scores"][name] for i in range(len(dataset)))
+        for name in eval_functions
+    }
+
+    return score_counters
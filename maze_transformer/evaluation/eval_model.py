@@ -32,7 +32,9 @@ from transformer_lens import HookedTransformer
 from transformer_lens import utils as tl_utils
 
 from maze_transformer.evaluation.path_evals import PathEvalFunction, PathEvals
+from maze_transformer.evaluation.rollouts import Rollouts
 from maze_transformer.tokenizer import HuggingMazeTokenizer
+from maze_transformer.training.checkpoint_index import CheckpointIndex
 from maze_transformer.training.config import ConfigHolder
 from maze_transformer.training.train_save_files import TRAIN_SAVE_FILES
 from maze_transformer.utils.padding import pad_and_batch_tensors
@@ -50,14 +52,20 @@ def find_config(folder: Path) -> Path | tuple[Path, Path] | None:
 
     Should be able to return config from anywhere in this structure
     (regardless if path provided is file or folder name)
+
+    if the run folder has a checkpoint index (see `maze_transformer.training.checkpoint_index`),
+    the config path recorded there is returned without probing for other files
     """
     containing_folder = folder if folder.is_dir() else folder.parent
-    if containing_folder.name == "checkpoints":
-        to_check = [containing_folder.parent.parent]  # get run folder from checkpoints
+    if containing_folder.name == TRAIN_SAVE_FILES.checkpoints:
+        to_check = [containing_folder.parent]  # get run folder from checkpoints
     else:  # Generic - probably got path to run folder or model.final.pt
         to_check = [containing_folder, containing_folder.parent]
 
     for folder in to_check:
+        index: CheckpointIndex | None = CheckpointIndex.read(folder)
+        if index is not None:
+            return index.config_path
         holder_path = folder / TRAIN_SAVE_FILES.config_holder
         if holder_path.exists():
             return holder_path
@@ -241,9 +249,12 @@ def predict_maze_paths(
 
 def evaluate_path_predictions(
     solved_mazes: list[SolvedMaze],
-    predictions: list[list[tuple[int, int]]],
+    predictions: list[list[tuple[int, int]]] | Rollouts,
     path_evals: dict[str, PathEvalFunction],
 ) -> dict[str, StatCounter]:
+    if isinstance(predictions, Rollouts):
+        predictions = predictions.paths()
+
     path_scores: dict[str, StatCounter] = {
         name: StatCounter() for name in path_evals.keys()
     }
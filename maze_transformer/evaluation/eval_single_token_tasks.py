@@ -14,11 +14,17 @@ from jaxtyping import Bool, Float
 from maze_dataset import MazeDataset
 from maze_dataset.tokenization import MazeTokenizer
 from muutils.json_serialize import SerializableDataclass, serializable_dataclass
+from muutils.mlutils import chunks
 
 # TransformerLens imports
 from transformer_lens import ActivationCache
+from transformer_lens.hook_points import NamesFilter
 
 # mechinterp stuff
+from maze_transformer.mechinterp.activation_capture import (
+    activation_pad_value,
+    activation_pos_dims,
+)
 from maze_transformer.mechinterp.logit_attrib_task import (
     LOGIT_ATTRIB_TASKS,
     DLAProtocolFixed,
@@ -26,6 +32,11 @@ from maze_transformer.mechinterp.logit_attrib_task import (
 
 # model stuff
 from maze_transformer.training.config import ZanjHookedTransformer
+from maze_transformer.utils.padding import (
+    concat_left_padded,
+    length_sorted_order,
+    slice_prompt_positions,
+)
 
 TaskPrompt = NamedTuple(
     "TaskPrompt",
@@ -38,7 +49,7 @@ TaskPrompt = NamedTuple(
 
 @serializable_dataclass(kw_only=True)
 class TaskEvalResult(SerializableDataclass):
-    logits: Float[torch.Tensor, "samples seq_len d_vocab"]
+    logits: Float[torch.Tensor, "samples seq_len d_vocab"] | None
     cache: ActivationCache | None
     last_tok_logits: Float[torch.Tensor, "samples d_vocab"]
     predicted_tokens: list[str]
@@ -49,50 +60,268 @@ def get_task_prompts_targets(
     dataset: MazeDataset,
     maze_tokenizer: MazeTokenizer,
     tasks: dict[str, DLAProtocolFixed] = LOGIT_ATTRIB_TASKS,
+    dataset_tokens: list[list[str]] | None = None,
 ) -> dict[str, TaskPrompt]:
-    dataset_tokens: list[list[str]] = dataset.as_tokens(
-        maze_tokenizer,
-        join_tokens_individual_maze=False,
-    )
+    """if `dataset_tokens` is given, the dataset is not tokenized again
+
+    tokenization shuffles the adjacency list, so pass the same `dataset_tokens` here
+    and to `eval_model_across_tasks` to use the shared prefix forward pass
+    """
+    if dataset_tokens is None:
+        dataset_tokens = dataset.as_tokens(
+            maze_tokenizer,
+            join_tokens_individual_maze=False,
+        )
 
     return {task_name: task(dataset_tokens) for task_name, task in tasks.items()}
 
 
-def eval_model_task(
+def _merge_task_eval_chunks(
     model: ZanjHookedTransformer,
-    task: TaskPrompt,
-    do_cache: bool = False,
+    targets: list[str],
+    inverse_order: torch.Tensor,
+    last_tok_logits_chunks: list[torch.Tensor],
+    logits_chunks: list[torch.Tensor] | None,
+    cache_chunks: dict[str, list[torch.Tensor]] | None,
 ) -> TaskEvalResult:
+    """concatenate per-chunk outputs (left padding to the longest prompt) and restore the original order"""
     maze_tokenizer: MazeTokenizer = model.tokenizer._maze_tokenizer
 
-    prompts_joined: list[str] = [" ".join(prompt) for prompt in task.prompts]
-
-    if do_cache:
-        logits, cache = model.run_with_cache(prompts_joined)
-    else:
-        logits = model(prompts_joined)
-        cache = None
+    last_tok_logits: Float[torch.Tensor, "samples d_vocab"] = torch.cat(
+        last_tok_logits_chunks, dim=0
+    )[inverse_order]
 
-    predicted_tokens = maze_tokenizer.decode(logits[:, -1, :].argmax(dim=-1).tolist())
+    predicted_tokens = maze_tokenizer.decode(last_tok_logits.argmax(dim=-1).tolist())
 
     return TaskEvalResult(
-        logits=logits,
-        cache=cache,
-        last_tok_logits=logits[:, -1, :].cpu(),
+        logits=(
+            concat_left_padded(logits_chunks)[inverse_order.to(logits_chunks[0].device)]
+            if logits_chunks is not None
+            else None
+        ),
+        cache=(
+            ActivationCache(
+                {
+                    k: concat_left_padded(
+                        v,
+                        pos_dims=activation_pos_dims(k),
+                        value=activation_pad_value(k),
+                    )[inverse_order.to(v[0].device)]
+                    for k, v in cache_chunks.items()
+                },
+                model,
+            )
+            if cache_chunks is not None
+            else None
+        ),
+        last_tok_logits=last_tok_logits,
         predicted_tokens=predicted_tokens,
         predicted_correct=torch.tensor(
-            [pred == target for pred, target in zip(predicted_tokens, task.targets)]
+            [pred == target for pred, target in zip(predicted_tokens, targets)]
         ),
     )
 
 
+def eval_model_task(
+    model: ZanjHookedTransformer,
+    task: TaskPrompt,
+    do_cache: bool = False,
+    batch_size: int | None = 64,
+    return_full_logits: bool = False,
+    cache_hooks: NamesFilter = None,
+) -> TaskEvalResult:
+    """run the model on the prompts of a task, in chunks of `batch_size` prompts
+
+    prompts are sorted by length before chunking to minimize padding, and the outputs
+    are returned in the original order. if `batch_size` is `None`, all prompts are
+    run in a single forward pass.
+
+    - full logits are only kept if `return_full_logits` is true, otherwise
+      `TaskEvalResult.logits` is `None` and only `last_tok_logits` is kept
+    - if `do_cache`, only the activations selected by `cache_hooks` are cached
+      (anything accepted as `names_filter` by `run_with_cache`, `None` for all hooks)
+
+    since the model left-pads prompts, per-chunk logits and activations are left
+    padded to the longest prompt before being concatenated. padding is zero, except
+    for attention scores which are padded with `-inf` as the model does for masked positions.
+    """
+    n_prompts: int = len(task.prompts)
+    if batch_size is None:
+        batch_size = max(n_prompts, 1)
+
+    # sort by length so each chunk is padded as little as possible
+    order, inverse_order = length_sorted_order([len(prompt) for prompt in task.prompts])
+
+    last_tok_logits_chunks: list[torch.Tensor] = list()
+    logits_chunks: list[torch.Tensor] = list()
+    cache_chunks: dict[str, list[torch.Tensor]] = dict()
+
+    with torch.no_grad():
+        for idxs_chunk in chunks(order, batch_size):
+            prompts_joined: list[str] = [" ".join(task.prompts[i]) for i in idxs_chunk]
+
+            if do_cache:
+                logits, cache = model.run_with_cache(
+                    prompts_joined, names_filter=cache_hooks
+                )
+                for k, v in cache.items():
+                    cache_chunks.setdefault(k, list()).append(v)
+                del cache
+            else:
+                logits = model(prompts_joined)
+
+            last_tok_logits_chunks.append(logits[:, -1, :].cpu())
+            if return_full_logits:
+                logits_chunks.append(logits)
+            del logits
+
+    return _merge_task_eval_chunks(
+        model=model,
+        targets=task.targets,
+        inverse_order=inverse_order,
+        last_tok_logits_chunks=last_tok_logits_chunks,
+        logits_chunks=logits_chunks if return_full_logits else None,
+        cache_chunks=cache_chunks if do_cache else None,
+    )
+
+
+def _eval_model_across_tasks_shared_prefix(
+    model: ZanjHookedTransformer,
+    task_prompts: dict[str, TaskPrompt],
+    dataset_tokens: list[list[str]],
+    do_cache: bool = False,
+    batch_size: int | None = 64,
+    return_full_logits: bool = False,
+    cache_hooks: NamesFilter = None,
+) -> dict[str, TaskEvalResult]:
+    n_mazes: int = len(dataset_tokens)
+    if batch_size is None:
+        batch_size = max(n_mazes, 1)
+
+    # for every task and maze, how many tokens of the full sequence come after the prompt
+    n_tokens_after_prompt: dict[str, list[int]] = dict()
+    for task_name, task in task_prompts.items():
+        assert (
+            len(task.prompts) == n_mazes
+        ), f"task '{task_name}' has {len(task.prompts)} prompts, but {n_mazes = }"
+        for i, (prompt, maze_tokens) in enumerate(zip(task.prompts, dataset_tokens)):
+            assert (
+                maze_tokens[: len(prompt)] == prompt
+            ), f"prompt {i} of task '{task_name}' is not a prefix of the maze tokens:\n{prompt = }\n{maze_tokens = }"
+        n_tokens_after_prompt[task_name] = [
+            len(maze_tokens) - len(prompt)
+            for prompt, maze_tokens in zip(task.prompts, dataset_tokens)
+        ]
+
+    order, inverse_order = length_sorted_order([len(x) for x in dataset_tokens])
+
+    last_tok_logits_chunks: dict[str, list[torch.Tensor]] = {
+        task_name: list() for task_name in task_prompts
+    }
+    logits_chunks: dict[str, list[torch.Tensor]] = {
+        task_name: list() for task_name in task_prompts
+    }
+    cache_chunks: dict[str, dict[str, list[torch.Tensor]]] = {
+        task_name: dict() for task_name in task_prompts
+    }
+
+    with torch.no_grad():
+        for idxs_chunk in chunks(order, batch_size):
+            prompts_joined: list[str] = [
+                " ".join(dataset_tokens[i]) for i in idxs_chunk
+            ]
+
+            cache: ActivationCache | None = None
+            if do_cache:
+                logits, cache = model.run_with_cache(
+                    prompts_joined, names_filter=cache_hooks
+                )
+            else:
+                logits = model(prompts_joined)
+
+            seq_len: int = logits.shape[1]
+            for task_name, task in task_prompts.items():
+                # sequences are left padded, so count the position of the last prompt token from the end
+                prompt_end_idxs: list[int] = [
+                    seq_len - 1 - n_tokens_after_prompt[task_name][i]
+                    for i in idxs_chunk
+                ]
+                last_tok_logits_chunks[task_name].append(
+                    logits[torch.arange(len(idxs_chunk)), prompt_end_idxs].cpu()
+                )
+
+                # the model prepends a BOS token to each prompt
+                prompt_lengths: list[int] = [
+                    len(task.prompts[i]) + 1 for i in idxs_chunk
+                ]
+                if return_full_logits:
+                    logits_chunks[task_name].append(
+                        slice_prompt_positions(logits, prompt_end_idxs, prompt_lengths)
+                    )
+                if do_cache:
+                    for k, v in cache.items():
+                        cache_chunks[task_name].setdefault(k, list()).append(
+                            slice_prompt_positions(
+                                v,
+                                prompt_end_idxs,
+                                prompt_lengths,
+                                pos_dims=activation_pos_dims(k),
+                                value=activation_pad_value(k),
+                            )
+                        )
+
+            del logits, cache
+
+    return {
+        task_name: _merge_task_eval_chunks(
+            model=model,
+            targets=task.targets,
+            inverse_order=inverse_order,
+            last_tok_logits_chunks=last_tok_logits_chunks[task_name],
+            logits_chunks=logits_chunks[task_name] if return_full_logits else None,
+            cache_chunks=cache_chunks[task_name] if do_cache else None,
+        )
+        for task_name, task in task_prompts.items()
+    }
+
+
 def eval_model_across_tasks(
     model: ZanjHookedTransformer,
     task_prompts: dict[str, TaskPrompt],
     do_cache: bool = False,
+    batch_size: int | None = 64,
+    return_full_logits: bool = False,
+    cache_hooks: NamesFilter = None,
+    dataset_tokens: list[list[str]] | None = None,
 ) -> dict[str, TaskEvalResult]:
+    """run `eval_model_task` for every task
+
+    if `dataset_tokens` is given, every task prompt must be a prefix of the tokens of
+    the corresponding maze (as for all `LOGIT_ATTRIB_TASKS`). The model is then run once
+    on each full maze, and the logits and activations of each task are read at the
+    positions of its prompt, which is equivalent because attention is causal. This
+    needs the same `dataset_tokens` that were passed to `get_task_prompts_targets`.
+    """
+    if dataset_tokens is not None:
+        return _eval_model_across_tasks_shared_prefix(
+            model,
+            task_prompts,
+            dataset_tokens=dataset_tokens,
+            do_cache=do_cache,
+            batch_size=batch_size,
+            return_full_logits=return_full_logits,
+            cache_hooks=cache_hooks,
+        )
+
     return {
-        task_name: eval_model_task(model, task, do_cache=do_cache)
+        task_name: eval_model_task(
+            model,
+            task,
+            do_cache=do_cache,
+            batch_size=batch_size,
+            return_full_logits=return_full_logits,
+            cache_hooks=cache_hooks,
+        )
         for task_name, task in task_prompts.items()
     }
 
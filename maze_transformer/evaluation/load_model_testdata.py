@@ -3,6 +3,7 @@ from pathlib import Path
 from maze_dataset import MazeDataset, MazeDatasetConfig
 from muutils.misc import shorten_numerical_to_str
 
+from maze_transformer.evaluation.model_registry import ModelRegistry
 from maze_transformer.training.config import ZanjHookedTransformer
 
 
@@ -11,11 +12,25 @@ def load_model_with_test_data(
     dataset_cfg_source: MazeDatasetConfig | None = None,
     n_examples: int | None = 128,
     verbose: bool = True,
+    mmap: bool = False,
+    skip_processing: bool = False,
+    registry: ModelRegistry | None = None,
 ) -> tuple[ZanjHookedTransformer, MazeDataset | None]:
+    """`mmap` and `skip_processing` are passed to `ZanjHookedTransformer.read`
+
+    if a `registry` is given (such as `MODEL_REGISTRY`), the model is fetched from it,
+    and shared with other callers
+    """
     model_path = Path(model_path)
 
     # load model
-    model: ZanjHookedTransformer = ZanjHookedTransformer.read(model_path)
+    model: ZanjHookedTransformer = (
+        registry.get(model_path, mmap=mmap, skip_processing=skip_processing)
+        if registry is not None
+        else ZanjHookedTransformer.read(
+            model_path, mmap=mmap, skip_processing=skip_processing
+        )
+    )
     num_params: int = model.num_params()
     model_name: str = str(model_path.stem).removeprefix("model.").removeprefix("wandb.")
 
@@ -0,0 +1,150 @@
+"""in-process cache of loaded models, keyed by checkpoint path and modification time
+
+in a long-lived notebook or service, the same few checkpoints are read over and over.
+a `ModelRegistry` keeps the loaded `ZanjHookedTransformer` instances, returning the same
+instance for the same file until the file changes on disk, and evicts the least recently
+used models once their parameters exceed a memory budget.
+
+models from the registry are shared: anything which modifies a model (its weights, or
+its config) must read its own copy with `ZanjHookedTransformer.read` instead.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import NamedTuple
+
+from maze_transformer.training.config import ZanjHookedTransformer
+
+# default memory budget for `MODEL_REGISTRY`, in bytes
+DEFAULT_MODEL_REGISTRY_MAX_BYTES: int = 4 * 2**30
+
+
+class ModelRegistryKey(NamedTuple):
+    path: str
+    mtime_ns: int
+    size: int
+    skip_processing: bool
+
+
+def model_nbytes(model: ZanjHookedTransformer) -> int:
+    """memory taken by the parameters and buffers of a model"""
+    return sum(
+        t.numel() * t.element_size()
+        for t in list(model.parameters()) + list(model.buffers())
+    )
+
+
+class ModelRegistry:
+    """LRU cache of `ZanjHookedTransformer`s read from disk
+
+    - `max_bytes` is the budget for the parameters and buffers of all cached models.
+      `None` means no limit. the most recently used model is always kept, even if it
+      alone is over the budget
+    - a cached model is reused only if the file's path, mtime and size are unchanged.
+      once they change, the models cached for that path in every processing mode are
+      dropped the next time it is read
+    """
+
+    def __init__(
+        self, max_bytes: int | None = DEFAULT_MODEL_REGISTRY_MAX_BYTES
+    ) -> None:
+        self.max_bytes: int | None = max_bytes
+        self._models: OrderedDict[
+            ModelRegistryKey, tuple[ZanjHookedTransformer, int]
+        ] = OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @staticmethod
+    def get_key(
+        model_path: str | Path,
+        skip_processing: bool = False,
+    ) -> ModelRegistryKey:
+        path: Path = Path(model_path).resolve()
+        stat: os.stat_result = path.stat()
+        return ModelRegistryKey(
+            path=path.as_posix(),
+            mtime_ns=stat.st_mtime_ns,
+            size=stat.st_size,
+            skip_processing=skip_processing,
+        )
+
+    def __len__(self) -> int:
+        return len(self._models)
+
+    def __contains__(self, model_path: str | Path) -> bool:
+        """whether the current contents of `model_path` are cached, in either processing mode"""
+        key: ModelRegistryKey = self.get_key(model_path)
+        return any(
+            k._replace(skip_processing=key.skip_processing) == key for k in self._models
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return sum(nbytes for _, nbytes in self._models.values())
+
+    def get(
+        self,
+        model_path: str | Path,
+        mmap: bool = False,
+        skip_processing: bool = False,
+    ) -> ZanjHookedTransformer:
+        """the cached model for `model_path`, reading it (see `ZanjHookedTransformer.read`) if needed"""
+        key: ModelRegistryKey = self.get_key(model_path, skip_processing)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return self._models[key][0]
+
+        # read outside the lock, so other models can be fetched meanwhile
+        model: ZanjHookedTransformer = ZanjHookedTransformer.read(
+            model_path, mmap=mmap, skip_processing=skip_processing
+        )
+        with self._lock:
+            self.misses += 1
+            self._insert(key, model)
+        return model
+
+    def put(
+        self,
+        model_path: str | Path,
+        model: ZanjHookedTransformer,
+    ) -> None:
+        """register an already loaded `model` as the contents of `model_path` (for example, right after saving it)"""
+        with self._lock:
+            self._insert(self.get_key(model_path), model)
+
+    def _insert(self, key: ModelRegistryKey, model: ZanjHookedTransformer) -> None:
+        # drop stale entries for the same file, in either processing mode
+        for old_key in [
+            k
+            for k in self._models
+            if k.path == key.path and (k.mtime_ns, k.size) != (key.mtime_ns, key.size)
+        ]:
+            del self._models[old_key]
+
+        self._models[key] = (model, model_nbytes(model))
+        self._models.move_to_end(key)
+
+        if self.max_bytes is not None:
+            while len(self._models) > 1 and self.nbytes > self.max_bytes:
+                self._models.popitem(last=False)
+
+    def evict(self, model_path: str | Path) -> None:
+        """remove all cached models read from `model_path`"""
+        path: str = Path(model_path).resolve().as_posix()
+        with self._lock:
+            for key in [k for k in self._models if k.path == path]:
+                del self._models[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+
+# shared registry for the current process
+MODEL_REGISTRY: ModelRegistry = ModelRegistry()
@@ -13,6 +13,8 @@ from maze_dataset import (
 )
 from muutils.mlutils import register_method
 
+from maze_transformer.evaluation.rollouts import Rollouts
+
 # pylint: disable=unused-argument
 MazePath = CoordArray
 
@@ -204,20 +206,41 @@ class PathEvals:
 
 # TODO: split these up into path evals / rollout evals / etc. see https://github.com/understanding-search/maze-transformer/issues/200
 def rollout_evals(
-    predictions: list[str],
+    predictions: list[list[str | CoordTup]] | Rollouts,
     mazes: list[SolvedMaze],
 ) -> dict[str, float]:
+    """evals on raw rollouts, including non-coord tokens
+
+    `predictions` is either the output of `predict_maze_paths` with `when_noncoord="include"`,
+    or the equivalent `Rollouts`
+    """
     n_mazes: int = len(predictions)
     output: dict[str, float] = dict()
 
     # raw tokens evals
-    final_is_path_end: Bool[np.ndarray, "n_mazes"] = np.array(
-        [np.all(path[-1] == SPECIAL_TOKENS.PATH_END) for path in predictions]
-    )
+    final_is_path_end: Bool[np.ndarray, "n_mazes"]
+    num_noncoord_tokens_in_generation: Int[np.ndarray, "n_mazes"]
+    predictions_np: list[CoordArray]
+    if isinstance(predictions, Rollouts):
+        final_is_path_end = predictions.final_token_is(SPECIAL_TOKENS.PATH_END)
+        num_noncoord_tokens_in_generation = predictions.count_noncoord()
+        predictions_np = predictions.paths()
+    else:
+        final_is_path_end = np.array(
+            [
+                len(path) > 0 and np.all(path[-1] == SPECIAL_TOKENS.PATH_END)
+                for path in predictions
+            ]
+        )
+        num_noncoord_tokens_in_generation = np.array(
+            [len([t for t in path if isinstance(t, str)]) for path in predictions]
+        )
+        predictions_np = [
+            np.array([coord for coord in path if not isinstance(coord, str)])
+            for i, path in enumerate(predictions)
+        ]
+
     output["correct EOS"] = np.mean(final_is_path_end)
-    num_noncoord_tokens_in_generation: Int[np.ndarray, "n_mazes"] = np.array(
-        [len([t for t in path if isinstance(t, str)]) for path in predictions]
-    )
     output["mean invalid tokens"] = np.mean(
         np.abs(num_noncoord_tokens_in_generation - 2)
     )
@@ -226,11 +249,6 @@ def rollout_evals(
     )
 
     # path evals
-    predictions_np: list[CoordArray] = [
-        np.array([coord for coord in path if not isinstance(coord, str)])
-        for i, path in enumerate(predictions)
-    ]
-
     exact_correct: Bool[np.ndarray, "n_mazes"] = np.zeros(n_mazes, dtype=bool)
     valid_path: Bool[np.ndarray, "n_mazes"] = np.zeros(n_mazes, dtype=bool)
     target_correct: Bool[np.ndarray, "n_mazes"] = np.zeros(n_mazes, dtype=bool)
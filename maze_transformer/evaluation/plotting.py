@@ -1,19 +1,29 @@
 # Generic
+import multiprocessing
+import os
 from pathlib import Path
 
 # Plotting
 import matplotlib.pyplot as plt
 
+# Numerical Computing
+import torch
+
 # dataset
 from maze_dataset import MazeDataset
 from maze_dataset.plotting import MazePlot, PathFormat
 
 # Utilities
-from muutils.mlutils import get_checkpoint_paths_for_run
 from muutils.statcounter import StatCounter
 
 # maze-transformer
+from maze_transformer.evaluation.eval_cache import (
+    evaluate_model_cached,
+    read_config_holder,
+)
 from maze_transformer.evaluation.eval_model import evaluate_model, predict_maze_paths
+from maze_transformer.evaluation.model_registry import ModelRegistry
+from maze_transformer.training.checkpoint_index import get_checkpoint_paths
 from maze_transformer.training.config import ZanjHookedTransformer
 
 
@@ -87,20 +97,98 @@ def plot_predicted_paths(
     return fig, axs
 
 
+# set by `_init_checkpoint_eval_worker` in each worker process of the pool
+_CHECKPOINT_EVAL_SHARED: dict = dict()
+
+
+def _init_checkpoint_eval_worker(
+    dataset: MazeDataset,
+    dataset_tokens: list[list[str]],
+    n_threads: int,
+    cache_dir: Path | None,
+) -> None:
+    """store the dataset and its tokens once per worker, instead of once per checkpoint"""
+    torch.set_num_threads(n_threads)
+    _CHECKPOINT_EVAL_SHARED["dataset"] = dataset
+    _CHECKPOINT_EVAL_SHARED["dataset_tokens"] = dataset_tokens
+    _CHECKPOINT_EVAL_SHARED["cache_dir"] = cache_dir
+
+
+def _eval_checkpoint(
+    checkpoint_path: Path,
+    dataset: MazeDataset,
+    dataset_tokens: list[list[str]],
+    cache_dir: Path | None,
+    registry: ModelRegistry | None = None,
+) -> dict[str, StatCounter]:
+    if cache_dir is not None:
+        return evaluate_model_cached(
+            model_path=checkpoint_path,
+            dataset=dataset,
+            cache=cache_dir,
+            dataset_tokens=dataset_tokens,
+            registry=registry,
+        )
+
+    model: ZanjHookedTransformer = (
+        registry.get(checkpoint_path, skip_processing=True)
+        if registry is not None
+        else ZanjHookedTransformer.read(
+            checkpoint_path, mmap=True, skip_processing=True
+        )
+    )
+    return evaluate_model(
+        model=model,
+        dataset=dataset,
+        dataset_tokens=dataset_tokens,
+    )
+
+
+def _eval_checkpoint_worker(
+    idx_path: tuple[int, Path],
+) -> tuple[int, dict[str, StatCounter]]:
+    idx, checkpoint_path = idx_path
+    print(f"# Evaluating checkpoint {idx} at {checkpoint_path}")
+    return idx, _eval_checkpoint(
+        checkpoint_path=checkpoint_path,
+        dataset=_CHECKPOINT_EVAL_SHARED["dataset"],
+        dataset_tokens=_CHECKPOINT_EVAL_SHARED["dataset_tokens"],
+        cache_dir=_CHECKPOINT_EVAL_SHARED["cache_dir"],
+    )
+
+
 def eval_model_at_checkpoints(
     model_path: Path,
     dataset: MazeDataset,
     max_checkpoints: int = 50,
+    parallel: bool | int = False,
+    cache_dir: Path | None = None,
+    registry: ModelRegistry | None = None,
 ) -> dict[str, dict[int, StatCounter]]:
     """runs evaluate_model on various checkpoints of a model
 
     returned dict maps eval name to a dict of checkpoint index to statcounter
+
+    the dataset is tokenized only once, using the tokenizer of the first checkpoint
+    (all checkpoints of a run share a tokenizer). if `parallel` is `True` or an int,
+    checkpoints are loaded and evaluated concurrently in a process pool (with
+    `parallel` processes if an int, otherwise one per cpu core). the dataset and its
+    tokens are handed to each worker once at startup.
+
+    if `cache_dir` is given, per-maze predictions and scores are cached there (see
+    `maze_transformer.evaluation.eval_cache`), and re-running only computes entries
+    which are missing from the cache.
+
+    if a `registry` is given (such as `MODEL_REGISTRY`), checkpoints evaluated in this
+    process are fetched from it, so evaluating the same checkpoints again reuses them.
+
+    checkpoints are listed from the run's checkpoint index if it has one (see
+    `maze_transformer.training.checkpoint_index`), otherwise from the checkpoints directory.
     """
 
-    model_checkpoints: list[tuple[int, Path]] = get_checkpoint_paths_for_run(
+    model_checkpoints: list[tuple[int, Path]] = get_checkpoint_paths(
         model_path.parent, "zanj"
     )
-    model_checkpoints.sort(key=lambda x: x[0])
     print(
         f"Found {len(model_checkpoints)} checkpoints, min_index={model_checkpoints[0][0]}, max_index={model_checkpoints[-1][0]}"
     )
@@ -113,15 +201,38 @@ def eval_model_at_checkpoints(
         f"will evaluate {len(model_checkpoints)} checkpoints: {[(i,p.as_posix()) for i,p in model_checkpoints]}"
     )
 
+    # tokenize the dataset once, reading only the config of the first checkpoint
+    dataset_tokens: list[list[str]] = dataset.as_tokens(
+        read_config_holder(model_checkpoints[0][1]).maze_tokenizer,
+        join_tokens_individual_maze=False,
+    )
+
     pathdist_scores_idx: dict[int, dict[str, StatCounter]] = dict()
 
-    for idx, checkpoint_path in model_checkpoints:
-        print(f"# Evaluating checkpoint {idx} at {checkpoint_path}")
-        model_at_index = ZanjHookedTransformer.read(checkpoint_path)
-        pathdist_scores_idx[idx] = evaluate_model(
-            model=model_at_index,
-            dataset=dataset,
-        )
+    if parallel:
+        n_processes: int = os.cpu_count() if parallel is True else parallel
+        n_processes = min(n_processes, len(model_checkpoints))
+        # split the cores between workers so torch doesn't oversubscribe
+        n_threads: int = max(1, os.cpu_count() // n_processes)
+        print(f"evaluating in parallel with {n_processes} processes")
+        with multiprocessing.Pool(
+            processes=n_processes,
+            initializer=_init_checkpoint_eval_worker,
+            initargs=(dataset, dataset_tokens, n_threads, cache_dir),
+        ) as pool:
+            pathdist_scores_idx = dict(
+                pool.imap(_eval_checkpoint_worker, model_checkpoints)
+            )
+    else:
+        for idx, checkpoint_path in model_checkpoints:
+            print(f"# Evaluating checkpoint {idx} at {checkpoint_path}")
+            pathdist_scores_idx[idx] = _eval_checkpoint(
+                checkpoint_path=checkpoint_path,
+                dataset=dataset,
+                dataset_tokens=dataset_tokens,
+                cache_dir=cache_dir,
+                registry=registry,
+            )
 
     return {
         name: {idx: scores[name] for idx, scores in pathdist_scores_idx.items()}
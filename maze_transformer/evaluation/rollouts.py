@@ -0,0 +1,219 @@
+"""columnar storage of model rollouts, for computing path evals without regenerating
+
+`predict_maze_paths` returns a nested `list[list[str | CoordTup]]`, which is slow to
+build, pickle, and re-evaluate for large datasets. `Rollouts` stores the same
+information as a handful of flat arrays, with `offsets` marking where each rollout
+starts, in the same way as a CSR sparse matrix.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+from jaxtyping import Bool, Int
+from maze_dataset import CoordArray, CoordTup
+from maze_dataset.tokenization import MazeTokenizer
+from muutils.json_serialize import (
+    SerializableDataclass,
+    serializable_dataclass,
+    serializable_field,
+)
+from zanj import ZANJ
+
+# placeholder coordinate for non-coord tokens
+NONCOORD_FILL: int = -1
+
+
+def _load_array(data, dtype) -> np.ndarray:
+    # arrays are already loaded by `ZANJ`, but are nested lists when loading from plain json
+    return np.asarray(data, dtype=dtype)
+
+
+@serializable_dataclass(kw_only=True)
+class Rollouts(SerializableDataclass):
+    """flat arrays holding the predicted path tokens of many rollouts
+
+    rollout `i` consists of the elements `offsets[i]:offsets[i+1]` of each per-element array.
+    an element is either a coordinate or a non-coordinate token (such as `<PATH_END>`):
+
+    - `coords` holds the coordinate, or `NONCOORD_FILL` for non-coord elements
+    - `token_ids` holds the id of the element in `maze_tokenizer`, or -1 if it is a
+      coordinate which is not a single token (i.e. for non-UT tokenizers)
+    - `is_coord` is true for coordinate elements
+    """
+
+    maze_tokenizer: MazeTokenizer = serializable_field(
+        loading_fn=lambda data: MazeTokenizer.load(data["maze_tokenizer"]),
+    )
+    coords: Int[np.ndarray, "n_elements 2"] = serializable_field(
+        loading_fn=lambda data: _load_array(data["coords"], np.int16).reshape(-1, 2),
+    )
+    token_ids: Int[np.ndarray, "n_elements"] = serializable_field(
+        loading_fn=lambda data: _load_array(data["token_ids"], np.int32),
+    )
+    is_coord: Bool[np.ndarray, "n_elements"] = serializable_field(
+        loading_fn=lambda data: _load_array(data["is_coord"], np.bool_),
+    )
+    offsets: Int[np.ndarray, "n_rollouts_plus_1"] = serializable_field(
+        loading_fn=lambda data: _load_array(data["offsets"], np.int64),
+    )
+
+    def __post_init__(self) -> None:
+        n_elements: int = len(self.token_ids)
+        assert self.coords.shape == (
+            n_elements,
+            2,
+        ), f"coords must have shape (n_elements, 2), got {self.coords.shape = } for {n_elements = }"
+        assert self.is_coord.shape == (
+            n_elements,
+        ), f"is_coord must have shape (n_elements,), got {self.is_coord.shape = } for {n_elements = }"
+        assert (
+            self.offsets[0] == 0 and self.offsets[-1] == n_elements
+        ), f"offsets must start at 0 and end at {n_elements = }, got {self.offsets = }"
+
+    @property
+    def n_rollouts(self) -> int:
+        return len(self.offsets) - 1
+
+    def __len__(self) -> int:
+        return self.n_rollouts
+
+    @property
+    def lengths(self) -> Int[np.ndarray, "n_rollouts"]:
+        """number of elements (coords and non-coord tokens) in each rollout"""
+        return np.diff(self.offsets)
+
+    @classmethod
+    def from_predictions(
+        cls,
+        predictions: list[list[str | CoordTup]],
+        maze_tokenizer: MazeTokenizer,
+    ) -> "Rollouts":
+        """convert the output of `predict_maze_paths`
+
+        to keep non-coordinate tokens, call `predict_maze_paths` with `when_noncoord="include"`
+        """
+        offsets: Int[np.ndarray, "n_rollouts_plus_1"] = np.zeros(
+            len(predictions) + 1, dtype=np.int64
+        )
+        offsets[1:] = np.cumsum([len(p) for p in predictions])
+        n_elements: int = int(offsets[-1])
+
+        coords: Int[np.ndarray, "n_elements 2"] = np.full(
+            (n_elements, 2), NONCOORD_FILL, dtype=np.int16
+        )
+        token_ids: Int[np.ndarray, "n_elements"] = np.full(
+            n_elements, -1, dtype=np.int32
+        )
+        is_coord: Bool[np.ndarray, "n_elements"] = np.zeros(n_elements, dtype=np.bool_)
+
+        tokenizer_map: dict[str, int] = maze_tokenizer.tokenizer_map
+        idx: int = 0
+        for path in predictions:
+            for element in path:
+                if isinstance(element, str):
+                    token_ids[idx] = tokenizer_map.get(element, -1)
+                else:
+                    coords[idx] = element
+                    is_coord[idx] = True
+                    coord_tokens: list[str] = maze_tokenizer.coords_to_strings(
+                        [tuple(element)]
+                    )
+                    if len(coord_tokens) == 1:
+                        token_ids[idx] = tokenizer_map.get(coord_tokens[0], -1)
+                idx += 1
+
+        return cls(
+            maze_tokenizer=maze_tokenizer,
+            coords=coords,
+            token_ids=token_ids,
+            is_coord=is_coord,
+            offsets=offsets,
+        )
+
+    def to_predictions(self) -> list[list[str | CoordTup]]:
+        """inverse of `from_predictions`, in the format returned by `predict_maze_paths`"""
+        token_arr: list[str] = self.maze_tokenizer.token_arr
+        coords: list[list[int]] = self.coords.tolist()
+        return [
+            [
+                (
+                    tuple(coords[j])
+                    if self.is_coord[j]
+                    else (
+                        token_arr[self.token_ids[j]] if self.token_ids[j] >= 0 else ""
+                    )
+                )
+                for j in range(start, end)
+            ]
+            for start, end in zip(self.offsets[:-1], self.offsets[1:])
+        ]
+
+    def paths(self) -> list[CoordArray]:
+        """coordinate-only path of each rollout, i.e. what `PathEvals` functions take as `prediction`"""
+        if self.n_rollouts == 0:
+            return []
+        coord_offsets: Int[np.ndarray, "n_rollouts_plus_1"] = np.concatenate(
+            [[0], np.cumsum(self.is_coord)]
+        )[self.offsets]
+        return np.split(self.coords[self.is_coord], coord_offsets[1:-1])
+
+    def count_noncoord(self) -> Int[np.ndarray, "n_rollouts"]:
+        """number of non-coordinate tokens in each rollout"""
+        noncoord_cumsum: Int[np.ndarray, "n_elements_plus_1"] = np.concatenate(
+            [[0], np.cumsum(~self.is_coord)]
+        )
+        return np.diff(noncoord_cumsum[self.offsets])
+
+    def final_token_is(self, token: str) -> Bool[np.ndarray, "n_rollouts"]:
+        """whether the last element of each rollout is the non-coord token `token`. empty rollouts give `False`"""
+        token_id: int = self.maze_tokenizer.tokenizer_map[token]
+        nonempty: Bool[np.ndarray, "n_rollouts"] = self.lengths > 0
+        last_idx: Int[np.ndarray, "n_rollouts"] = np.maximum(self.offsets[1:] - 1, 0)
+        if len(self.token_ids) == 0:
+            return nonempty
+        return (
+            nonempty & ~self.is_coord[last_idx] & (self.token_ids[last_idx] == token_id)
+        )
+
+    def save(self, path: str | Path) -> Path:
+        """save as either `.npz` (numpy arrays only) or `.zanj`, depending on the suffix of `path`"""
+        path = Path(path)
+        if path.suffix == ".npz":
+            np.savez(
+                path,
+                coords=self.coords,
+                token_ids=self.token_ids,
+                is_coord=self.is_coord,
+                offsets=self.offsets,
+                maze_tokenizer=np.array(json.dumps(self.maze_tokenizer.serialize())),
+            )
+        elif path.suffix == ".zanj":
+            ZANJ().save(self, path)
+        else:
+            raise ValueError(
+                f"unknown file extension for rollouts, expected .npz or .zanj: {path.as_posix()}"
+            )
+        return path
+
+    @classmethod
+    def read(cls, path: str | Path) -> "Rollouts":
+        path = Path(path)
+        if path.suffix == ".npz":
+            with np.load(path) as data:
+                return cls(
+                    maze_tokenizer=MazeTokenizer.load(
+                        json.loads(str(data["maze_tokenizer"]))
+                    ),
+                    coords=data["coords"],
+                    token_ids=data["token_ids"],
+                    is_coord=data["is_coord"],
+                    offsets=data["offsets"],
+                )
+        elif path.suffix == ".zanj":
+            loaded = ZANJ().read(path)
+            return loaded if isinstance(loaded, cls) else cls.load(loaded)
+        else:
+            raise ValueError(
+                f"unknown file extension for rollouts, expected .npz or .zanj: {path.as_posix()}"
+            )
@@ -0,0 +1,355 @@
+"""capture only selected slices of activations, instead of everything `run_with_cache` stores
+
+most of our analyses only read a few hooks, often only at the last position. an
+`ActivationSpec` names a hook, and optionally a slice of positions and a subset of heads.
+`capture_activations` runs the model in chunks, stores just those slices (detached, on cpu)
+in a `CapturedActivations`, which can be converted back into an `ActivationCache` for the
+functions that expect one (direct logit attribution, logit lens, logit diff).
+`capture_activations_shared_prefix` does the same for several tasks on the same mazes,
+with one forward pass per maze.
+
+positions are counted in the left-padded sequences the model is run on, so only
+negative (end-relative) position slices pick out the same token for prompts of different lengths.
+"""
+
+import typing
+
+import torch
+from jaxtyping import Float
+from muutils.json_serialize import SerializableDataclass, serializable_dataclass
+from muutils.mlutils import chunks
+from transformer_lens import ActivationCache
+
+from maze_transformer.training.config import ZanjHookedTransformer
+from maze_transformer.utils.padding import (
+    concat_left_padded,
+    length_sorted_order,
+    slice_prompt_positions,
+)
+
+# hooks whose activations have a head dimension, and the index of that dimension
+_HEAD_DIMS: dict[str, int] = {
+    "hook_q": 2,
+    "hook_k": 2,
+    "hook_v": 2,
+    "hook_z": 2,
+    "hook_result": 2,
+    "hook_pattern": 1,
+    "hook_attn_scores": 1,
+}
+
+
+def activation_pos_dims(hook_name: str) -> tuple[int, ...]:
+    """position dimensions of an activation: attention patterns/scores have query and key positions"""
+    if hook_name.endswith(("hook_pattern", "hook_attn_scores")):
+        return (2, 3)
+    return (1,)
+
+
+def activation_pad_value(hook_name: str) -> float:
+    """attention scores are padded with `-inf`, as the model does for masked positions"""
+    return float("-inf") if hook_name.endswith("hook_attn_scores") else 0.0
+
+
+class ActivationSpec(typing.NamedTuple):
+    """which part of a hook's activation to keep
+
+    - `pos_slice` selects (query) positions: `None` for all, an int for a single position
+      (the dimension is kept), or a slice
+    - `heads` selects a subset of heads, for hooks with a head dimension
+    """
+
+    hook_name: str
+    pos_slice: int | slice | None = None
+    heads: list[int] | None = None
+
+    def apply(
+        self, activation: Float[torch.Tensor, "batch ..."]
+    ) -> Float[torch.Tensor, "batch ..."]:
+        """slice the activation of `hook_name`, keeping all dimensions"""
+        pos_slice: slice
+        if self.pos_slice is None:
+            pos_slice = slice(None)
+        elif isinstance(self.pos_slice, int):
+            pos_slice = slice(
+                self.pos_slice, (self.pos_slice + 1) if self.pos_slice != -1 else None
+            )
+        else:
+            pos_slice = self.pos_slice
+
+        idx: list[slice] = [slice(None)] * activation.ndim
+        idx[activation_pos_dims(self.hook_name)[0]] = pos_slice
+        activation = activation[tuple(idx)]
+
+        if self.heads is not None:
+            head_dim: int | None = _HEAD_DIMS.get(self.hook_name.split(".")[-1])
+            if head_dim is None:
+                raise ValueError(
+                    f"heads were given for hook '{self.hook_name}', which has no head dimension"
+                )
+            activation = activation.index_select(
+                head_dim, torch.tensor(self.heads, device=activation.device)
+            )
+
+        return activation
+
+
+def logit_attribution_specs(
+    n_layers: int,
+    do_neurons: bool = False,
+    pos_slice: int | slice | None = -1,
+) -> list[ActivationSpec]:
+    """specs for everything read by `ActivationCache.stack_head_results`, `accumulated_resid`,
+    `decompose_resid`, `apply_ln_to_stack` and optionally `stack_neuron_results`
+
+    i.e. what direct logit attribution, the logit lens, and logit diffs need
+    """
+    hook_names: list[str] = ["hook_embed", "hook_pos_embed"]
+    for layer in range(n_layers):
+        hook_names.extend(
+            [
+                f"blocks.{layer}.hook_resid_pre",
+                f"blocks.{layer}.hook_resid_mid",
+                f"blocks.{layer}.hook_attn_out",
+                f"blocks.{layer}.hook_mlp_out",
+                f"blocks.{layer}.attn.hook_z",
+            ]
+        )
+        if do_neurons:
+            hook_names.append(f"blocks.{layer}.mlp.hook_post")
+    hook_names.extend([f"blocks.{n_layers - 1}.hook_resid_post", "ln_final.hook_scale"])
+
+    return [ActivationSpec(hook_name=name, pos_slice=pos_slice) for name in hook_names]
+
+
+@serializable_dataclass(kw_only=True)
+class CapturedActivations(SerializableDataclass):
+    """activation slices captured according to `specs`, along with the last token logits
+
+    indexed like an `ActivationCache`, by hook name
+    """
+
+    specs: list[ActivationSpec]
+    activations: dict[str, torch.Tensor]
+    last_tok_logits: Float[torch.Tensor, "samples d_vocab"]
+
+    def __getitem__(self, hook_name: str) -> torch.Tensor:
+        return self.activations[hook_name]
+
+    def __contains__(self, hook_name: str) -> bool:
+        return hook_name in self.activations
+
+    def keys(self) -> typing.KeysView[str]:
+        return self.activations.keys()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(x.numel() * x.element_size() for x in self.activations.values())
+
+    def as_activation_cache(
+        self,
+        model: ZanjHookedTransformer,
+        device: torch.device | str | None = None,
+    ) -> ActivationCache:
+        """wrap in an `ActivationCache`, moving the activations to `device` (by default, that of the model)
+
+        since single positions are captured with their dimension kept, methods of
+        `ActivationCache` called with `pos_slice=-1` give the same result as on a full
+        cache. methods which combine all heads only work if all heads were captured.
+        """
+        if device is None:
+            device = model.cfg.device
+        return ActivationCache(
+            {k: v.to(device) for k, v in self.activations.items()},
+            model,
+        )
+
+
+def iter_activation_chunks(
+    model: ZanjHookedTransformer,
+    prompts: list[list[str]],
+    specs: list[ActivationSpec],
+    batch_size: int | None = 64,
+) -> typing.Iterator[
+    tuple[list[int], dict[str, torch.Tensor], Float[torch.Tensor, "batch d_vocab"]]
+]:
+    """run the model on chunks of `prompts`, yielding the captured activations for each chunk
+
+    prompts are sorted by length to minimize padding, and each item is
+    `(indices of the prompts in the chunk, activations by hook name, last token logits)`.
+    activations are detached and on the cpu.
+    """
+    hook_names: list[str] = [spec.hook_name for spec in specs]
+    assert len(set(hook_names)) == len(
+        hook_names
+    ), f"hook names in specs must be unique, got {hook_names = }"
+
+    if batch_size is None:
+        batch_size = max(len(prompts), 1)
+
+    captured: dict[str, torch.Tensor] = dict()
+
+    def make_hook(spec: ActivationSpec) -> typing.Callable:
+        def hook_fn(activation: torch.Tensor, hook) -> None:
+            captured[spec.hook_name] = spec.apply(activation).detach().cpu()
+
+        return hook_fn
+
+    fwd_hooks: list[tuple[str, typing.Callable]] = [
+        (spec.hook_name, make_hook(spec)) for spec in specs
+    ]
+
+    order, _ = length_sorted_order([len(p) for p in prompts])
+    with torch.no_grad():
+        for idxs_chunk in chunks(order, batch_size):
+            logits: Float[torch.Tensor, "batch pos d_vocab"] = model.run_with_hooks(
+                [" ".join(prompts[i]) for i in idxs_chunk],
+                fwd_hooks=fwd_hooks,
+            )
+            yield list(idxs_chunk), dict(captured), logits[:, -1, :].cpu()
+            captured.clear()
+
+
+def capture_activations(
+    model: ZanjHookedTransformer,
+    prompts: list[list[str]],
+    specs: list[ActivationSpec],
+    batch_size: int | None = 64,
+) -> CapturedActivations:
+    """run the model on `prompts` in chunks, keeping only the activations described by `specs`
+
+    results are in the original order of `prompts`, and chunks are left padded to the
+    longest prompt where more than one position is kept
+    """
+    _, inverse_order = length_sorted_order([len(p) for p in prompts])
+
+    activation_chunks: dict[str, list[torch.Tensor]] = {
+        spec.hook_name: list() for spec in specs
+    }
+    last_tok_logits_chunks: list[torch.Tensor] = list()
+    for _, chunk_activations, chunk_last_tok_logits in iter_activation_chunks(
+        model, prompts, specs, batch_size=batch_size
+    ):
+        for k, v in chunk_activations.items():
+            activation_chunks[k].append(v)
+        last_tok_logits_chunks.append(chunk_last_tok_logits)
+
+    return CapturedActivations(
+        specs=specs,
+        activations={
+            k: concat_left_padded(
+                v,
+                pos_dims=activation_pos_dims(k),
+                value=activation_pad_value(k),
+            )[inverse_order]
+            for k, v in activation_chunks.items()
+        },
+        last_tok_logits=torch.cat(last_tok_logits_chunks, dim=0)[inverse_order],
+    )
+
+
+def capture_activations_shared_prefix(
+    model: ZanjHookedTransformer,
+    task_prompts: dict[str, list[list[str]]],
+    specs: list[ActivationSpec],
+    batch_size: int | None = 64,
+) -> dict[str, CapturedActivations]:
+    """`capture_activations` for several tasks, running the model once per maze
+
+    for each maze, the prompts of all tasks must be prefixes of the longest of them (as for
+    `LOGIT_ATTRIB_TASKS` on the same dataset tokens). the model is run on that longest
+    prompt, and each task's activations are sliced at the positions of its own prompt,
+    which is equivalent since attention is causal. results are padded like those of
+    `capture_activations`.
+    """
+    task_names: list[str] = list(task_prompts.keys())
+    n_mazes: int = len(task_prompts[task_names[0]])
+    for task_name, prompts in task_prompts.items():
+        assert (
+            len(prompts) == n_mazes
+        ), f"task '{task_name}' has {len(prompts)} prompts, but {n_mazes = }"
+
+    # the longest prompt for each maze, which all others must be a prefix of
+    shared_prompts: list[list[str]] = [
+        max((task_prompts[t][i] for t in task_names), key=len) for i in range(n_mazes)
+    ]
+    for task_name, prompts in task_prompts.items():
+        for i, (prompt, shared) in enumerate(zip(prompts, shared_prompts)):
+            assert (
+                shared[: len(prompt)] == prompt
+            ), f"prompt {i} of task '{task_name}' is not a prefix of the longest prompt for that maze:\n{prompt = }\n{shared = }"
+
+    if batch_size is None:
+        batch_size = max(n_mazes, 1)
+
+    captured: dict[str, torch.Tensor] = dict()
+
+    def capture_hook(activation: torch.Tensor, hook) -> None:
+        captured[hook.name] = activation.detach()
+
+    fwd_hooks: list[tuple[str, typing.Callable]] = [
+        (spec.hook_name, capture_hook) for spec in specs
+    ]
+
+    activation_chunks: dict[str, dict[str, list[torch.Tensor]]] = {
+        task_name: {spec.hook_name: list() for spec in specs}
+        for task_name in task_names
+    }
+    last_tok_logits_chunks: dict[str, list[torch.Tensor]] = {
+        task_name: list() for task_name in task_names
+    }
+
+    order, inverse_order = length_sorted_order([len(p) for p in shared_prompts])
+    with torch.no_grad():
+        for idxs_chunk in chunks(order, batch_size):
+            logits: Float[torch.Tensor, "batch pos d_vocab"] = model.run_with_hooks(
+                [" ".join(shared_prompts[i]) for i in idxs_chunk],
+                fwd_hooks=fwd_hooks,
+            )
+            seq_len: int = logits.shape[1]
+
+            for task_name, prompts in task_prompts.items():
+                # sequences are left padded, so count the position of the last prompt token from the end
+                prompt_end_idxs: list[int] = [
+                    seq_len - 1 - (len(shared_prompts[i]) - len(prompts[i]))
+                    for i in idxs_chunk
+                ]
+                # the model prepends a BOS token to each prompt
+                prompt_lengths: list[int] = [len(prompts[i]) + 1 for i in idxs_chunk]
+
+                for spec in specs:
+                    activation_chunks[task_name][spec.hook_name].append(
+                        spec.apply(
+                            slice_prompt_positions(
+                                captured[spec.hook_name],
+                                prompt_end_idxs,
+                                prompt_lengths,
+                                pos_dims=activation_pos_dims(spec.hook_name),
+                                value=activation_pad_value(spec.hook_name),
+                            )
+                        ).cpu()
+                    )
+                last_tok_logits_chunks[task_name].append(
+                    logits[torch.arange(len(idxs_chunk)), prompt_end_idxs].cpu()
+                )
+
+            captured.clear()
+            del logits
+
+    return {
+        task_name: CapturedActivations(
+            specs=specs,
+            activations={
+                k: concat_left_padded(
+                    v,
+                    pos_dims=activation_pos_dims(k),
+                    value=activation_pad_value(k),
+                )[inverse_order]
+                for k, v in activation_chunks[task_name].items()
+            },
+            last_tok_logits=torch.cat(last_tok_logits_chunks[task_name], dim=0)[
+                inverse_order
+            ],
+        )
+        for task_name in task_names
+    }
@@ -0,0 +1,259 @@
+"""disk-backed store of captured activations, one memory-mapped `.npy` file per hook
+
+`ActivationStore.capture` runs the model in chunks (see `iter_activation_chunks`) and
+writes each chunk straight into preallocated memmaps, so neither the capture nor later
+analyses need to hold all activations in memory. the store directory contains
+
+- `index.json`: the capture specs, the shape and dtype of each array, and for each row
+  the id of its maze and the length of its prompt
+- `<hook_name>.npy`: activations of that hook, one row per prompt
+- `last_tok_logits.npy`: logits at the last position, one row per prompt
+
+as in the model's forward pass, rows are left padded to the longest prompt, so the
+last prompt token is always at the last position. `ActivationStore.position_index`
+maps a token index of a prompt to its position along the position dimension.
+"""
+
+import json
+import typing
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from muutils.json_serialize import json_serialize
+
+from maze_transformer.mechinterp.activation_capture import (
+    _HEAD_DIMS,
+    ActivationSpec,
+    CapturedActivations,
+    activation_pad_value,
+    activation_pos_dims,
+    iter_activation_chunks,
+)
+from maze_transformer.training.config import ZanjHookedTransformer
+
+INDEX_FILENAME: str = "index.json"
+LAST_TOK_LOGITS_NAME: str = "last_tok_logits"
+
+
+def _pos_slice_from_json(pos_slice: int | list | None) -> int | slice | None:
+    if isinstance(pos_slice, list):
+        return slice(*pos_slice)
+    return pos_slice
+
+
+def _pos_slice_to_json(pos_slice: int | slice | None) -> int | list | None:
+    if isinstance(pos_slice, slice):
+        return [pos_slice.start, pos_slice.stop, pos_slice.step]
+    return pos_slice
+
+
+def _query_length(spec: ActivationSpec, seq_len: int) -> int:
+    """number of (query) positions kept by `spec` in a sequence of length `seq_len`"""
+    if isinstance(spec.pos_slice, int):
+        return 1
+    return len(range(seq_len)[spec.pos_slice or slice(None)])
+
+
+def _left_pad_to(
+    activation: torch.Tensor,
+    lengths: dict[int, int],
+    value: float = 0.0,
+) -> torch.Tensor:
+    """left pad each dim in `lengths` of `activation` to the given length"""
+    pad: list[int] = [0] * (2 * activation.ndim)
+    for dim, length in lengths.items():
+        pad[2 * (activation.ndim - 1 - dim)] = length - activation.shape[dim]
+    return F.pad(activation, pad, value=value)
+
+
+class ActivationStore:
+    """read access to a directory written by `ActivationStore.capture`
+
+    arrays are opened as read-only memmaps, so indexing them only reads the requested rows
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path: Path = Path(path)
+        with open(self.path / INDEX_FILENAME, "r") as f:
+            self.index: dict = json.load(f)
+
+        self.specs: list[ActivationSpec] = [
+            ActivationSpec(
+                hook_name=spec["hook_name"],
+                pos_slice=_pos_slice_from_json(spec["pos_slice"]),
+                heads=spec["heads"],
+            )
+            for spec in self.index["specs"]
+        ]
+        self.maze_ids: list[int] = self.index["maze_ids"]
+        self.prompt_lengths: list[int] = self.index["prompt_lengths"]
+        self.seq_len: int = self.index["seq_len"]
+        self._maze_id_to_row: dict[int, int] = {
+            maze_id: row for row, maze_id in enumerate(self.maze_ids)
+        }
+        self._arrays: dict[str, np.ndarray] = dict()
+
+    def __len__(self) -> int:
+        return len(self.maze_ids)
+
+    def keys(self) -> list[str]:
+        return [spec.hook_name for spec in self.specs]
+
+    def __contains__(self, hook_name: str) -> bool:
+        return hook_name in self.keys()
+
+    def get_array(self, name: str) -> np.ndarray:
+        """memmap of the activations of hook `name` (or of `last_tok_logits`), opened lazily"""
+        if name not in self._arrays:
+            if name != LAST_TOK_LOGITS_NAME and name not in self:
+                raise KeyError(
+                    f"hook '{name}' not in store at {self.path.as_posix()}, has {self.keys()}"
+                )
+            self._arrays[name] = np.load(self.path / f"{name}.npy", mmap_mode="r")
+        return self._arrays[name]
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.get_array(name)
+
+    @property
+    def last_tok_logits(self) -> np.ndarray:
+        return self.get_array(LAST_TOK_LOGITS_NAME)
+
+    def head_activations(self, hook_name: str, head: int) -> np.ndarray:
+        """memmap view of a single head's activations, e.g. attention scores in the format
+        `plot_attention_final_token` takes as values of `important_heads_scores`
+
+        `head` indexes the heads stored for the hook, which are a subset if the spec selected `heads`
+        """
+        head_dim: int | None = _HEAD_DIMS.get(hook_name.split(".")[-1])
+        if head_dim is None:
+            raise ValueError(f"hook '{hook_name}' has no head dimension")
+        # basic indexing gives a view, so nothing is read until the result is used
+        return self.get_array(hook_name)[(slice(None),) * head_dim + (head,)]
+
+    def rows_for_mazes(self, maze_ids: typing.Iterable[int]) -> list[int]:
+        return [self._maze_id_to_row[maze_id] for maze_id in maze_ids]
+
+    def position_index(self, row: int, token_idx: int) -> int:
+        """position of token `token_idx` of the prompt in `row`, for hooks which keep all positions
+
+        accounts for left padding and the BOS token prepended by the model
+        """
+        # BOS and the prompt tokens are right aligned
+        return self.seq_len - self.prompt_lengths[row] + 1 + token_idx
+
+    def to_captured(
+        self,
+        rows: typing.Sequence[int] | slice | None = None,
+    ) -> CapturedActivations:
+        """load some rows into memory, e.g. to pass to `compute_direct_logit_attribution`"""
+        if rows is None:
+            rows = slice(None)
+        return CapturedActivations(
+            specs=self.specs,
+            activations={
+                name: torch.from_numpy(np.array(self.get_array(name)[rows]))
+                for name in self.keys()
+            },
+            last_tok_logits=torch.from_numpy(np.array(self.last_tok_logits[rows])),
+        )
+
+    @classmethod
+    def capture(
+        cls,
+        model: ZanjHookedTransformer,
+        prompts: list[list[str]],
+        specs: list[ActivationSpec],
+        path: str | Path,
+        maze_ids: list[int] | None = None,
+        batch_size: int = 64,
+        dtype: np.dtype = np.float32,
+        verbose: bool = False,
+    ) -> "ActivationStore":
+        """run the model on `prompts` in chunks, writing the activations in `specs` to `path`
+
+        `maze_ids` defaults to the index of each prompt
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+
+        n_prompts: int = len(prompts)
+        if maze_ids is None:
+            maze_ids = list(range(n_prompts))
+        assert len(maze_ids) == n_prompts, f"{len(maze_ids) = } != {n_prompts = }"
+
+        # the model prepends a BOS token
+        prompt_lengths: list[int] = [len(p) + 1 for p in prompts]
+        seq_len: int = max(prompt_lengths)
+
+        arrays: dict[str, np.ndarray] = dict()
+        pos_lengths: dict[str, dict[int, int]] = dict()
+        for spec in specs:
+            # query positions are sliced by the spec, key positions are all kept
+            pos_dims: tuple[int, ...] = activation_pos_dims(spec.hook_name)
+            pos_lengths[spec.hook_name] = {
+                pos_dims[0]: _query_length(spec, seq_len),
+                **{dim: seq_len for dim in pos_dims[1:]},
+            }
+
+        n_written: int = 0
+        for idxs_chunk, activations, last_tok_logits in iter_activation_chunks(
+            model, prompts, specs, batch_size=batch_size
+        ):
+            for name, activation in activations.items():
+                activation = _left_pad_to(
+                    activation,
+                    pos_lengths[name],
+                    value=activation_pad_value(name),
+                )
+                if name not in arrays:
+                    arrays[name] = np.lib.format.open_memmap(
+                        path / f"{name}.npy",
+                        mode="w+",
+                        dtype=dtype,
+                        shape=(n_prompts, *activation.shape[1:]),
+                    )
+                arrays[name][idxs_chunk] = activation.numpy().astype(dtype)
+
+            if LAST_TOK_LOGITS_NAME not in arrays:
+                arrays[LAST_TOK_LOGITS_NAME] = np.lib.format.open_memmap(
+                    path / f"{LAST_TOK_LOGITS_NAME}.npy",
+                    mode="w+",
+                    dtype=dtype,
+                    shape=(n_prompts, last_tok_logits.shape[-1]),
+                )
+            arrays[LAST_TOK_LOGITS_NAME][idxs_chunk] = last_tok_logits.numpy().astype(
+                dtype
+            )
+
+            n_written += len(idxs_chunk)
+            if verbose:
+                print(f"captured activations for {n_written} / {n_prompts} prompts")
+
+        for arr in arrays.values():
+            arr.flush()
+
+        index: dict = dict(
+            specs=[
+                dict(
+                    hook_name=spec.hook_name,
+                    pos_slice=_pos_slice_to_json(spec.pos_slice),
+                    heads=spec.heads,
+                )
+                for spec in specs
+            ],
+            arrays={
+                name: dict(shape=list(arr.shape), dtype=str(arr.dtype))
+                for name, arr in arrays.items()
+            },
+            maze_ids=maze_ids,
+            prompt_lengths=prompt_lengths,
+            seq_len=seq_len,
+            model_name=model.zanj_model_config.name,
+        )
+        with open(path / INDEX_FILENAME, "w") as f:
+            json.dump(json_serialize(index), f, indent="\t")
+
+        return cls(path)
@@ -12,45 +12,61 @@ import torch
 from jaxtyping import Float, Int
 
 # maze-datset stuff
-from maze_dataset import MazeDataset, MazeDatasetConfig
+from maze_dataset import MazeDataset, MazeDatasetConfig, SolvedMaze
 from maze_dataset.tokenization import MazeTokenizer
 
 # TransformerLens imports
 from transformer_lens import ActivationCache
 
 # mechinterp stuff
+from maze_transformer.evaluation.model_registry import ModelRegistry
+from maze_transformer.mechinterp.activation_capture import (
+    ActivationSpec,
+    CapturedActivations,
+    capture_activations,
+    capture_activations_shared_prefix,
+    iter_activation_chunks,
+    logit_attribution_specs,
+)
 from maze_transformer.mechinterp.logit_attrib_task import (
     LOGIT_ATTRIB_TASKS,
     DLAProtocolFixed,
+    TaskSetup,
 )
 from maze_transformer.mechinterp.logit_diff import (
     logit_diff_residual_stream,
     logits_diff_multi,
     residual_stack_to_logit_diff,
 )
-from maze_transformer.mechinterp.logit_lens import plot_logit_lens
+from maze_transformer.mechinterp.logit_lens import compute_logit_lens, plot_logit_lens
 from maze_transformer.mechinterp.plot_attention import plot_attention_final_token
 from maze_transformer.mechinterp.plot_logits import plot_logits
 
 # model stuff
 from maze_transformer.training.config import ZanjHookedTransformer
+from maze_transformer.utils.figure_jobs import FigureJob, render_figure_jobs
 
 
 def compute_direct_logit_attribution(
     model: ZanjHookedTransformer,
-    cache: ActivationCache,
+    cache: ActivationCache | CapturedActivations,
     answer_tokens: Int[torch.Tensor, "n_mazes"],
     do_neurons: bool = False,
+    verbose: bool = True,
 ) -> dict[Literal["heads", "neurons"], Float[np.ndarray, "layer index"]]:
     n_layers: int = model.zanj_model_config.model_cfg.n_layers
     n_heads: int = model.zanj_model_config.model_cfg.n_heads
     d_model: int = model.zanj_model_config.model_cfg.d_model
     mlp_dim: int = 4 * d_model
 
-    print(f"{answer_tokens.shape = }")
-    print(f"{n_layers = }, {n_heads = }, {d_model = }")
-    print(f"{n_layers * n_heads = }")
-    print(f"{n_layers * mlp_dim = }")
+    if isinstance(cache, CapturedActivations):
+        cache = cache.as_activation_cache(model)
+
+    if verbose:
+        print(f"{answer_tokens.shape = }")
+        print(f"{n_layers = }, {n_heads = }, {d_model = }")
+        print(f"{n_layers * n_heads = }")
+        print(f"{n_layers * mlp_dim = }")
 
     # logit diff
     avg_diff, diff_direction = logit_diff_residual_stream(
@@ -72,8 +88,9 @@ def compute_direct_logit_attribution(
         logit_diff_directions=diff_direction,
     )
 
-    print(f"{per_head_residual.shape = }")
-    print(f"{per_head_logit_diffs.shape = }")
+    if verbose:
+        print(f"{per_head_residual.shape = }")
+        print(f"{per_head_logit_diffs.shape = }")
 
     per_head_logit_diffs = einops.rearrange(
         per_head_logit_diffs,
@@ -82,7 +99,8 @@ def compute_direct_logit_attribution(
         head_index=n_heads,
     )
 
-    print(f"{per_head_logit_diffs.shape = }")
+    if verbose:
+        print(f"{per_head_logit_diffs.shape = }")
 
     # per neuron
     if do_neurons:
@@ -98,8 +116,9 @@ def compute_direct_logit_attribution(
             logit_diff_directions=diff_direction,
         )
 
-        print(f"{per_neuron_residual.shape = }")
-        print(f"{per_neuron_logit_diffs.shape = }")
+        if verbose:
+            print(f"{per_neuron_residual.shape = }")
+            print(f"{per_neuron_logit_diffs.shape = }")
 
         per_neuron_logit_diffs = einops.rearrange(
             per_neuron_logit_diffs,
@@ -108,7 +127,8 @@ def compute_direct_logit_attribution(
             neuron_index=mlp_dim,
         )
 
-        print(f"{per_neuron_logit_diffs.shape = }")
+        if verbose:
+            print(f"{per_neuron_logit_diffs.shape = }")
 
     # return
     if do_neurons:
@@ -120,30 +140,83 @@ def compute_direct_logit_attribution(
         return dict(heads=per_head_logit_diffs.to("cpu").numpy())
 
 
-def plot_direct_logit_attribution(
+def compute_direct_logit_attribution_chunked(
     model: ZanjHookedTransformer,
-    cache: ActivationCache,
+    prompts: list[list[str]],
     answer_tokens: Int[torch.Tensor, "n_mazes"],
     do_neurons: bool = False,
+    batch_size: int = 64,
+    verbose: bool = False,
+) -> dict[Literal["heads", "neurons"], Float[np.ndarray, "layer index"]]:
+    """`compute_direct_logit_attribution` over many mazes, running the model in chunks
+
+    the attribution to each head/neuron is a mean over mazes, so we accumulate the
+    per-chunk results weighted by the number of mazes in each chunk. only the
+    activations at the last position are kept, one chunk at a time, so memory does
+    not grow with the number of mazes.
+    """
+    n_layers: int = model.zanj_model_config.model_cfg.n_layers
+    capture_specs: list[ActivationSpec] = logit_attribution_specs(
+        n_layers, do_neurons=do_neurons, pos_slice=-1
+    )
+
+    dla_sums: dict[str, Float[np.ndarray, "layer index"]] = dict()
+    n_processed: int = 0
+    for idxs_chunk, activations, _ in iter_activation_chunks(
+        model, prompts, capture_specs, batch_size=batch_size
+    ):
+        with torch.no_grad():
+            chunk_dla: dict[str, Float[np.ndarray, "layer index"]] = (
+                compute_direct_logit_attribution(
+                    model=model,
+                    cache=ActivationCache(
+                        {k: v.to(model.cfg.device) for k, v in activations.items()},
+                        model,
+                    ),
+                    answer_tokens=answer_tokens[idxs_chunk],
+                    do_neurons=do_neurons,
+                    verbose=False,
+                )
+            )
+
+        for k, v in chunk_dla.items():
+            dla_sums[k] = dla_sums.get(k, 0.0) + v.astype(np.float64) * len(idxs_chunk)
+        n_processed += len(idxs_chunk)
+
+        if verbose:
+            print(f"direct logit attribution: {n_processed} / {len(prompts)} mazes")
+
+    return {k: (v / n_processed).astype(np.float32) for k, v in dla_sums.items()}
+
+
+def plot_direct_logit_attribution(
+    model: ZanjHookedTransformer | None,
+    cache: ActivationCache | CapturedActivations | None,
+    answer_tokens: Int[torch.Tensor, "n_mazes"] | None,
+    do_neurons: bool = False,
     show: bool = True,
     layer_index_normalization: (
         typing.Callable[[float, int], float] | None
     ) = lambda contrib, layer_idx: contrib,
+    dla_data: dict[str, Float[np.ndarray, "layer head/neuron"]] | None = None,
 ) -> tuple[plt.Figure, plt.Axes, dict[str, Float[np.ndarray, "layer head/neuron"]]]:
     """compute, process, and plot direct logit attribution
 
     Layer index normalization allows us to process the contribution according to the layer index.
     by default, its the identity map for contribs:
     `layer_index_normalization: typing.Callable[[float, int], float]|None = lambda contrib, layer_idx: contrib`
+
+    if `dla_data` is given (for example from `compute_direct_logit_attribution_chunked`),
+    it is plotted directly and `cache` and `answer_tokens` are ignored. `model` is then
+    only used for the title, and may be `None`
     """
-    dla_data: dict[str, Float[np.ndarray, "layer head/neuron"]] = (
-        compute_direct_logit_attribution(
+    if dla_data is None:
+        dla_data = compute_direct_logit_attribution(
             model=model,
             cache=cache,
             answer_tokens=answer_tokens,
             do_neurons=do_neurons,
         )
-    )
     if layer_index_normalization is not None:
         dla_data = {
             k: np.array(
@@ -169,9 +242,8 @@ def plot_direct_logit_attribution(
     ax_heads.set_xlabel("Head")
     ax_heads.set_ylabel("Layer")
     plt.colorbar(ax_heads.get_images()[0], ax=ax_heads)
-    ax_heads.set_title(
-        f"Logit Difference from each head\n{model.zanj_model_config.name}"
-    )
+    model_name: str = model.zanj_model_config.name if model is not None else ""
+    ax_heads.set_title(f"Logit Difference from each head\n{model_name}")
 
     # neurons
     if do_neurons:
@@ -186,9 +258,7 @@ def plot_direct_logit_attribution(
         ax_neurons.set_xlabel("Neuron")
         ax_neurons.set_ylabel("Layer")
         plt.colorbar(ax_neurons.get_images()[0], ax=ax_neurons)
-        ax_neurons.set_title(
-            f"Logit Difference from each neuron\n{model.zanj_model_config.name}"
-        )
+        ax_neurons.set_title(f"Logit Difference from each neuron\n{model_name}")
 
     if show:
         plt.show()
@@ -211,139 +281,100 @@ def _output_codeblock(
     return f"```{lang}\n{newdata}\n```"
 
 
-def create_report(
-    model: ZanjHookedTransformer | str | Path,
-    dataset_cfg_source: MazeDatasetConfig | None,
-    logit_attribution_task_name: str,
-    n_examples: int = 100,
-    out_path: str | Path | None = None,
-    device: torch.device = torch.device("cuda" if torch.cuda.is_available() else "cpu"),
-) -> Path:
-    # setup
-    # ======================================================================
-    torch.set_grad_enabled(False)
-
-    # model and tokenizer
-    if not isinstance(model, ZanjHookedTransformer):
-        model = ZanjHookedTransformer.read(model)
-    tokenizer: MazeTokenizer = model.zanj_model_config.maze_tokenizer
-
-    # dataset cfg
-    if dataset_cfg_source is None:
-        dataset_cfg_source = model.zanj_model_config.dataset_cfg
-
-    # output
-    if out_path is None:
-        out_path = Path(
-            f"data/dla_reports/{model.zanj_model_config.name}-{dataset_cfg_source.name}-{logit_attribution_task_name}-n{n_examples}/"
-        )
-
-    out_path.mkdir(parents=True, exist_ok=True)
-
-    fig_path: Path = out_path / "figures"
-    fig_path.mkdir(parents=True, exist_ok=True)
-    fig_path_md: Path = Path(f"figures")
+class ReportData(typing.NamedTuple):
+    """everything `write_report` needs, computed by `compute_report_data`
 
-    output_md_path: Path = out_path / "report.md"
-    output_md = output_md_path.open("w")
+    holds only arrays and plain data (no model or activation cache), so figures can be
+    rendered from it in other processes
+    """
 
-    # write header
-    output_md.write(
-        f"""---
-title: Direct Logit Attribution Report
-model_name: {model.zanj_model_config.name}
-dataset_cfg_name: {dataset_cfg_source.name}
-logit_attribution_task_name: {logit_attribution_task_name}
-n_examples: {n_examples}
-time: {datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
----
+    model_name: str
+    model_summary: dict
+    dataset_cfg_name: str
+    dataset_cfg_summary: dict
+    logit_attribution_task_name: str
+    tokenizer: MazeTokenizer
+    n_mazes: int
+    first_maze_pixels: np.ndarray
+    prompts: list[list[str]]
+    targets: list[str]
+    target_ids: Int[torch.Tensor, "n_mazes"]
+    cache_shapes: dict[str, list[int]]
+    cache_nbytes: int
+    last_tok_logits: Float[torch.Tensor, "n_mazes d_vocab"]
+    prediction_correct: Float[torch.Tensor, "n_mazes"]
+    logit_diff_df: pd.DataFrame
+    logit_lens_data: tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+    dla_data: dict[str, Float[np.ndarray, "layer head"]]
+    # (layer, head, value) of the heads with the largest absolute attribution
+    important_heads: list[tuple[int, int, float]]
+    # attention scores of the last position for each important head, only for the mazes shown
+    important_heads_scores: dict[
+        str, tuple[float, Float[np.ndarray, "n_mazes_shown 1 n_tokens"]]
+    ]
+    mazes_shown: list[SolvedMaze]
 
-# Direct Logit Attribution Report
 
-## Model
-`{model.zanj_model_config.name}`
-{_output_codeblock(model.zanj_model_config.summary(), 'json')}
+def report_capture_specs(n_layers: int) -> list[ActivationSpec]:
+    """the activations the report reads: those at the last position needed by the
+    analyses, plus the attention scores of the last token for the head analysis"""
+    return logit_attribution_specs(n_layers, pos_slice=-1) + [
+        ActivationSpec(f"blocks.{i}.attn.hook_attn_scores", pos_slice=-1)
+        for i in range(n_layers)
+    ]
 
-## Dataset
-`{dataset_cfg_source.name}`
-{_output_codeblock(dataset_cfg_source.summary(), 'json')}
 
-"""
-    )
+def compute_report_data(
+    model: ZanjHookedTransformer,
+    dataset: MazeDataset,
+    logit_attribution_task_name: str,
+    dataset_tokens: list[list[str]] | None = None,
+    batch_size: int | None = 64,
+    device: torch.device | None = None,
+    top_heads: int = 5,
+    n_mazes_shown: int = 3,
+    task_setup: TaskSetup | None = None,
+    captured: CapturedActivations | None = None,
+) -> ReportData:
+    """run the model and compute everything in the report, without any plotting
+
+    pass `dataset_tokens` to reuse a tokenization of `dataset`, `task_setup` to reuse the
+    prompts and targets of the task, and `captured` (with `report_capture_specs`, for
+    the prompts of `task_setup`) to skip running the model
+    """
+    tokenizer: MazeTokenizer = model.zanj_model_config.maze_tokenizer
 
     # task
-    logit_attribution_task: DLAProtocolFixed = LOGIT_ATTRIB_TASKS[
-        logit_attribution_task_name
-    ]
-
-    # dataset
-    dataset: MazeDataset = MazeDataset.from_config(dataset_cfg_source)
-    dataset_tokens: list[list[str]] = dataset.as_tokens(
-        tokenizer, join_tokens_individual_maze=False
-    )
-
+    if task_setup is None:
+        assert (
+            captured is None
+        ), "captured activations need the task setup they belong to"
+        if dataset_tokens is None:
+            dataset_tokens = dataset.as_tokens(
+                tokenizer, join_tokens_individual_maze=False
+            )
+        logit_attribution_task: DLAProtocolFixed = LOGIT_ATTRIB_TASKS[
+            logit_attribution_task_name
+        ]
+        task_setup = logit_attribution_task(dataset_tokens)
     dataset_prompts: list[list[str]]
     dataset_targets: list[str]
-    dataset_prompts, dataset_targets = logit_attribution_task(dataset_tokens)
-    dataset_prompts_joined: list[str] = [" ".join(prompt) for prompt in dataset_prompts]
-    dataset_target_ids: Float[torch.Tensor, "n_mazes"] = torch.tensor(
+    dataset_prompts, dataset_targets = task_setup
+    dataset_target_ids: Int[torch.Tensor, "n_mazes"] = torch.tensor(
         tokenizer.encode(dataset_targets), dtype=torch.long
     )
 
-    # print some info about dataset
-
-    n_mazes: int = len(dataset)
-    d_vocab: int = tokenizer.vocab_size
-
-    output_md.write(
-        f"""
-
-number of mazes: {n_mazes}
-vocabulary size: {d_vocab}
-
-### First Maze
-
-full: {_output_codeblock(' '.join(dataset_prompts[0]))}
-prompt: {_output_codeblock('[...] ' + dataset_prompts_joined[0][-150:])}
-target: {_output_codeblock(dataset_targets[0])}
-target id: {_output_codeblock(str(dataset_target_ids[0]))}
-
-![First maze as raster image]({fig_path_md / 'first_maze.png'})
-
-"""
-    )
-
-    plt.imsave(fig_path / "first_maze.png", dataset[0].as_pixels())
-
     # run model
     # ======================================================================
-
-    logits: Float[torch.Tensor, "n_mazes seq_len d_vocab"]
-    cache: ActivationCache
-    logits, cache = model.run_with_cache(dataset_prompts_joined, device=device)
-
-    last_tok_logits: Float[torch.Tensor, "n_mazes d_vocab"] = logits[:, -1, :]
-
-    output_md.write(
-        f"""# Model Output
-
-```
-logits.shape: {logits.shape}
-cache_shapes: TODO
-last_tok_logits.shape: {last_tok_logits.shape}
-```
-"""
-    )
-
-    plot_logits(
-        last_tok_logits=last_tok_logits,
-        target_idxs=dataset_target_ids,
-        tokenizer=tokenizer,
-        n_bins=50,
-        show=False,
-    )
-    plt.savefig(fig_path / "last_tok_logits.png")
-    output_md.write(f"![last token logits]({fig_path_md / 'last_tok_logits.png'})\n")
+    if captured is None:
+        captured = capture_activations(
+            model=model,
+            prompts=dataset_prompts,
+            specs=report_capture_specs(model.zanj_model_config.model_cfg.n_layers),
+            batch_size=batch_size,
+        )
+    cache: ActivationCache = captured.as_activation_cache(model, device=device)
+    last_tok_logits: Float[torch.Tensor, "n_mazes d_vocab"] = captured.last_tok_logits
 
     predicted_tokens: list[str] = tokenizer.decode(
         last_tok_logits.argmax(dim=-1).tolist()
@@ -352,16 +383,6 @@ last_tok_logits.shape: {last_tok_logits.shape}
         [pred == target for pred, target in zip(predicted_tokens, dataset_targets)]
     )
 
-    output_md.write(
-        f"""
-```
-predicted_tokens.shape: {len(predicted_tokens)}
-prediction_correct.shape: {prediction_correct.shape}
-prediction_correct.mean(): {prediction_correct.float().mean().item()}
-```
-"""
-    )
-
     # logit diff
     logit_diff_df: pd.DataFrame = logits_diff_multi(
         model=model,
@@ -371,133 +392,588 @@ prediction_correct.mean(): {prediction_correct.float().mean().item()}
         noise_sigmas=np.logspace(0, 3, 100),
     )
 
-    output_md.write(
-        f"""
-# Logit Difference
-```
-logit_diff_df.shape: {logit_diff_df.shape}
-```
-
-```
-{logit_diff_df}
-```
-"""
-    )
-
-    # scatter separately for "all" vs "random"
-    fig, ax = plt.subplots()
-    for compare_to in ["all", "random"]:
-        df = logit_diff_df[logit_diff_df["compare_to"] == compare_to]
-        ax.scatter(
-            df["result_orig"],
-            df["result_res"],
-            label=f"comparing to {compare_to}",
-            marker="o",
-        )
-    ax.legend()
-    plt.xlabel("result_orig")
-    plt.ylabel("result_res")
-    plt.title("Scatter Plot between result_orig and result_res")
-    plt.savefig(fig_path / "logit_diff_scatter.png")
-    output_md.write(
-        f"![logit difference scatterplot comparison]({fig_path_md / 'logit_diff_scatter.png'})\n"
-    )
-
     # logit lens
-    logitlens_figax, logitlens_results = plot_logit_lens(
+    logit_lens_data: tuple[np.ndarray, ...] = compute_logit_lens(
         model=model,
         cache=cache,
         answer_tokens=dataset_target_ids,
-        show=False,
     )
-    logitlens_figax[0].savefig(fig_path / "logitlens.png")
-    output_md.write(f"![logit lens results]({fig_path_md / 'logitlens.png'})\n")
 
     # direct logit attribution
-    output_md.write(f"# Direct Logit Attribution")
-    dla_fig, dla_ax, dla_data = plot_direct_logit_attribution(
-        model=model,
-        cache=cache,
-        answer_tokens=dataset_target_ids,
-        show=False,
-    )
-    dla_ax.set_title(
-        f"Logit difference from each head\n{model.zanj_model_config.name}\n'{logit_attribution_task_name}' task"
+    dla_data: dict[str, Float[np.ndarray, "layer head"]] = (
+        compute_direct_logit_attribution(
+            model=model,
+            cache=cache,
+            answer_tokens=dataset_target_ids,
+            verbose=False,
+        )
     )
 
-    dla_fig.savefig(fig_path / "logit_attribution.png")
-    output_md.write(f"![logit attribution]({fig_path_md / 'logit_attribution.png'})\n")
-
     # head analysis
     # let's try to plot the values of the attention heads for the top and bottom n contributing heads
     # (layer, head, value)
-    top_heads: int = 5
     important_heads: list[tuple[int, int, float]] = sorted(
         [
-            (i, j, dla_data[i, j])
-            for i in range(dla_data.shape[0])
-            for j in range(dla_data.shape[1])
+            (i, j, dla_data["heads"][i, j])
+            for i in range(dla_data["heads"].shape[0])
+            for j in range(dla_data["heads"].shape[1])
         ],
         key=lambda x: abs(x[2]),
         reverse=True,
     )[:top_heads]
-    # print(f"{important_heads = }")
-    output_md.write(
-        f"""
-# Head Analysis
-top {top_heads} heads: `{important_heads}`
-"""
-    )
-
-    # plot the attention heads
     important_heads_scores = {
         f"layer_{i}.head_{j}": (
             c,
-            cache[f"blocks.{i}.attn.hook_attn_scores"][:, j, :, :].numpy(),
+            captured[f"blocks.{i}.attn.hook_attn_scores"][
+                :n_mazes_shown, j, :, :
+            ].numpy(),
         )
         for i, j, c in important_heads
     }
 
-    attn_final_tok_output: list[dict] = plot_attention_final_token(
-        important_heads_scores=important_heads_scores,
+    return ReportData(
+        model_name=model.zanj_model_config.name,
+        model_summary=model.zanj_model_config.summary(),
+        dataset_cfg_name=dataset.cfg.name,
+        dataset_cfg_summary=dataset.cfg.summary(),
+        logit_attribution_task_name=logit_attribution_task_name,
+        tokenizer=tokenizer,
+        n_mazes=len(dataset),
+        first_maze_pixels=dataset[0].as_pixels(),
         prompts=dataset_prompts,
         targets=dataset_targets,
-        mazes=dataset,
+        target_ids=dataset_target_ids,
+        cache_shapes={k: list(v.shape) for k, v in captured.activations.items()},
+        cache_nbytes=captured.nbytes,
+        last_tok_logits=last_tok_logits,
+        prediction_correct=prediction_correct,
+        logit_diff_df=logit_diff_df,
+        logit_lens_data=logit_lens_data,
+        dla_data=dla_data,
+        important_heads=important_heads,
+        important_heads_scores=important_heads_scores,
+        mazes_shown=[dataset[i] for i in range(min(n_mazes_shown, len(dataset)))],
+    )
+
+
+# figure jobs for `write_report`, which save to `path` and run in worker processes
+# ======================================================================
+
+
+def _render_first_maze(path: Path, pixels: np.ndarray) -> None:
+    plt.imsave(path, pixels)
+
+
+def _render_last_tok_logits(
+    path: Path,
+    last_tok_logits: Float[torch.Tensor, "n_mazes d_vocab"],
+    target_idxs: Int[torch.Tensor, "n_mazes"],
+    tokenizer: MazeTokenizer,
+) -> None:
+    fig, _ = plot_logits(
+        last_tok_logits=last_tok_logits,
+        target_idxs=target_idxs,
+        tokenizer=tokenizer,
+        n_bins=50,
+        show=False,
+    )
+    fig.savefig(path)
+
+
+def _render_logit_diff_scatter(path: Path, logit_diff_df: pd.DataFrame) -> None:
+    # scatter separately for "all" vs "random"
+    fig, ax = plt.subplots()
+    for compare_to in ["all", "random"]:
+        df = logit_diff_df[logit_diff_df["compare_to"] == compare_to]
+        ax.scatter(
+            df["result_orig"],
+            df["result_res"],
+            label=f"comparing to {compare_to}",
+            marker="o",
+        )
+    ax.legend()
+    ax.set_xlabel("result_orig")
+    ax.set_ylabel("result_res")
+    ax.set_title("Scatter Plot between result_orig and result_res")
+    fig.savefig(path)
+
+
+def _render_logit_lens(
+    path: Path,
+    logit_lens_data: tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+) -> None:
+    logitlens_figax, _ = plot_logit_lens(
+        model=None,
+        cache=None,
+        answer_tokens=None,
+        show=False,
+        logit_lens_data=logit_lens_data,
+    )
+    logitlens_figax[0].savefig(path)
+
+
+def _render_direct_logit_attribution(
+    path: Path,
+    dla_data: dict[str, Float[np.ndarray, "layer head"]],
+    title: str,
+) -> None:
+    dla_fig, dla_ax, _ = plot_direct_logit_attribution(
+        model=None,
+        cache=None,
+        answer_tokens=None,
+        show=False,
+        dla_data=dla_data,
+    )
+    dla_ax.set_title(title)
+    dla_fig.savefig(path)
+
+
+def _render_head_analysis(
+    path_scores: Path,
+    path_attn_maze: Path,
+    head_lbl: str,
+    head_scores: tuple[float, Float[np.ndarray, "n_mazes_shown 1 n_tokens"]],
+    prompts: list[list[str]],
+    targets: list[str],
+    mazes: list[SolvedMaze],
+    tokenizer: MazeTokenizer,
+) -> dict:
+    """returns the head info and the colored tokens text, for the report"""
+    attn_final_tok: dict = plot_attention_final_token(
+        important_heads_scores={head_lbl: head_scores},
+        prompts=prompts,
+        targets=targets,
+        mazes=mazes,
         tokenizer=tokenizer,
-        n_mazes=3,
+        n_mazes=len(mazes),
         last_n_tokens=20,
-        exponentiate_scores=False,
+        softmax_attention=False,
+        # not saved in the report
+        plot_attn_dist_corr=False,
         maze_colormap_center=0.0,
         # important
         show_all=False,
         print_fmt="latex",
+    )[0]
+    attn_final_tok["scores"][0].savefig(path_scores)
+    attn_final_tok["attn_maze"][0].savefig(path_attn_maze)
+
+    return dict(
+        head_info=attn_final_tok["head_info"],
+        colored_tokens=attn_final_tok["colored_tokens"],
     )
 
+
+def _report_figure_jobs(data: ReportData, out_path: Path) -> list[FigureJob]:
+    """jobs rendering every figure of the report into `out_path / "figures"`
+
+    the head analysis jobs come last, one per important head, in order
+    """
+    fig_path: Path = out_path / "figures"
     head_fig_path: Path = fig_path / "head_analysis"
     head_fig_path.mkdir(parents=True, exist_ok=True)
+
+    n_mazes_shown: int = len(data.mazes_shown)
+    jobs: list[FigureJob] = [
+        FigureJob(
+            _render_first_maze,
+            dict(path=fig_path / "first_maze.png", pixels=data.first_maze_pixels),
+        ),
+        FigureJob(
+            _render_last_tok_logits,
+            dict(
+                path=fig_path / "last_tok_logits.png",
+                last_tok_logits=data.last_tok_logits,
+                target_idxs=data.target_ids,
+                tokenizer=data.tokenizer,
+            ),
+        ),
+        FigureJob(
+            _render_logit_diff_scatter,
+            dict(
+                path=fig_path / "logit_diff_scatter.png",
+                logit_diff_df=data.logit_diff_df,
+            ),
+        ),
+        FigureJob(
+            _render_logit_lens,
+            dict(path=fig_path / "logitlens.png", logit_lens_data=data.logit_lens_data),
+        ),
+        FigureJob(
+            _render_direct_logit_attribution,
+            dict(
+                path=fig_path / "logit_attribution.png",
+                dla_data=data.dla_data,
+                title=f"Logit difference from each head\n{data.model_name}\n'{data.logit_attribution_task_name}' task",
+            ),
+        ),
+    ] + [
+        FigureJob(
+            _render_head_analysis,
+            dict(
+                path_scores=head_fig_path / f"scores-{head_lbl}.png",
+                path_attn_maze=head_fig_path / f"attn_maze-{head_lbl}.png",
+                head_lbl=head_lbl,
+                head_scores=data.important_heads_scores[head_lbl],
+                prompts=data.prompts[:n_mazes_shown],
+                targets=data.targets[:n_mazes_shown],
+                mazes=data.mazes_shown,
+                tokenizer=data.tokenizer,
+            ),
+        )
+        for head_lbl in data.important_heads_scores
+    ]
+    return jobs
+
+
+def _write_report_md(
+    data: ReportData,
+    out_path: Path,
+    n_examples: int,
+    head_results: list[dict],
+) -> None:
+    """write `report.md`, given the outputs of the head analysis figure jobs"""
+    fig_path_md: Path = Path(f"figures")
     head_fig_path_md: Path = fig_path_md / "head_analysis"
+    head_lbls: list[str] = list(data.important_heads_scores.keys())
+    dataset_prompts_joined: list[str] = [" ".join(prompt) for prompt in data.prompts]
+
+    with (out_path / "report.md").open("w") as output_md:
+        # write header
+        output_md.write(
+            f"""---
+title: Direct Logit Attribution Report
+model_name: {data.model_name}
+dataset_cfg_name: {data.dataset_cfg_name}
+logit_attribution_task_name: {data.logit_attribution_task_name}
+n_examples: {n_examples}
+time: {datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+---
+
+# Direct Logit Attribution Report
+
+## Model
+`{data.model_name}`
+{_output_codeblock(data.model_summary, 'json')}
+
+## Dataset
+`{data.dataset_cfg_name}`
+{_output_codeblock(data.dataset_cfg_summary, 'json')}
+
+"""
+        )
+
+        # print some info about dataset
+        output_md.write(
+            f"""
+
+number of mazes: {data.n_mazes}
+vocabulary size: {data.tokenizer.vocab_size}
+
+### First Maze
+
+full: {_output_codeblock(' '.join(data.prompts[0]))}
+prompt: {_output_codeblock('[...] ' + dataset_prompts_joined[0][-150:])}
+target: {_output_codeblock(data.targets[0])}
+target id: {_output_codeblock(str(data.target_ids[0]))}
+
+![First maze as raster image]({fig_path_md / 'first_maze.png'})
+
+"""
+        )
+
+        output_md.write(
+            f"""# Model Output
+
+```
+cache_shapes: {json.dumps(data.cache_shapes, indent=2)}
+cache_nbytes: {data.cache_nbytes}
+last_tok_logits.shape: {data.last_tok_logits.shape}
+```
+"""
+        )
+        output_md.write(
+            f"![last token logits]({fig_path_md / 'last_tok_logits.png'})\n"
+        )
+
+        output_md.write(
+            f"""
+```
+predicted_tokens.shape: {len(data.prediction_correct)}
+prediction_correct.shape: {data.prediction_correct.shape}
+prediction_correct.mean(): {data.prediction_correct.float().mean().item()}
+```
+"""
+        )
+
+        # logit diff
+        output_md.write(
+            f"""
+# Logit Difference
+```
+logit_diff_df.shape: {data.logit_diff_df.shape}
+```
+
+```
+{data.logit_diff_df}
+```
+"""
+        )
+        output_md.write(
+            f"![logit difference scatterplot comparison]({fig_path_md / 'logit_diff_scatter.png'})\n"
+        )
 
-    for i, attn_final_tok in enumerate(attn_final_tok_output):
-        head_info: dict = attn_final_tok["head_info"]
-        head_lbl: str = head_info["head"]
+        # logit lens
+        output_md.write(f"![logit lens results]({fig_path_md / 'logitlens.png'})\n")
 
-        attn_final_tok["scores"][0].savefig(head_fig_path / f"scores-{head_lbl}.png")
-        attn_final_tok["attn_maze"][0].savefig(
-            head_fig_path / f"attn_maze-{head_lbl}.png"
+        # direct logit attribution
+        output_md.write(f"# Direct Logit Attribution")
+        output_md.write(
+            f"![logit attribution]({fig_path_md / 'logit_attribution.png'})\n"
         )
 
+        # head analysis
         output_md.write(
             f"""
+# Head Analysis
+top {len(data.important_heads)} heads: `{data.important_heads}`
+"""
+        )
+        for head_lbl, head_result in zip(head_lbls, head_results):
+            output_md.write(
+                f"""
 ## Head {head_lbl}
-head info: `{head_info}`
+head info: `{head_result['head_info']}`
 
-{attn_final_tok['colored_tokens']}
+{head_result['colored_tokens']}
 
 ![scores of attention head over tokens]({head_fig_path_md / f'scores-{head_lbl}.png'})
 ![scores of attention head over maze]({head_fig_path_md / f'attn_maze-{head_lbl}.png'})
 """
+            )
+
+
+def write_report(
+    report_data: ReportData,
+    out_path: str | Path,
+    n_examples: int,
+    parallel: bool | int = False,
+) -> Path:
+    """render the figures of `report_data` and write `report.md` to `out_path`
+
+    figures are rendered by `render_figure_jobs`, in a process pool if `parallel` is set
+    """
+    out_path = Path(out_path)
+    jobs: list[FigureJob] = _report_figure_jobs(report_data, out_path)
+    job_results: list = render_figure_jobs(jobs, parallel=parallel)
+    n_heads: int = len(report_data.important_heads_scores)
+    _write_report_md(
+        report_data,
+        out_path=out_path,
+        n_examples=n_examples,
+        head_results=job_results[len(job_results) - n_heads :],
+    )
+    return out_path
+
+
+_REPORTS_DIR: Path = Path("data/dla_reports")
+
+
+def _report_dirname(
+    model_name: str,
+    dataset_cfg_name: str,
+    logit_attribution_task_name: str,
+    n_examples: int,
+) -> str:
+    return (
+        f"{model_name}-{dataset_cfg_name}-{logit_attribution_task_name}-n{n_examples}"
+    )
+
+
+def create_report(
+    model: ZanjHookedTransformer | str | Path,
+    dataset_cfg_source: MazeDatasetConfig | None,
+    logit_attribution_task_name: str,
+    n_examples: int = 100,
+    out_path: str | Path | None = None,
+    device: torch.device = torch.device("cuda" if torch.cuda.is_available() else "cpu"),
+    batch_size: int | None = 64,
+    parallel: bool | int = False,
+    registry: ModelRegistry | None = None,
+) -> Path:
+    """run the model (`compute_report_data`), then render figures and write the report (`write_report`)
+
+    if `parallel` is `True` or an int, figures are rendered in a process pool. a model
+    given as a path is fetched from `registry` (such as `MODEL_REGISTRY`) if one is given
+    """
+    # setup
+    # ======================================================================
+    torch.set_grad_enabled(False)
+
+    # model
+    if not isinstance(model, ZanjHookedTransformer):
+        model = (
+            registry.get(model)
+            if registry is not None
+            else ZanjHookedTransformer.read(model)
+        )
+
+    # dataset cfg
+    if dataset_cfg_source is None:
+        dataset_cfg_source = model.zanj_model_config.dataset_cfg
+
+    # output
+    if out_path is None:
+        out_path = _REPORTS_DIR / _report_dirname(
+            model.zanj_model_config.name,
+            dataset_cfg_source.name,
+            logit_attribution_task_name,
+            n_examples,
+        )
+
+    # dataset
+    dataset: MazeDataset = MazeDataset.from_config(dataset_cfg_source)
+
+    report_data: ReportData = compute_report_data(
+        model=model,
+        dataset=dataset,
+        logit_attribution_task_name=logit_attribution_task_name,
+        batch_size=batch_size,
+        device=device,
+    )
+
+    return write_report(
+        report_data,
+        out_path=out_path,
+        n_examples=n_examples,
+        parallel=parallel,
+    )
+
+
+def create_reports(
+    models: list[ZanjHookedTransformer | str | Path],
+    dataset_cfg_source: MazeDatasetConfig | None = None,
+    logit_attribution_task_names: list[str] | None = None,
+    n_examples: int = 100,
+    out_dir: str | Path = _REPORTS_DIR,
+    device: torch.device = torch.device("cuda" if torch.cuda.is_available() else "cpu"),
+    batch_size: int | None = 64,
+    parallel: bool | int = False,
+    registry: ModelRegistry | None = None,
+) -> dict[tuple[str, str], Path]:
+    """`create_report` for every model and task, sharing work between them
+
+    - each dataset is loaded once, and tokenized and split into task prompts once per
+      tokenizer, so all models using the same tokenizer see the same prompts
+    - each model is run once per maze for all tasks, via `capture_activations_shared_prefix`
+    - models given as paths are loaded one at a time, or fetched from `registry` if given
+    - figures of all reports are rendered together, in one process pool if `parallel` is set
+
+    `logit_attribution_task_names` defaults to all of `LOGIT_ATTRIB_TASKS`. if
+    `dataset_cfg_source` is `None`, each model uses the dataset it was trained on.
+    returns the output path of each report, keyed by `(model label, task name)`. the
+    model label is the model's name, followed by the file stem for models given as paths.
+    """
+    torch.set_grad_enabled(False)
+    out_dir = Path(out_dir)
+    if logit_attribution_task_names is None:
+        logit_attribution_task_names = list(LOGIT_ATTRIB_TASKS.keys())
+
+    # keyed by the dataset config, and then the tokenizer name
+    datasets: dict[str, MazeDataset] = dict()
+    task_setups: dict[tuple[str, str], dict[str, TaskSetup]] = dict()
+
+    reports: list[tuple[ReportData, Path]] = list()
+    jobs_per_report: list[list[FigureJob]] = list()
+    output: dict[tuple[str, str], Path] = dict()
+
+    for model in models:
+        model_label: str
+        if isinstance(model, ZanjHookedTransformer):
+            model_label = model.zanj_model_config.name
+        else:
+            model_path: Path = Path(model)
+            model = (
+                registry.get(model_path)
+                if registry is not None
+                else ZanjHookedTransformer.read(model_path)
+            )
+            model_label = f"{model.zanj_model_config.name}-{model_path.stem}"
+        tokenizer: MazeTokenizer = model.zanj_model_config.maze_tokenizer
+
+        # dataset and task prompts, shared between models
+        dataset_cfg: MazeDatasetConfig = (
+            dataset_cfg_source
+            if dataset_cfg_source is not None
+            else model.zanj_model_config.dataset_cfg
+        )
+        dataset_key: str = dataset_cfg.to_fname()
+        if dataset_key not in datasets:
+            datasets[dataset_key] = MazeDataset.from_config(dataset_cfg)
+        dataset: MazeDataset = datasets[dataset_key]
+
+        setups_key: tuple[str, str] = (dataset_key, tokenizer.name)
+        if setups_key not in task_setups:
+            dataset_tokens: list[list[str]] = dataset.as_tokens(
+                tokenizer, join_tokens_individual_maze=False
+            )
+            task_setups[setups_key] = {
+                task_name: LOGIT_ATTRIB_TASKS[task_name](dataset_tokens)
+                for task_name in logit_attribution_task_names
+            }
+        model_task_setups: dict[str, TaskSetup] = task_setups[setups_key]
+
+        # run the model once for all tasks
+        captured_by_task: dict[str, CapturedActivations] = (
+            capture_activations_shared_prefix(
+                model=model,
+                task_prompts={
+                    task_name: setup.prompts
+                    for task_name, setup in model_task_setups.items()
+                },
+                specs=report_capture_specs(model.zanj_model_config.model_cfg.n_layers),
+                batch_size=batch_size,
+            )
+        )
+
+        for task_name, setup in model_task_setups.items():
+            report_data: ReportData = compute_report_data(
+                model=model,
+                dataset=dataset,
+                logit_attribution_task_name=task_name,
+                device=device,
+                task_setup=setup,
+                captured=captured_by_task[task_name],
+            )
+            out_path: Path = out_dir / _report_dirname(
+                model_label, dataset_cfg.name, task_name, n_examples
+            )
+            assert (
+                model_label,
+                task_name,
+            ) not in output, f"duplicate report for {model_label = }, {task_name = }"
+            output[(model_label, task_name)] = out_path
+            reports.append((report_data, out_path))
+            jobs_per_report.append(_report_figure_jobs(report_data, out_path))
+
+        del captured_by_task, model
+
+    # render the figures of all reports at once
+    job_results: list = render_figure_jobs(
+        [job for jobs in jobs_per_report for job in jobs],
+        parallel=parallel,
+    )
+
+    idx_start: int = 0
+    for (report_data, out_path), jobs in zip(reports, jobs_per_report):
+        idx_end: int = idx_start + len(jobs)
+        n_heads: int = len(report_data.important_heads_scores)
+        _write_report_md(
+            report_data,
+            out_path=out_path,
+            n_examples=n_examples,
+            head_results=job_results[idx_end - n_heads : idx_end],
         )
+        idx_start = idx_end
 
-    # cleaning up
-    output_md.flush()
-    output_md.close()
+    return output
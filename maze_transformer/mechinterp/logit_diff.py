@@ -5,7 +5,10 @@ from fancy_einsum import einsum
 from jaxtyping import Float, Int
 
 # TransformerLens imports
-from transformer_lens import ActivationCache, HookedTransformer
+from transformer_lens import ActivationCache
+
+# mechinterp stuff
+from maze_transformer.mechinterp.activation_capture import CapturedActivations
 
 # model stuff
 from maze_transformer.training.config import ZanjHookedTransformer
@@ -72,35 +75,59 @@ def logit_diff_direct(
     # return answer_logits / (all_logits - answer_logits)
 
 
-def logit_diff_residual_stream(
+def logit_diff_directions(
     model: ZanjHookedTransformer,
-    cache: ActivationCache,
-    tokens_correct: Int[torch.Tensor, "samples"],
-    tokens_compare_to: Int[torch.Tensor, "samples"] | None = None,
-    directions: bool = False,
-) -> float | tuple[float, torch.Tensor]:
-    d_vocab: int = model.config.maze_tokenizer.vocab_size
-    d_model: int = model.config.model_cfg.d_model
+    tokens_correct: Int[torch.Tensor, "... samples"],
+    tokens_compare_to: Int[torch.Tensor, "... samples"] | None = None,
+) -> Float[torch.Tensor, "... samples d_model"]:
+    """residual stream direction of the difference between the logit on the correct token and the comparison token
 
-    # embed the whole vocab first
-    vocab_tensor: Float[torch.Tensor, "d_vocab"] = torch.arange(
-        d_vocab, dtype=torch.long
-    )
+    if `tokens_compare_to` is None, compares to the token at index `~tokens_correct`
+
+    the tokens may have leading batch dimensions (for example `(n_tests, samples)`), in
+    which case the directions for all of them are returned at once. uses the cached
+    table from `ZanjHookedTransformer.vocab_residual_directions()`
+    """
+    # embedding of the whole vocab
     vocab_residual_directions: Float[torch.Tensor, "d_vocab d_model"] = (
-        model.tokens_to_residual_directions(vocab_tensor)
+        model.vocab_residual_directions()
     )
     # get embedding of answer tokens
     answer_residual_directions = vocab_residual_directions[tokens_correct]
     # get the directional difference between logits and corrent and logits on {all other tokens, comparison tokens}
-    logit_diff_directions: Float[torch.Tensor, "samples d_model"]
     if tokens_compare_to is None:
-        logit_diff_directions = (
-            answer_residual_directions - vocab_residual_directions[~tokens_correct]
-        )
+        return answer_residual_directions - vocab_residual_directions[~tokens_correct]
     else:
-        logit_diff_directions = (
-            answer_residual_directions - vocab_residual_directions[tokens_compare_to]
-        )
+        return answer_residual_directions - vocab_residual_directions[tokens_compare_to]
+
+
+def residual_vocab_projection(
+    model: ZanjHookedTransformer,
+    residual: Float[torch.Tensor, "... d_model"],
+) -> Float[torch.Tensor, "... d_vocab"]:
+    """project (already layernorm-scaled) residual stream vectors onto the direction of every vocab token
+
+    logit diffs for any pair of tokens are then differences of entries of the output,
+    so many comparisons can be made without computing their directions
+    """
+    return residual @ model.vocab_residual_directions().T
+
+
+def logit_diff_residual_stream(
+    model: ZanjHookedTransformer,
+    cache: ActivationCache | CapturedActivations,
+    tokens_correct: Int[torch.Tensor, "samples"],
+    tokens_compare_to: Int[torch.Tensor, "samples"] | None = None,
+    directions: bool = False,
+) -> float | tuple[float, torch.Tensor]:
+    if isinstance(cache, CapturedActivations):
+        cache = cache.as_activation_cache(model)
+
+    diff_directions: Float[torch.Tensor, "samples d_model"] = logit_diff_directions(
+        model=model,
+        tokens_correct=tokens_correct,
+        tokens_compare_to=tokens_compare_to,
+    )
 
     # get the values from the cache at the last layer and last token
     final_token_residual_stream: Float[torch.Tensor, "samples d_model"] = cache[
@@ -120,28 +147,29 @@ def logit_diff_residual_stream(
     average_logit_diff: float = (
         torch.dot(
             scaled_final_token_residual_stream.flatten(),
-            logit_diff_directions.flatten(),
+            diff_directions.flatten(),
         )
-        / logit_diff_directions.shape[0]
+        / diff_directions.shape[0]
     ).item()
 
     if directions:
-        return average_logit_diff, logit_diff_directions
+        return average_logit_diff, diff_directions
     else:
         return average_logit_diff
 
 
-def logits_diff_multi(
-    model: HookedTransformer,
-    cache: ActivationCache,
+def _logits_diff_multi_tokens(
     dataset_target_ids: Int[torch.Tensor, "samples"],
     last_tok_logits: Float[torch.Tensor, "samples d_vocab"],
-    noise_sigmas: list[float] = [1, 2, 3, 5, 10],
-    n_randoms: int = 1,
-) -> pd.DataFrame:
+    noise_sigmas: list[float],
+    n_randoms: int,
+) -> tuple[
+    dict[str, Int[torch.Tensor, "samples"]],
+    dict[str, None | Int[torch.Tensor, "samples"]],
+]:
+    """tokens to test, and tokens to compare to, for `logits_diff_multi`"""
     d_vocab: int = last_tok_logits.shape[1]
-
-    test_logits: dict[str, Float[torch.Tensor, "samples"]] = {
+    test_logits: dict[str, Int[torch.Tensor, "samples"]] = {
         "target": dataset_target_ids,
         "predicted": last_tok_logits.argmax(dim=-1),
         "sampled": torch.multinomial(
@@ -159,35 +187,104 @@ def logits_diff_multi(
             for i in range(n_randoms)
         },
     }
-    compare_dict: dict[str, None | Float[torch.Tensor, "samples"]] = {
+    compare_dict: dict[str, None | Int[torch.Tensor, "samples"]] = {
         "all": None,
         "random": torch.randint_like(dataset_target_ids, low=0, high=d_vocab),
         "target": dataset_target_ids,
     }
+    return test_logits, compare_dict
 
-    outputs: list[dict] = list()
 
+def logits_diff_multi(
+    model: ZanjHookedTransformer,
+    cache: ActivationCache | CapturedActivations,
+    dataset_target_ids: Int[torch.Tensor, "samples"],
+    last_tok_logits: Float[torch.Tensor, "samples d_vocab"],
+    noise_sigmas: list[float] = [1, 2, 3, 5, 10],
+    n_randoms: int = 1,
+) -> pd.DataFrame:
+    """`logit_diff_direct` and `logit_diff_residual_stream` for several choices of tokens to
+    test (target, predicted, sampled, noisy argmax, random) and to compare to (all, random, target)
+
+    all combinations are computed at once: the final residual stream is projected onto
+    the residual direction of every vocab token a single time, and each logit diff is a
+    difference of gathered entries of that projection
+    """
+    if isinstance(cache, CapturedActivations):
+        cache = cache.as_activation_cache(model)
+
+    test_logits: dict[str, Int[torch.Tensor, "samples"]]
+    compare_dict: dict[str, None | Int[torch.Tensor, "samples"]]
+    test_logits, compare_dict = _logits_diff_multi_tokens(
+        dataset_target_ids=dataset_target_ids,
+        last_tok_logits=last_tok_logits,
+        noise_sigmas=noise_sigmas,
+        n_randoms=n_randoms,
+    )
+
+    n_samples: int = last_tok_logits.shape[0]
+    device: torch.device = last_tok_logits.device
+
+    # the final residual stream, scaled by layer norm, projected onto each vocab token's direction
+    scaled_final_token_residual_stream: Float[torch.Tensor, "samples d_model"] = (
+        cache.apply_ln_to_stack(
+            cache["resid_post", -1][:, -1, :],
+            layer=-1,
+            pos_slice=-1,
+        )
+    )
+    residual_logits: Float[torch.Tensor, "samples d_vocab"] = (
+        residual_vocab_projection(model, scaled_final_token_residual_stream)
+        .detach()
+        .to(device)
+    )
+    d_vocab_tokenizer: int = residual_logits.shape[1]
+
+    # tokens of every test, and what to compare them to, as `(n_tests, samples)` arrays
+    tokens_test: Int[torch.Tensor, "n_tests samples"] = torch.stack(
+        [d.to(device) for d in test_logits.values()]
+    )
+    sample_idx: Int[torch.Tensor, "1 samples"] = torch.arange(
+        n_samples, device=device
+    ).unsqueeze(0)
+
+    logits_test: Float[torch.Tensor, "n_tests samples"] = last_tok_logits[
+        sample_idx, tokens_test
+    ]
+    residual_test: Float[torch.Tensor, "n_tests samples"] = residual_logits[
+        sample_idx, tokens_test
+    ]
+    all_logits: Float[torch.Tensor, "1 samples"] = last_tok_logits.sum(dim=1).unsqueeze(
+        0
+    )
+
+    outputs: list[dict] = list()
     for k_comp, compare_to in compare_dict.items():
-        for k, d in test_logits.items():
-            result_orig: float = logit_diff_direct(
-                model_logits=last_tok_logits,
-                tokens_correct=d,
-                diff_per_prompt=False,
-                tokens_compare_to=compare_to,
-            )
-            result_res: float = logit_diff_residual_stream(
-                model=model,
-                cache=cache,
-                tokens_correct=d,
-                tokens_compare_to=compare_to,
-            )
-            # print(f"logit diff of {k}\tcompare:\t{'all' if compare_to is None else 'random'}\t{result = }\t{result_res = }")
+        result_orig: Float[torch.Tensor, "n_tests"]
+        tokens_compare: Int[torch.Tensor, "n_tests samples"]
+        if compare_to is None:
+            # direct logits are compared to the sum of all others, but the residual
+            # stream to the token at index `~tokens_correct`, as in `logit_diff_directions`
+            result_orig = (logits_test - (all_logits - logits_test)).mean(dim=1)
+            tokens_compare = (~tokens_test) % d_vocab_tokenizer
+        else:
+            tokens_compare = compare_to.to(device).unsqueeze(0).expand_as(tokens_test)
+            result_orig = (
+                logits_test - last_tok_logits[sample_idx, tokens_compare]
+            ).mean(dim=1)
+        result_res: Float[torch.Tensor, "n_tests"] = (
+            residual_test - residual_logits[sample_idx, tokens_compare]
+        ).mean(dim=1)
+
+        for k, orig, res in zip(
+            test_logits.keys(), result_orig.tolist(), result_res.tolist()
+        ):
             outputs.append(
                 dict(
                     test=k,
                     compare_to=k_comp,
-                    result_orig=result_orig,
-                    result_res=result_res,
+                    result_orig=orig,
+                    result_res=res,
                 )
             )
 
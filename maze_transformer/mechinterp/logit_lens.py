@@ -1,24 +1,28 @@
 import matplotlib.pyplot as plt
 import numpy as np
 import torch
-from jaxtyping import Int
+from jaxtyping import Float, Int
+from muutils.mlutils import chunks
 
 # TransformerLens imports
 from transformer_lens import ActivationCache
 
 # mechinterp stuff
+from maze_transformer.mechinterp.activation_capture import CapturedActivations
 from maze_transformer.mechinterp.logit_diff import (
+    logit_diff_directions,
     logit_diff_residual_stream,
     residual_stack_to_logit_diff,
 )
 
 # model stuff
 from maze_transformer.training.config import ZanjHookedTransformer
+from maze_transformer.utils.padding import length_sorted_order
 
 
 def compute_logit_lens(
     model: ZanjHookedTransformer,
-    cache: ActivationCache,
+    cache: ActivationCache | CapturedActivations,
     answer_tokens: Int[torch.Tensor, "n_mazes"],
 ) -> tuple[
     torch.Tensor,
@@ -26,6 +30,9 @@ def compute_logit_lens(
     torch.Tensor,
     torch.Tensor,  # x/y for attr
 ]:
+    if isinstance(cache, CapturedActivations):
+        cache = cache.as_activation_cache(model)
+
     # logit diff
     avg_diff, diff_direction = logit_diff_residual_stream(
         model=model,
@@ -67,11 +74,103 @@ def compute_logit_lens(
     )
 
 
-def plot_logit_lens(
+def compute_logit_lens_streaming(
     model: ZanjHookedTransformer,
-    cache: ActivationCache,
+    prompts: list[list[str]],
     answer_tokens: Int[torch.Tensor, "n_mazes"],
+    batch_size: int = 64,
+) -> tuple[
+    torch.Tensor,
+    torch.Tensor,  # x/y for diff
+    torch.Tensor,
+    torch.Tensor,  # x/y for attr
+]:
+    """same output as `compute_logit_lens`, without ever holding a cache
+
+    each residual stream component is read at the last position by a hook during the
+    forward pass, centered (for layernorm models) and immediately projected onto the
+    logit diff direction of its maze. the final layernorm scale is a single number per
+    maze, so the projections are divided by it at the end of the forward pass, and only
+    running sums over mazes are kept.
+    """
+    n_layers: int = model.zanj_model_config.model_cfg.n_layers
+    center: bool = model.cfg.normalization_type in ["LN", "LNPre"]
+
+    diff_directions: Float[torch.Tensor, "n_mazes d_model"] = logit_diff_directions(
+        model=model,
+        tokens_correct=answer_tokens,
+        tokens_compare_to=None,
+    ).detach()
+
+    # components in the order of `ActivationCache.accumulated_resid(incl_mid=True)`
+    # and `ActivationCache.decompose_resid`
+    accumulated_hooks: list[str] = [
+        f"blocks.{layer}.hook_resid_{kind}"
+        for layer in range(n_layers)
+        for kind in ["pre", "mid"]
+    ] + [f"blocks.{n_layers - 1}.hook_resid_post"]
+    decomposed_hooks: list[str] = [
+        name for name in ["hook_embed", "hook_pos_embed"] if name in model.hook_dict
+    ] + [
+        f"blocks.{layer}.hook_{kind}_out"
+        for layer in range(n_layers)
+        for kind in ["attn", "mlp"]
+    ]
+
+    sums: dict[str, float] = dict()
+    chunk_projections: dict[str, Float[torch.Tensor, "batch"]] = dict()
+    chunk_directions: Float[torch.Tensor, "batch d_model"]
+    chunk_scale: list[Float[torch.Tensor, "batch"]] = list()
+
+    def project_hook(activation: Float[torch.Tensor, "batch pos d_model"], hook):
+        resid: Float[torch.Tensor, "batch d_model"] = activation[:, -1, :]
+        if center:
+            resid = resid - resid.mean(dim=-1, keepdim=True)
+        chunk_projections[hook.name] = (resid * chunk_directions).sum(dim=-1)
+
+    def scale_hook(activation: Float[torch.Tensor, "batch pos 1"], hook):
+        chunk_scale.append(activation[:, -1, 0])
+
+    fwd_hooks: list = [
+        (name, project_hook) for name in accumulated_hooks + decomposed_hooks
+    ] + [("ln_final.hook_scale", scale_hook)]
+
+    order, _ = length_sorted_order([len(p) for p in prompts])
+    with torch.no_grad():
+        for idxs_chunk in chunks(order, batch_size):
+            chunk_directions = diff_directions[idxs_chunk].to(model.cfg.device)
+            model.run_with_hooks(
+                [" ".join(prompts[i]) for i in idxs_chunk],
+                fwd_hooks=fwd_hooks,
+                return_type=None,
+            )
+            scale: Float[torch.Tensor, "batch"] = chunk_scale.pop()
+            for name, projection in chunk_projections.items():
+                sums[name] = sums.get(name, 0.0) + (projection / scale).sum().item()
+            chunk_projections.clear()
+
+    n_mazes: int = len(prompts)
+    logit_lens_logit_diffs: Float[np.ndarray, "n_components"] = np.array(
+        [sums[name] / n_mazes for name in accumulated_hooks]
+    )
+    per_layer_logit_diffs: Float[np.ndarray, "n_components"] = np.array(
+        [sums[name] / n_mazes for name in decomposed_hooks if name in sums]
+    )
+
+    return (
+        np.arange(logit_lens_logit_diffs.shape[0]),
+        logit_lens_logit_diffs,
+        np.arange(per_layer_logit_diffs.shape[0]),
+        per_layer_logit_diffs,
+    )
+
+
+def plot_logit_lens(
+    model: ZanjHookedTransformer | None,
+    cache: ActivationCache | CapturedActivations | None,
+    answer_tokens: Int[torch.Tensor, "n_mazes"] | None,
     show: bool = True,
+    logit_lens_data: tuple[torch.Tensor, ...] | None = None,
 ) -> tuple[
     tuple[plt.Figure, plt.Axes, plt.Axes],  # figure and axes
     tuple[
@@ -81,11 +180,15 @@ def plot_logit_lens(
         torch.Tensor,  # x/y for attr
     ],
 ]:
-    diff_x, diff_y, attr_x, attr_y = compute_logit_lens(
-        model=model,
-        cache=cache,
-        answer_tokens=answer_tokens,
-    )
+    """if `logit_lens_data` is given (for example from `compute_logit_lens_streaming`),
+    it is plotted directly and `model`, `cache` and `answer_tokens` are ignored"""
+    if logit_lens_data is None:
+        logit_lens_data = compute_logit_lens(
+            model=model,
+            cache=cache,
+            answer_tokens=answer_tokens,
+        )
+    diff_x, diff_y, attr_x, attr_y = logit_lens_data
 
     fig, ax1 = plt.subplots(figsize=(10, 5))
 
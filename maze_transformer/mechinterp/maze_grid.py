@@ -0,0 +1,181 @@
+"""map per-token values (such as attention) onto the grid of a maze, and distances on the grid
+
+`token_grid_scatter_map` finds the grid cell of each coordinate token once per maze,
+after which values for any number of heads (and mazes) are summed onto the grid with a
+single `np.bincount` in `project_to_grid`, instead of parsing every token for every head.
+
+`maze_distance_grid` gives the distance from one cell to all others in a single search,
+so distances to every token of a context are array lookups.
+
+`pairwise_to_grid` and `lattice_neighbor_pairs` are for analyses over sets of coordinates
+(such as the coordinate token embeddings), replacing loops over all pairs of coordinates.
+"""
+
+import numpy as np
+import torch
+from jaxtyping import Float, Int
+from maze_dataset import Coord, CoordTup, LatticeMaze
+from maze_dataset.tokenization.util import coord_str_to_tuple_noneable
+
+# scatter map entry for tokens which are not coordinates
+NONCOORD_CELL: int = -1
+
+
+def token_grid_scatter_map(
+    tokens: list[str],
+    grid_shape: tuple[int, int],
+) -> Int[np.ndarray, "n_tokens"]:
+    """flat index (`row * grid_n_cols + col`) of the grid cell of each token, `NONCOORD_CELL` for non-coordinate tokens
+
+    only handles tokenizers where a coordinate is a single token, like `coord_str_to_tuple_noneable`
+    """
+    scatter_map: Int[np.ndarray, "n_tokens"] = np.full(
+        len(tokens), NONCOORD_CELL, dtype=np.int64
+    )
+    # tokens repeat a lot, so only parse each distinct one
+    cell_of_token: dict[str, int] = dict()
+    for idx_token, token in enumerate(tokens):
+        if token not in cell_of_token:
+            coord: tuple[int, int] | None = coord_str_to_tuple_noneable(token)
+            cell_of_token[token] = (
+                NONCOORD_CELL
+                if coord is None
+                else int(np.ravel_multi_index(coord, grid_shape))
+            )
+        scatter_map[idx_token] = cell_of_token[token]
+
+    return scatter_map
+
+
+def project_to_grid(
+    values: Float[np.ndarray | torch.Tensor, "*batch n_tokens"],
+    scatter_map: Int[np.ndarray, "n_tokens"] | Int[np.ndarray, "n_mazes n_tokens"],
+    grid_shape: tuple[int, int],
+) -> Float[np.ndarray, "*batch grid_n grid_n"]:
+    """sum the values of the tokens at each grid cell, ignoring non-coordinate tokens
+
+    `scatter_map` is either a single map from `token_grid_scatter_map`, shared by all
+    leading dims of `values`, or one map per maze, with the first dim of `values` indexing
+    mazes (pad shorter maps with `NONCOORD_CELL`, and mazes must share `grid_shape`)
+    """
+    if isinstance(values, torch.Tensor):
+        values = values.detach().cpu().numpy()
+    values = np.asarray(values)
+
+    scatter_map = np.asarray(scatter_map)
+    if scatter_map.ndim == 2:
+        assert (
+            scatter_map.shape[0] == values.shape[0]
+        ), f"one scatter map per maze expected, got {scatter_map.shape = } for {values.shape = }"
+        scatter_map = scatter_map.reshape(
+            scatter_map.shape[0], *([1] * (values.ndim - 2)), scatter_map.shape[1]
+        )
+    scatter_map = np.broadcast_to(scatter_map, values.shape)
+
+    n_cells: int = grid_shape[0] * grid_shape[1]
+    batch_shape: tuple[int, ...] = values.shape[:-1]
+    n_batch: int = int(np.prod(batch_shape, dtype=np.int64))
+
+    # offset the cells of each batch element, so one bincount handles all of them
+    cells: Int[np.ndarray, "n_batch n_tokens"] = scatter_map.reshape(n_batch, -1)
+    is_coord: np.ndarray = cells != NONCOORD_CELL
+    cells_offset: Int[np.ndarray, "n_batch n_tokens"] = (
+        cells + (np.arange(n_batch) * n_cells)[:, None]
+    )
+    grid_values: Float[np.ndarray, "n_batch_cells"] = np.bincount(
+        cells_offset[is_coord],
+        weights=values.reshape(n_batch, -1)[is_coord],
+        minlength=n_batch * n_cells,
+    )
+
+    return grid_values.reshape(*batch_shape, *grid_shape)
+
+
+def maze_distance_grid(
+    maze: LatticeMaze,
+    source: CoordTup | Coord,
+) -> Float[np.ndarray, "grid_n grid_n"]:
+    """shortest path distance from `source` to every cell of the maze, `np.inf` where unreachable
+
+    a single breadth first search, expanding the whole frontier at once along the
+    connections of `maze.connection_list`
+    """
+    connection_list: np.ndarray = maze.connection_list
+    # `connects_down[r, c]`: (r, c) -- (r+1, c), `connects_right[r, c]`: (r, c) -- (r, c+1)
+    connects_down: np.ndarray = connection_list[0, :-1, :]
+    connects_right: np.ndarray = connection_list[1, :, :-1]
+
+    distances: Float[np.ndarray, "grid_n grid_n"] = np.full(maze.grid_shape, np.inf)
+    frontier: np.ndarray = np.zeros(maze.grid_shape, dtype=np.bool_)
+    frontier[tuple(source)] = True
+    distances[tuple(source)] = 0
+
+    dist: int = 0
+    while frontier.any():
+        dist += 1
+        expanded: np.ndarray = np.zeros_like(frontier)
+        expanded[1:, :] |= frontier[:-1, :] & connects_down
+        expanded[:-1, :] |= frontier[1:, :] & connects_down
+        expanded[:, 1:] |= frontier[:, :-1] & connects_right
+        expanded[:, :-1] |= frontier[:, 1:] & connects_right
+
+        frontier = expanded & np.isinf(distances)
+        distances[frontier] = dist
+
+    return distances
+
+
+def pairwise_to_grid(
+    pairwise: Float[np.ndarray, "n_coords n_coords"],
+    coords: Int[np.ndarray, "n_coords 2"],
+    grid_shape: tuple[int, int],
+    fill_value: float = np.nan,
+) -> Float[np.ndarray, "rows cols rows cols"]:
+    """scatter a matrix of values between pairs of coordinates onto a `(rows, cols, rows, cols)` grid
+
+    `output[coords[i, 0], coords[i, 1], coords[j, 0], coords[j, 1]] = pairwise[i, j]`,
+    and `fill_value` for pairs of cells not in `coords`
+    """
+    coords = np.asarray(coords)
+    output: Float[np.ndarray, "rows cols rows cols"] = np.full(
+        (*grid_shape, *grid_shape), fill_value, dtype=np.result_type(pairwise, float)
+    )
+    output[
+        coords[:, 0, None],
+        coords[:, 1, None],
+        coords[None, :, 0],
+        coords[None, :, 1],
+    ] = pairwise
+    return output
+
+
+def lattice_neighbor_pairs(
+    coords: Int[np.ndarray, "n_coords 2"],
+) -> Int[np.ndarray, "n_pairs 2"]:
+    """indices `(i, j)` into `coords` of every pair of coordinates at manhattan distance 1, each pair once with `i < j`
+
+    (non-negative integer coordinates only)
+    """
+    coords = np.asarray(coords, dtype=np.int64).reshape(-1, 2)
+    if coords.shape[0] == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    # index of each coordinate in `coords`, with a border so that neighbors are always in bounds
+    index_grid: Int[np.ndarray, "rows cols"] = np.full(
+        tuple(coords.max(axis=0) + 2), -1, dtype=np.int64
+    )
+    index_grid[coords[:, 0], coords[:, 1]] = np.arange(coords.shape[0])
+
+    pairs: list[Int[np.ndarray, "n 2"]] = list()
+    for offset in [(1, 0), (0, 1)]:
+        neighbor: Int[np.ndarray, "n_coords"] = index_grid[
+            coords[:, 0] + offset[0], coords[:, 1] + offset[1]
+        ]
+        has_neighbor: np.ndarray = neighbor >= 0
+        pairs.append(
+            np.stack([np.flatnonzero(has_neighbor), neighbor[has_neighbor]], axis=1)
+        )
+
+    output: Int[np.ndarray, "n_pairs 2"] = np.concatenate(pairs, axis=0)
+    output = np.sort(output, axis=1)
+    return output[np.lexsort((output[:, 1], output[:, 0]))]
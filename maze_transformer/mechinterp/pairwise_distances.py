@@ -0,0 +1,214 @@
+"""chunked pairwise distances between embeddings, in torch
+
+`scipy.spatial.distance.pdist` calls back into python for every pair with a custom
+metric (like the absolute dot product), and correlating two sets of distances means
+materializing both. here the distances from a chunk of rows to all other rows are
+computed as a single (optionally on-device) matrix operation, written into a condensed
+(same order as `pdist`) or square output, and the pearson correlation with a second set
+of distances (usually between grid coordinates) is accumulated chunk by chunk.
+"""
+
+import typing
+
+import numpy as np
+import torch
+from jaxtyping import Float
+from scipy import stats
+
+PairwiseMetric = typing.Literal["cosine", "euclidean", "cityblock", "abs_dot"]
+
+# aliases accepted for compatibility with `compute_distances_and_correlation`
+_METRIC_ALIASES: dict[str, PairwiseMetric] = {
+    "dot": "abs_dot",
+    "manhattan": "cityblock",
+}
+
+
+def is_supported_metric(metric: str | typing.Callable) -> bool:
+    """whether `metric` (or its alias) is computed here, rather than only by `pdist`"""
+    return isinstance(metric, str) and _METRIC_ALIASES.get(
+        metric, metric
+    ) in typing.get_args(PairwiseMetric)
+
+
+def _block_distances(
+    rows: Float[torch.Tensor, "n_rows d"],
+    x: Float[torch.Tensor, "n d"],
+    metric: str,
+) -> Float[torch.Tensor, "n_rows n"]:
+    if metric == "cosine":
+        return (
+            1.0
+            - torch.nn.functional.normalize(rows, dim=1)
+            @ torch.nn.functional.normalize(x, dim=1).T
+        )
+    elif metric == "euclidean":
+        return torch.cdist(rows, x, p=2.0, compute_mode="donot_use_mm_for_euclid_dist")
+    elif metric == "cityblock":
+        return torch.cdist(rows, x, p=1.0)
+    elif metric == "abs_dot":
+        return (rows @ x.T).abs()
+    else:
+        raise ValueError(
+            f"unknown metric {metric!r}, expected one of {typing.get_args(PairwiseMetric)}"
+        )
+
+
+def iter_pairwise_distance_blocks(
+    x: Float[np.ndarray | torch.Tensor, "n d"],
+    metric: PairwiseMetric | str = "cosine",
+    chunk_size: int = 1024,
+    device: str | torch.device = "cpu",
+    dtype: torch.dtype = torch.float64,
+) -> typing.Iterator[tuple[int, Float[torch.Tensor, "n_rows n"]]]:
+    """yield `(start, distances from rows start:start+n_rows to every row)`, `chunk_size` rows at a time"""
+    metric = _METRIC_ALIASES.get(metric, metric)
+    x_t: torch.Tensor = torch.as_tensor(x).to(device=device, dtype=dtype)
+    with torch.no_grad():
+        for start in range(0, x_t.shape[0], chunk_size):
+            yield start, _block_distances(x_t[start : start + chunk_size], x_t, metric)
+
+
+def _upper_triangle(
+    block: Float[torch.Tensor, "n_rows n"],
+    start: int,
+) -> Float[torch.Tensor, "n_pairs"]:
+    """entries `(i, j)` of a block of rows with `j > i`, in row-major (`pdist`) order"""
+    row_idx: torch.Tensor = torch.arange(
+        start, start + block.shape[0], device=block.device
+    )
+    col_idx: torch.Tensor = torch.arange(block.shape[1], device=block.device)
+    return block[col_idx.unsqueeze(0) > row_idx.unsqueeze(1)]
+
+
+class _StreamingPearson:
+    """pearson correlation of two sequences seen in chunks
+
+    keeps the means and (co)variance sums, merging each chunk in as in Chan et al.'s
+    parallel variance algorithm, which avoids the cancellation of raw sums of squares
+    """
+
+    def __init__(self) -> None:
+        self.n: int = 0
+        self.mean_a: float = 0.0
+        self.mean_b: float = 0.0
+        self.m2_a: float = 0.0
+        self.m2_b: float = 0.0
+        self.c_ab: float = 0.0
+
+    def update(self, a: torch.Tensor, b: torch.Tensor) -> None:
+        a, b = a.double(), b.double()
+        n_chunk: int = a.numel()
+        if n_chunk == 0:
+            return
+        mean_a_chunk: float = a.mean().item()
+        mean_b_chunk: float = b.mean().item()
+        a_centered: torch.Tensor = a - mean_a_chunk
+        b_centered: torch.Tensor = b - mean_b_chunk
+
+        n_total: int = self.n + n_chunk
+        delta_a: float = mean_a_chunk - self.mean_a
+        delta_b: float = mean_b_chunk - self.mean_b
+        weight: float = self.n * n_chunk / n_total
+        self.m2_a += (a_centered * a_centered).sum().item() + delta_a**2 * weight
+        self.m2_b += (b_centered * b_centered).sum().item() + delta_b**2 * weight
+        self.c_ab += (a_centered * b_centered).sum().item() + delta_a * delta_b * weight
+        self.mean_a += delta_a * n_chunk / n_total
+        self.mean_b += delta_b * n_chunk / n_total
+        self.n = n_total
+
+    def result(self) -> tuple[float, float]:
+        """`(correlation, two-sided p-value)`, as from `scipy.stats.pearsonr`"""
+        n: int = self.n
+        r: float = float(np.clip(self.c_ab / np.sqrt(self.m2_a * self.m2_b), -1.0, 1.0))
+        # the null distribution of r is a beta distribution on [-1, 1]
+        dist = stats.beta(n / 2 - 1, n / 2 - 1, loc=-1, scale=2)
+        pval: float = float(2 * dist.cdf(-abs(r)))
+        return r, pval
+
+
+def pairwise_distances(
+    x: Float[np.ndarray | torch.Tensor, "n d"],
+    metric: PairwiseMetric | str = "cosine",
+    square: bool = False,
+    chunk_size: int = 1024,
+    device: str | torch.device = "cpu",
+    dtype: torch.dtype = torch.float64,
+) -> Float[np.ndarray, "n_pairs"] | Float[np.ndarray, "n n"]:
+    """distances between all pairs of rows of `x`
+
+    condensed (as from `pdist`) by default, or the square matrix (as from
+    `squareform(pdist(...))`, with zeros on the diagonal) if `square` is set
+    """
+    distances, _, _ = pairwise_distances_correlation(
+        x,
+        metric=metric,
+        compare_to=None,
+        output="square" if square else "condensed",
+        chunk_size=chunk_size,
+        device=device,
+        dtype=dtype,
+    )
+    return distances
+
+
+def pairwise_distances_correlation(
+    x: Float[np.ndarray | torch.Tensor, "n d"],
+    metric: PairwiseMetric | str = "cosine",
+    compare_to: Float[np.ndarray | torch.Tensor, "n d2"] | None = None,
+    compare_metric: PairwiseMetric | str = "euclidean",
+    output: typing.Literal["condensed", "square"] | None = "square",
+    chunk_size: int = 1024,
+    device: str | torch.device = "cpu",
+    dtype: torch.dtype = torch.float64,
+) -> tuple[np.ndarray | None, float | None, float | None]:
+    """distances between rows of `x`, and their pearson correlation with distances between rows of `compare_to`
+
+    both sets of distances are computed in a single pass over chunks of rows, and only
+    the distances of `x` are stored (in the requested `output` form, or not at all if
+    `output` is `None`). returns `(distances, correlation, p-value)`, with `None` for the
+    correlation and p-value if `compare_to` is not given.
+    """
+    n: int = x.shape[0]
+    distances: np.ndarray | None = None
+    if output == "square":
+        distances = np.zeros((n, n), dtype=np.float64)
+    elif output == "condensed":
+        distances = np.zeros(n * (n - 1) // 2, dtype=np.float64)
+    elif output is not None:
+        raise ValueError(f"unknown {output = }, expected 'condensed', 'square' or None")
+
+    pearson: _StreamingPearson | None = None
+    compare_blocks: typing.Iterator | None = None
+    if compare_to is not None:
+        assert (
+            compare_to.shape[0] == n
+        ), f"need one row of `compare_to` per row of `x`, got {compare_to.shape = } and {x.shape = }"
+        pearson = _StreamingPearson()
+        compare_blocks = iter_pairwise_distance_blocks(
+            compare_to, compare_metric, chunk_size, device, dtype
+        )
+
+    condensed_start: int = 0
+    for start, block in iter_pairwise_distance_blocks(
+        x, metric, chunk_size, device, dtype
+    ):
+        block_upper: torch.Tensor = _upper_triangle(block, start)
+        if output == "square":
+            distances[start : start + block.shape[0]] = block.cpu().numpy()
+        elif output == "condensed":
+            distances[condensed_start : condensed_start + block_upper.numel()] = (
+                block_upper.cpu().numpy()
+            )
+        condensed_start += block_upper.numel()
+
+        if pearson is not None:
+            _, compare_block = next(compare_blocks)
+            pearson.update(block_upper, _upper_triangle(compare_block, start))
+
+    if output == "square":
+        np.fill_diagonal(distances, 0.0)
+
+    if pearson is None:
+        return distances, None, None
+    return (distances, *pearson.result())
@@ -13,7 +13,7 @@ import torch
 # Transformers
 from circuitsvis.attention import attention_heads
 from circuitsvis.tokens import colored_tokens_multi
-from jaxtyping import Float
+from jaxtyping import Float, Int
 from maze_dataset import CoordTup, MazeDataset, MazeDatasetConfig, SolvedMaze
 from maze_dataset.plotting import MazePlot
 from maze_dataset.plotting.plot_tokens import plot_colored_text
@@ -23,10 +23,18 @@ from maze_dataset.tokenization.util import coord_str_to_tuple_noneable
 
 # Utilities
 from muutils.json_serialize import SerializableDataclass, serializable_dataclass
+from muutils.mlutils import chunks
 
 from maze_transformer.evaluation.eval_model import predict_maze_paths
+from maze_transformer.mechinterp.maze_grid import (
+    NONCOORD_CELL,
+    maze_distance_grid,
+    project_to_grid,
+    token_grid_scatter_map,
+)
 from maze_transformer.tokenizer import SPECIAL_TOKENS
 from maze_transformer.training.config import ZanjHookedTransformer
+from maze_transformer.utils.padding import length_sorted_order
 
 
 @serializable_dataclass
@@ -49,71 +57,85 @@ class ProcessedMazeAttention(SerializableDataclass):
         n_mazes: int = 1,
         context_maze_only: bool = True,
         context_maze_fn: typing.Callable[[list[str]], list[str]] | None = None,
+        batch_size: int = 64,
     ) -> list["ProcessedMazeAttention"]:
-        outputs: list[ProcessedMazeAttention] = list()
+        """run the model on the first `n_mazes` mazes, in length-sorted chunks of `batch_size`
 
-        for i in range(n_mazes):
-            # get the maze from the dataset and process into tokens
-            solved_maze: SolvedMaze = dataset[i]
-            tokens: list[str] = solved_maze.as_tokens(
-                model.zanj_model_config.maze_tokenizer
-            )
-            tokens_context: list[str]
+        contexts in a chunk are left padded, and the padding is stripped again for each
+        maze, so results match running each maze on its own
+        """
+        n_layers: int = model.zanj_model_config.model_cfg.n_layers
+        n_heads: int = model.zanj_model_config.model_cfg.n_heads
+        pattern_names: list[str] = [
+            f"blocks.{layer}.attn.hook_pattern" for layer in range(n_layers)
+        ]
 
+        # get the mazes from the dataset and process into tokens
+        solved_mazes: list[SolvedMaze] = [dataset[i] for i in range(n_mazes)]
+        tokens_all: list[list[str]] = [
+            solved_maze.as_tokens(model.zanj_model_config.maze_tokenizer)
+            for solved_maze in solved_mazes
+        ]
+        tokens_context_all: list[list[str]] = list()
+        for tokens in tokens_all:
             if context_maze_only:
                 assert context_maze_fn is None
                 path_start_index: int = tokens.index(SPECIAL_TOKENS.PATH_END)
-                tokens_context = tokens[: path_start_index + 1]
+                tokens_context_all.append(tokens[: path_start_index + 1])
             else:
                 assert context_maze_fn is not None
-                tokens_context = context_maze_fn(tokens)
+                tokens_context_all.append(context_maze_fn(tokens))
 
+        outputs: list[ProcessedMazeAttention | None] = [None] * n_mazes
+        order, _ = length_sorted_order([len(t) for t in tokens_context_all])
+        for idxs_chunk in chunks(order, batch_size):
             # get the model's prediction and attention data
             with torch.no_grad():
                 # we have to join here, since otherwise run_with_cache assumes each token is a separate batch
-                logits, cache = model.run_with_cache(" ".join(tokens_context))
-
-            # filter and append to outputs
-            attention_data: dict[str, torch.Tensor] = {
-                k: w for k, w in cache.items() if "hook_pattern" in k
-            }
-
-            assert model.zanj_model_config.model_cfg.n_layers == len(attention_data)
-            example_attention_data: Float[
-                torch.Tensor, "1 n_heads n_positions n_positions"
-            ] = attention_data[list(attention_data.keys())[0]]
-            assert (
-                model.zanj_model_config.model_cfg.n_heads
-                == example_attention_data.shape[1]
-            )
-            n_tokens: int = example_attention_data.shape[2]
-
-            attention_tensored: Float[
-                torch.Tensor, "n_layers_heads n_tokens n_tokens"
-            ] = torch.concatenate(
-                [w for k, w in attention_data.items()],
-                dim=0,
-            ).reshape(
-                -1, n_tokens, n_tokens
+                logits, cache = model.run_with_cache(
+                    [" ".join(tokens_context_all[i]) for i in idxs_chunk],
+                    names_filter=lambda name: name in pattern_names,
+                )
+
+            patterns: Float[
+                torch.Tensor, "batch n_layers n_heads n_positions n_positions"
+            ] = torch.stack([cache[name] for name in pattern_names], dim=1)
+            assert patterns.shape[2] == n_heads
+            patterns_flat: Float[
+                torch.Tensor, "batch n_layers_heads n_positions n_positions"
+            ] = patterns.reshape(
+                patterns.shape[0], n_layers * n_heads, *patterns.shape[-2:]
             )
 
-            outputs.append(
-                ProcessedMazeAttention(
-                    input_maze=solved_maze,
-                    tokens=tokens,
-                    tokens_context=tokens_context,
-                    logits=logits,
-                    n_layers=model.zanj_model_config.model_cfg.n_layers,
-                    n_heads=model.zanj_model_config.model_cfg.n_heads,
-                    attention_dict=attention_data,
+            for j, i in enumerate(idxs_chunk):
+                # the model prepends a BOS token, and padding is on the left
+                n_tokens: int = len(tokens_context_all[i]) + 1
+                attention_tensored: Float[
+                    torch.Tensor, "n_layers_heads n_tokens n_tokens"
+                ] = patterns_flat[j, :, -n_tokens:, -n_tokens:].clone()
+                outputs[i] = ProcessedMazeAttention(
+                    input_maze=solved_mazes[i],
+                    tokens=tokens_all[i],
+                    tokens_context=tokens_context_all[i],
+                    logits=logits[j : j + 1, -n_tokens:].clone(),
+                    n_layers=n_layers,
+                    n_heads=n_heads,
+                    attention_dict={
+                        name: layer_pattern.unsqueeze(0)
+                        for name, layer_pattern in zip(
+                            pattern_names,
+                            attention_tensored.reshape(
+                                n_layers, n_heads, n_tokens, n_tokens
+                            ),
+                        )
+                    },
                     attention_tensored=attention_tensored,
                     attention_names=[
                         f"Layer {i} Head {j}"
-                        for i in range(model.zanj_model_config.model_cfg.n_layers)
-                        for j in range(model.zanj_model_config.model_cfg.n_heads)
+                        for i in range(n_layers)
+                        for j in range(n_heads)
                     ],
                 )
-            )
 
         return outputs
 
@@ -197,30 +219,25 @@ class ProcessedMazeAttention(SerializableDataclass):
             for i in range(self.n_layers)
         ]
 
-        for idx_attn, (name, attn) in enumerate(
-            zip(self.attention_names, self.attention_tensored)
-        ):
-            # --------------------------
-            # empty node values
-            node_values: Float[np.ndarray, "grid_n grid_n"] = np.zeros(
-                self.input_maze.grid_shape
+        # project the attention of every head onto the grid at once.
+        # as before, each token takes the summed attention of its query row.
+        # rows are offset by one from `tokens_context` because of the BOS token
+        n_tokens: int = len(self.tokens_context)
+        node_values_all: Float[np.ndarray, "n_layers_heads grid_n grid_n"] = (
+            project_to_grid(
+                self.attention_tensored[:, :n_tokens].sum(dim=-1),
+                token_grid_scatter_map(self.tokens_context, self.input_maze.grid_shape),
+                self.input_maze.grid_shape,
+            )
+        )
+        for idx_attn, node_values in enumerate(node_values_all):
+            # update MazePlot objects
+            mazeplots[idx_attn // self.n_heads][
+                idx_attn % self.n_heads
+            ].add_node_values(
+                node_values=node_values,
+                color_map=color_map,
             )
-            # get node values for each token
-            for idx_token, token in enumerate(self.tokens_context):
-                coord: CoordTup | None = coord_str_to_tuple_noneable(token)
-                if coord is not None:
-                    node_values[coord[0], coord[1]] += np.sum(
-                        attn[idx_token].cpu().numpy()
-                    )
-
-                # update MazePlot objects
-                mazeplots[idx_attn // self.n_heads][
-                    idx_attn % self.n_heads
-                ].add_node_values(
-                    node_values=node_values,
-                    color_map=color_map,
-                )
-            # --------------------------
 
         # create a shared figure
         fig, axs = plt.subplots(
@@ -254,17 +271,20 @@ def mazeplot_attention(
     cbar_height_factor: float = 0.97,
 ) -> tuple[MazePlot, plt.Figure, plt.Axes]:
     # storing attention
-    node_values: Float[np.ndarray, "grid_n grid_n"] = np.zeros(maze.grid_shape)
-    total_logits_nonpos = defaultdict(float)
-
+    n_tokens: int = len(tokens_context)
+    scatter_map: Int[np.ndarray, "n_tokens"] = token_grid_scatter_map(
+        tokens_context, maze.grid_shape
+    )
     # get node values for each token
-    for idx_token, token in enumerate(tokens_context):
-        coord: CoordTup | None = coord_str_to_tuple_noneable(token)
-        # TODO: mean/median instead of just sum?
-        if coord is not None:
-            node_values[coord[0], coord[1]] += np.sum(attention[idx_token])
-        else:
-            total_logits_nonpos[token] += attention[idx_token]
+    # TODO: mean/median instead of just sum?
+    node_values: Float[np.ndarray, "grid_n grid_n"] = project_to_grid(
+        np.asarray(attention[:n_tokens]).reshape(n_tokens, -1).sum(axis=1),
+        scatter_map,
+        maze.grid_shape,
+    )
+    total_logits_nonpos = defaultdict(float)
+    for idx_token in np.flatnonzero(scatter_map == NONCOORD_CELL):
+        total_logits_nonpos[tokens_context[idx_token]] += attention[idx_token]
 
     # MazePlot attentions
     if mazeplot is None:
@@ -398,41 +418,37 @@ def plot_attn_dist_correlation(
     attention_lst: list[Float[np.ndarray, "n_tokens"]] = [
         a[-len(c) :] for i, (c, a) in enumerate(zip(coords_context, attention))
     ]
-    # compute the distances
+    # compute the distances, `np.inf` for non-coord tokens (or if `tokens_dist_to` is not a coord)
     distances: list[Float[np.ndarray, "n_tokens"]] = list()
-    if respect_topology:
-        # convert context to maze, compute shortest path
-        mazes: list[SolvedMaze] = [
-            SolvedMaze.from_tokens(tokens, maze_tokenizer=tokenizer)
-            for tokens in tokens_context
-        ]
-        distances = [
-            np.array(
-                [
-                    (
-                        maze.find_shortest_path(coords_dist_to[idx], c).shape[0] - 1
-                        if not isinstance(c, str)
-                        else np.inf
-                    )
-                    for c in coords_context[idx]
-                ]
-            )
-            for idx, maze in enumerate(mazes)
-        ]
-    else:
-        distances = [
-            np.array(
-                [
-                    (
-                        np.sum(np.abs(np.array(coords_dist_to[idx]) - np.array(c)))
-                        if not isinstance(c, str)
-                        else np.inf
-                    )
-                    for c in coords_context[idx]
+    for idx, coords in enumerate(coords_context):
+        is_coord: np.ndarray = np.array(
+            [not isinstance(c, str) for c in coords], dtype=np.bool_
+        )
+        coords_arr: Int[np.ndarray, "n_tokens 2"] = np.zeros(
+            (len(coords), 2), dtype=np.int64
+        )
+        if is_coord.any():
+            coords_arr[is_coord] = [c for c in coords if not isinstance(c, str)]
+        dists: Float[np.ndarray, "n_tokens"] = np.full(len(coords), np.inf)
+
+        if not isinstance(coords_dist_to[idx], str):
+            if respect_topology:
+                # convert context to maze, compute all distances with one search
+                maze: SolvedMaze = SolvedMaze.from_tokens(
+                    tokens_context[idx], maze_tokenizer=tokenizer
+                )
+                dist_grid: Float[np.ndarray, "grid_n grid_n"] = maze_distance_grid(
+                    maze, coords_dist_to[idx]
+                )
+                dists[is_coord] = dist_grid[
+                    coords_arr[is_coord, 0], coords_arr[is_coord, 1]
                 ]
-            )
-            for idx in range(len(coords_context))
-        ]
+            else:
+                dists[is_coord] = np.abs(
+                    coords_arr[is_coord] - np.array(coords_dist_to[idx])
+                ).sum(axis=1)
+
+        distances.append(dists)
 
     # plot
     if ax is None:
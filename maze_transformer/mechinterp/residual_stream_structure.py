@@ -1,4 +1,8 @@
+import hashlib
 import itertools
+import json
+import typing
+import weakref
 from typing import NamedTuple
 
 import matplotlib.colors as mplcolors
@@ -7,7 +11,8 @@ import matplotlib.pyplot as plt
 # numerical
 import numpy as np
 import seaborn as sns
-from jaxtyping import Float
+from jaxtyping import Float, Int
+from matplotlib.collections import LineCollection
 
 # maze_dataset
 from maze_dataset.constants import _SPECIAL_TOKENS_ABBREVIATIONS
@@ -17,11 +22,25 @@ from maze_dataset.tokenization.util import strings_to_coords
 # scipy
 from scipy.spatial.distance import pdist, squareform
 from scipy.stats import pearsonr
-from sklearn.decomposition import PCA
+from sklearn.decomposition import PCA, IncrementalPCA
 
 # transformerlens
 from transformer_lens import HookedTransformer
 
+from maze_transformer.mechinterp.activation_capture import (
+    ActivationSpec,
+    iter_activation_chunks,
+)
+from maze_transformer.mechinterp.maze_grid import (
+    lattice_neighbor_pairs,
+    pairwise_to_grid,
+)
+from maze_transformer.mechinterp.pairwise_distances import (
+    is_supported_metric,
+    pairwise_distances_correlation,
+)
+from maze_transformer.training.config import ZanjHookedTransformer
+
 # from scipy.spatial.distance import cosine
 
 
@@ -85,7 +104,7 @@ EmbeddingsPCAResult = NamedTuple(
     "EmbeddingsPCAResult",
     result=np.ndarray,
     index_map=list[int] | None,
-    pca_obj=PCA,
+    pca_obj=PCA | IncrementalPCA,
 )
 
 
@@ -134,6 +153,152 @@ def compute_pca(
     )
 
 
+# cached results of `compute_residual_pca`, per model
+_RESIDUAL_PCA_CACHE: "weakref.WeakKeyDictionary[ZanjHookedTransformer, dict[tuple, dict[str, EmbeddingsPCAResult]]]" = (weakref.WeakKeyDictionary())
+
+
+def _residual_pca_key(
+    model: ZanjHookedTransformer,
+    prompts: list[list[str]],
+    hook_name: str,
+    n_components: int,
+) -> tuple:
+    """key of `compute_residual_pca` results for a model, invalidated when its weights change"""
+    prompts_digest: str = hashlib.sha256(json.dumps(prompts).encode()).hexdigest()
+    weights_version: tuple = tuple(
+        (p.data_ptr(), p._version) for p in model.parameters()
+    )
+    return (hook_name, n_components, prompts_digest, weights_version)
+
+
+class _BufferedIncrementalPCA:
+    """feeds `IncrementalPCA.partial_fit` batches of at least `n_components` samples
+
+    chunks are accumulated until they are large enough, and the last full batch is held
+    back so that the leftover samples at the end can be fit along with it
+    """
+
+    def __init__(self, n_components: int) -> None:
+        self.pca: IncrementalPCA = IncrementalPCA(n_components=n_components)
+        self._pending: list[np.ndarray] = list()
+        self._ready: np.ndarray | None = None
+
+    def add(self, x: Float[np.ndarray, "n d_model"]) -> None:
+        if x.shape[0] == 0:
+            return
+        self._pending.append(x)
+        if sum(p.shape[0] for p in self._pending) >= self.pca.n_components:
+            if self._ready is not None:
+                self.pca.partial_fit(self._ready)
+            self._ready = np.concatenate(self._pending, axis=0)
+            self._pending = list()
+
+    def finalize(self) -> IncrementalPCA:
+        remaining: list[np.ndarray] = (
+            [] if self._ready is None else [self._ready]
+        ) + self._pending
+        n_remaining: int = sum(p.shape[0] for p in remaining)
+        if n_remaining < self.pca.n_components:
+            raise ValueError(
+                f"need at least {self.pca.n_components = } samples, got {n_remaining}"
+            )
+        self.pca.partial_fit(np.concatenate(remaining, axis=0))
+        self._pending, self._ready = list(), None
+        return self.pca
+
+
+def compute_residual_pca(
+    model: ZanjHookedTransformer,
+    token_plotting_info: list[TokenPlottingInfo],
+    prompts: list[list[str]],
+    hook_name: str | None = None,
+    n_components: int = 10,
+    batch_size: int = 64,
+    use_cache: bool = True,
+) -> dict[str, EmbeddingsPCAResult]:
+    """PCA of the residual stream at every (non-padding, non-BOS) position of `prompts`
+
+    like `compute_pca`, but the samples are residual stream vectors at `hook_name`
+    (by default the output of the last layer) instead of the embedding matrix. there are
+    far too many of these to hold at once, so an `IncrementalPCA` is fit on activations
+    streamed in chunks, and the model is run a second time to transform them.
+
+    results have the same structure as `compute_pca`, so they can be passed to
+    `plot_pca_colored`: `result` is `(n_components, n_samples)`, and `index_map` gives the
+    token id at the position of each sample. results are cached per model (unless
+    `use_cache` is `False`, which leaves the cache untouched), and recomputed if the
+    weights, prompts, `hook_name` or `n_components` change.
+    """
+    if hook_name is None:
+        hook_name = f"blocks.{model.cfg.n_layers - 1}.hook_resid_post"
+
+    key: tuple | None = None
+    if use_cache:
+        key = _residual_pca_key(model, prompts, hook_name, n_components)
+        cached: dict[str, EmbeddingsPCAResult] | None = _RESIDUAL_PCA_CACHE.get(
+            model, dict()
+        ).get(key)
+        if cached is not None:
+            return cached
+
+    is_coord: np.ndarray = np.array(
+        [isinstance(tokinfo.coord, tuple) for tokinfo in token_plotting_info]
+    )
+    token_ids: list[np.ndarray] = [
+        np.array(model.zanj_model_config.maze_tokenizer.encode(p)) for p in prompts
+    ]
+    subset_masks: dict[str, typing.Callable[[np.ndarray], np.ndarray]] = dict(
+        all=lambda ids: np.ones_like(ids, dtype=bool),
+        coords_only=lambda ids: is_coord[ids],
+        special_only=lambda ids: ~is_coord[ids],
+    )
+    specs: list[ActivationSpec] = [ActivationSpec(hook_name)]
+
+    def iter_prompt_residuals() -> (
+        typing.Iterator[tuple[int, Float[np.ndarray, "n_tokens d_model"]]]
+    ):
+        for idxs_chunk, activations, _ in iter_activation_chunks(
+            model, prompts, specs, batch_size=batch_size
+        ):
+            resid: np.ndarray = activations[hook_name].numpy()
+            for row, idx in enumerate(idxs_chunk):
+                # prompts are left padded, and preceded by BOS
+                yield idx, resid[row, -len(prompts[idx]) :]
+
+    # fit, streaming chunks of activations
+    fitters: dict[str, _BufferedIncrementalPCA] = {
+        k: _BufferedIncrementalPCA(n_components) for k in subset_masks
+    }
+    for idx, resid in iter_prompt_residuals():
+        for k, mask_fn in subset_masks.items():
+            fitters[k].add(resid[mask_fn(token_ids[idx])])
+    pcas: dict[str, IncrementalPCA] = {k: f.finalize() for k, f in fitters.items()}
+
+    # transform, keeping only the projections
+    transformed: dict[str, dict[int, np.ndarray]] = {k: dict() for k in subset_masks}
+    for idx, resid in iter_prompt_residuals():
+        for k, mask_fn in subset_masks.items():
+            transformed[k][idx] = pcas[k].transform(resid[mask_fn(token_ids[idx])])
+
+    output: dict[str, EmbeddingsPCAResult] = {
+        k: EmbeddingsPCAResult(
+            result=np.concatenate(
+                [transformed[k][i] for i in range(len(prompts))], axis=0
+            ).T,
+            index_map=np.concatenate(
+                [ids[subset_masks[k](ids)] for ids in token_ids]
+            ).tolist(),
+            pca_obj=pcas[k],
+        )
+        for k in subset_masks
+    }
+
+    if use_cache:
+        _RESIDUAL_PCA_CACHE.setdefault(model, dict())[key] = output
+
+    return output
+
+
 def plot_pca_colored(
     pca_results_options: dict[str, EmbeddingsPCAResult],
     pca_results_key: str,
@@ -148,39 +313,38 @@ def plot_pca_colored(
     fig, ax = plt.subplots(figsize=(5, 5))
     pca_result: EmbeddingsPCAResult = pca_results_options[pca_results_key]
 
-    # Store lattice points for drawing connections
-    lattice_points: tuple[tuple[int, int], tuple[float, float]] = list()
+    # map indices if necessary
+    n_points: int = pca_result.result.shape[1]
+    points_xy: Float[np.ndarray, "n_points 2"] = np.stack(
+        [pca_result.result[dim1 - 1], pca_result.result[dim2 - 1]], axis=1
+    )
+    points_info: list[TokenPlottingInfo] = [
+        vocab_colors[i if pca_result.index_map is None else pca_result.index_map[i]]
+        for i in range(n_points)
+    ]
 
-    for i in range(pca_result.result.shape[1]):
-        # map index if necessary
-        if pca_result.index_map is not None:
-            i_map: int = pca_result.index_map[i]
-        else:
-            i_map = i
-        token, coord, color = vocab_colors[i_map]
-        # plot the point
-        ax.scatter(
-            pca_result.result[dim1 - 1, i],
-            pca_result.result[dim2 - 1, i],
-            alpha=0.5,
-            color=color,
-        )
+    # plot all the points at once
+    ax.scatter(
+        points_xy[:, 0],
+        points_xy[:, 1],
+        alpha=0.5,
+        color=[color for _, _, color in points_info],
+    )
+
+    # label special tokens with the abbreviated token name, and store lattice points for drawing connections
+    lattice_coords: list[tuple[int, int]] = list()
+    lattice_xy: list[Float[np.ndarray, "2"]] = list()
+    for (token, coord, color), xy in zip(points_info, points_xy):
         if isinstance(coord, str):
-            # label with the abbreviated token name
             ax.text(
-                pca_result.result[dim1 - 1, i],
-                pca_result.result[dim2 - 1, i],
+                xy[0],
+                xy[1],
                 _SPECIAL_TOKENS_ABBREVIATIONS[coord],
                 fontsize=8,
             )
         else:
-            # add to the lattice points list for later
-            lattice_points.append(
-                (
-                    coord,
-                    (pca_result.result[dim1 - 1, i], pca_result.result[dim2 - 1, i]),
-                )
-            )
+            lattice_coords.append(coord)
+            lattice_xy.append(xy)
 
     if axes_and_centered:
         # find x and y limits
@@ -193,20 +357,33 @@ def plot_pca_colored(
         ax.plot([-xbound, xbound], [0, 0], color="black", alpha=0.5, linewidth=0.5)
         ax.plot([0, 0], [-ybound, ybound], color="black", alpha=0.5, linewidth=0.5)
 
-    # add lattice connections
-    if lattice_connections:
-        for (i, j), (x, y) in lattice_points:
-            for (i2, j2), (x2, y2) in lattice_points:
-                # manhattan distance of 1
-                if np.linalg.norm(np.array([i, j]) - np.array([i2, j2]), ord=1) == 1:
-                    # plot a line between the two points
-                    ax.plot(
-                        [x, x2],
-                        [y, y2],
-                        color="red",
-                        alpha=0.2,
-                        linewidth=0.5,
-                    )
+    # add lattice connections, between points with coordinates at manhattan distance 1
+    if lattice_connections and len(lattice_coords) > 0:
+        # if a coordinate appears more than once (as in residual stream PCA), connect its mean position
+        unique_coords, coord_inverse = np.unique(
+            np.array(lattice_coords), axis=0, return_inverse=True
+        )
+        coord_inverse = coord_inverse.reshape(-1)
+        coord_counts: Int[np.ndarray, "n_coords"] = np.bincount(coord_inverse)
+        coord_xy: Float[np.ndarray, "n_coords 2"] = np.stack(
+            [
+                np.bincount(coord_inverse, weights=np.array(lattice_xy)[:, k])
+                / coord_counts
+                for k in range(2)
+            ],
+            axis=1,
+        )
+        neighbor_pairs: Int[np.ndarray, "n_pairs 2"] = lattice_neighbor_pairs(
+            unique_coords
+        )
+        ax.add_collection(
+            LineCollection(
+                coord_xy[neighbor_pairs],
+                colors="red",
+                alpha=0.2,
+                linewidths=0.5,
+            )
+        )
 
     ax.set_xlabel(f"PC{dim1}")
     ax.set_ylabel(f"PC{dim2}")
@@ -221,49 +398,53 @@ def plot_pca_colored(
     return fig, ax
 
 
-def abs_dot_product(u, v):
-    return np.abs(np.dot(u, v))
-
-
 def compute_distances_and_correlation(
     embedding_matrix: Float[np.ndarray, "d_vocab d_model"],
     tokenizer: MazeTokenizer,
     embedding_metric: str = "cosine",
     coordinate_metric: str = "euclidean",
     show: bool = True,
+    device: str = "cpu",
 ) -> dict:
-    """embedding distances passed to pdist from scipy"""
-
-    coord_tokens_ids: dict[str, int] = tokenizer.coordinate_tokens_ids
-    coord_embeddings: Float[np.ndarray, "n_coord_tokens d_model"] = np.array(
-        [embedding_matrix[v] for v in coord_tokens_ids.values()]
-    )
-
-    if embedding_metric in ("dot", "abs_dot"):
-        embedding_metric = abs_dot_product
+    """pairwise distances between coordinate token embeddings, and their correlation with distances between the coordinates
 
-    # Calculate the pairwise distances in embedding space
-    embedding_distances: Float[np.ndarray, "n_coord_tokens d_model"] = pdist(
-        coord_embeddings,
-        metric=embedding_metric,
-    )
-    # normalize the distance by the maximum distance
-    # embedding_distances /= embedding_distances.max()
+    metrics supported by `pairwise_distances_correlation` (`"dot"` is the absolute dot
+    product) are computed in chunks with torch, any other metric accepted by scipy's
+    `pdist` (including callables) falls back to `pdist` and `pearsonr`
+    """
 
-    # Convert the distances to a square matrix
-    embedding_distances_matrix: Float[np.ndarray, "n_coord_tokens n_coord_tokens"] = (
-        squareform(embedding_distances)
-    )
+    coord_tokens_ids: dict[str, int] = tokenizer.coordinate_tokens_ids
+    coord_embeddings: Float[np.ndarray, "n_coord_tokens d_model"] = np.asarray(
+        embedding_matrix
+    )[list(coord_tokens_ids.values())]
 
-    # Calculate the correlation between the embedding and coordinate distances
     coordinate_coordinates: Float[np.ndarray, "n_coord_tokens 2"] = np.array(
         list(tokenizer.coordinate_tokens_coords.keys())
     )
-    coordinate_distances = pdist(
-        coordinate_coordinates,
-        metric=coordinate_metric,
-    )
-    correlation, corr_pval = pearsonr(embedding_distances, coordinate_distances)
+
+    embedding_distances_matrix: Float[np.ndarray, "n_coord_tokens n_coord_tokens"]
+    if is_supported_metric(embedding_metric) and is_supported_metric(coordinate_metric):
+        # pairwise distances in embedding space as a square matrix, and the correlation
+        # with the distances between coordinates, in a single pass
+        embedding_distances_matrix, correlation, corr_pval = (
+            pairwise_distances_correlation(
+                coord_embeddings,
+                metric=embedding_metric,
+                compare_to=coordinate_coordinates,
+                compare_metric=coordinate_metric,
+                output="square",
+                device=device,
+            )
+        )
+    else:
+        embedding_distances: Float[np.ndarray, "n_pairs"] = pdist(
+            coord_embeddings, metric=embedding_metric
+        )
+        embedding_distances_matrix = squareform(embedding_distances)
+        coordinate_distances: Float[np.ndarray, "n_pairs"] = pdist(
+            coordinate_coordinates, metric=coordinate_metric
+        )
+        correlation, corr_pval = pearsonr(embedding_distances, coordinate_distances)
 
     return dict(
         embedding_distances_matrix=embedding_distances_matrix,
@@ -316,25 +497,11 @@ def compute_grid_distances(
     tokenizer: MazeTokenizer,
 ) -> Float[np.ndarray, "n n n n"]:
     n: int = tokenizer.max_grid_size
-    grid_distances: Float[np.ndarray, "n n n n"] = np.full((n, n, n, n), np.nan)
-
-    for idx, ((x, y), token_id) in enumerate(
-        tokenizer.coordinate_tokens_coords.items()
-    ):
-        # Extract distances for this particular token from the distance matrix
-        distances: Float[np.ndarray, "n_coord_tokens"] = embedding_distances_matrix[
-            idx, :
-        ]
-
-        # get distances
-        for (x2, y2), distance in zip(
-            tokenizer.coordinate_tokens_coords.keys(), distances
-        ):
-            grid_distances[x, y, x2, y2] = distance
-        # coords = np.array(list(tokenizer.coordinate_tokens_coords.keys()))
-        # grid_distances[x, y, coords[:, 0], coords[:, 1]] = distances
+    coords: Int[np.ndarray, "n_coord_tokens 2"] = np.array(
+        list(tokenizer.coordinate_tokens_coords.keys())
+    )
 
-    return grid_distances
+    return pairwise_to_grid(embedding_distances_matrix, coords, (n, n))
 
 
 def plot_distance_grid(
@@ -350,8 +517,8 @@ def plot_distance_grid(
 
     # remove the self distances
     if ignore_self_distances:
-        for i, j in itertools.product(range(n), range(n)):
-            grid_distances[i, j, i, j] = np.nan
+        rows, cols = np.indices((n, n))
+        grid_distances[rows, cols, rows, cols] = np.nan
 
     if vbounds is None:
         # calculate bounds ignoring nans
@@ -400,8 +567,8 @@ def plot_distance_subgrid(
 
     # remove the self distances
     if ignore_self_distances:
-        for i, j in itertools.product(range(n), range(n)):
-            grid_distances[i, j, i, j] = np.nan
+        rows, cols = np.indices((n, n))
+        grid_distances[rows, cols, rows, cols] = np.nan
 
     subgrid_shape = (min(shape[0], n), min(shape[1], n))
 
@@ -464,9 +631,6 @@ def plot_distance_correlation(
     n_coord_tokens: int = n**2
     n_dists: int = ((n_coord_tokens) ** 2 - n_coord_tokens) / 2
 
-    # Initialize lists to store distances
-    embedding_distances: list[float] = []
-
     # Create an array of points to be used with pdist
     points: Float[np.ndarray, "n_coord_tokens 2"] = np.array(
         list(itertools.product(range(n), range(n)))
@@ -477,14 +641,12 @@ def plot_distance_correlation(
     )
     assert pdist_distances.shape == (n_dists,)
 
-    # Calculate distances in the embedding space using itertools for unique pairs
-    for idx1, idx2 in zip(*np.triu_indices(len(points), k=1)):
-        x1, y1 = points[idx1]
-        x2, y2 = points[idx2]
-        embedding_distances.append(distance_grid[x1, y1, x2, y2])
-
-    embedding_distances_np: Float[np.ndarray, "n_dists"] = np.array(embedding_distances)
-    assert embedding_distances_np.shape == (n_dists,)
+    # distances in the embedding space for unique pairs, in the same order as pdist
+    idx1, idx2 = np.triu_indices(len(points), k=1)
+    embedding_distances: Float[np.ndarray, "n_dists"] = distance_grid[
+        points[idx1, 0], points[idx1, 1], points[idx2, 0], points[idx2, 1]
+    ]
+    assert embedding_distances.shape == (n_dists,)
 
     ax = sns.boxplot(
         x=pdist_distances,
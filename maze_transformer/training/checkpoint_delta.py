@@ -0,0 +1,256 @@
+"""checkpoints stored as a delta against a periodic full "keyframe" checkpoint
+
+with `TrainConfig.checkpoint_delta_cfg` set, `train()` saves every `keyframe_every`-th
+checkpoint in full, and the checkpoints in between as the same zanj archive but with the
+state dict replaced by its difference from the most recent keyframe:
+
+- with `quantize_bits = None`, the delta is the bitwise xor of the raw weights, which is
+  lossless and (since weights change slowly, so sign and exponent bits mostly cancel)
+  compresses well in the deflated archive
+- with `quantize_bits` of 8 or 16, the delta is `current - keyframe`, quantized per tensor
+  to signed integers of that width. the error is at most half a quantization step, and
+  does not accumulate since every delta is taken against the keyframe itself
+
+reading a delta checkpoint with `ZanjHookedTransformer.read` reconstructs the full state
+dict transparently, through the zanj loader handler registered here. keyframes are found
+relative to the directory of the delta checkpoint, and are checked against their hash.
+
+since a delta checkpoint is unreadable without its keyframe, `train()` only uploads
+keyframes (and the final model) to wandb, and records the keyframe of each delta in the
+run's `CheckpointIndex`, so that pruning checkpoints can keep the keyframes still needed.
+"""
+
+import functools
+import os
+import typing
+from pathlib import Path
+
+import torch
+from zanj import ZANJ
+from zanj.loading import (
+    LoadedZANJ,
+    LoaderHandler,
+    load_item_recursive,
+    register_loader_handler,
+)
+
+from maze_transformer.utils.file_hash import file_sha256
+
+CHECKPOINT_DELTA_FORMAT: str = "maze_transformer.checkpoint_delta"
+
+# key in `ZANJ.custom_settings` for the directory keyframe paths are relative to
+CHECKPOINT_DELTA_DIR_SETTING: str = "checkpoint_delta_dir"
+
+# defaults for the keys of `TrainConfig.checkpoint_delta_cfg`
+CHECKPOINT_DELTA_CFG_DEFAULTS: dict[str, typing.Any] = dict(
+    keyframe_every=5,
+    quantize_bits=None,
+)
+
+_QUANTIZED_DTYPES: dict[int, torch.dtype] = {8: torch.int8, 16: torch.int16}
+_BITS_DTYPES: dict[int, torch.dtype] = {
+    1: torch.int8,
+    2: torch.int16,
+    4: torch.int32,
+    8: torch.int64,
+}
+
+
+def _as_bits(tensor: torch.Tensor) -> torch.Tensor:
+    """view a tensor as integers of the same width, so it can be xor-ed"""
+    if tensor.dtype.is_floating_point:
+        return tensor.view(_BITS_DTYPES[tensor.element_size()])
+    return tensor
+
+
+def encode_delta(
+    state_dict: dict[str, torch.Tensor],
+    keyframe_state_dict: dict[str, torch.Tensor],
+    quantize_bits: int | None = None,
+) -> dict[str, typing.Any]:
+    """delta of `state_dict` against `keyframe_state_dict`, see module docstring"""
+    assert (
+        state_dict.keys() == keyframe_state_dict.keys()
+    ), f"keyframe has different keys: {set(state_dict) ^ set(keyframe_state_dict)}"
+    if quantize_bits is not None and quantize_bits not in _QUANTIZED_DTYPES:
+        raise ValueError(
+            f"{quantize_bits = } not supported, expected one of {list(_QUANTIZED_DTYPES)} or None"
+        )
+
+    deltas: dict[str, torch.Tensor] = dict()
+    scales: dict[str, float] = dict()
+    for key, value in state_dict.items():
+        value = value.detach().cpu()
+        keyframe_value: torch.Tensor = keyframe_state_dict[key].detach().cpu()
+        assert (
+            value.shape == keyframe_value.shape and value.dtype == keyframe_value.dtype
+        ), f"keyframe mismatch for {key}: {value.shape = } {value.dtype = }, {keyframe_value.shape = } {keyframe_value.dtype = }"
+
+        if quantize_bits is not None and value.dtype.is_floating_point:
+            diff: torch.Tensor = value.double() - keyframe_value.double()
+            q_max: int = 2 ** (quantize_bits - 1) - 1
+            scale: float = diff.abs().max().item() / q_max if diff.numel() else 0.0
+            deltas[key] = (
+                (diff / scale).round().to(_QUANTIZED_DTYPES[quantize_bits])
+                if scale > 0
+                else torch.zeros_like(value, dtype=_QUANTIZED_DTYPES[quantize_bits])
+            )
+            scales[key] = scale
+        else:
+            deltas[key] = torch.bitwise_xor(_as_bits(value), _as_bits(keyframe_value))
+
+    return dict(deltas=deltas, scales=scales)
+
+
+def decode_delta(
+    deltas: dict[str, torch.Tensor],
+    scales: dict[str, float],
+    keyframe_state_dict: dict[str, torch.Tensor],
+) -> dict[str, torch.Tensor]:
+    """inverse of `encode_delta`"""
+    state_dict: dict[str, torch.Tensor] = dict()
+    for key, delta in deltas.items():
+        keyframe_value: torch.Tensor = keyframe_state_dict[key]
+        if key in scales:
+            state_dict[key] = (
+                keyframe_value.double() + delta.double() * scales[key]
+            ).to(keyframe_value.dtype)
+        else:
+            state_dict[key] = torch.bitwise_xor(
+                _as_bits(keyframe_value), delta.to(_as_bits(keyframe_value).dtype)
+            ).view(keyframe_value.dtype)
+    return state_dict
+
+
+@functools.lru_cache(maxsize=2)
+def _read_keyframe_cached(
+    path: str, mtime_ns: int, size: int
+) -> tuple[str, dict[str, torch.Tensor]]:
+    zanj: ZANJ = ZANJ()
+    loaded: LoadedZANJ = LoadedZANJ(path=path, zanj=zanj)
+    loaded.populate_externals()
+    state_dict: dict[str, torch.Tensor] = load_item_recursive(
+        loaded._json_data["state_dict"], ("state_dict",), zanj
+    )
+    return file_sha256(Path(path)), state_dict
+
+
+def read_keyframe_state_dict(path: str | Path) -> tuple[str, dict[str, torch.Tensor]]:
+    """`(sha256, state dict)` of a full checkpoint, as saved (no weight processing)
+
+    the two most recently read keyframes are cached, keyed by path and mtime, since reading
+    a run's checkpoints in order reads the same keyframe repeatedly. the returned tensors
+    are shared, and must not be modified in place.
+    """
+    path = Path(path).resolve()
+    stat: os.stat_result = path.stat()
+    return _read_keyframe_cached(path.as_posix(), stat.st_mtime_ns, stat.st_size)
+
+
+def _load_checkpoint_delta(
+    json_item: dict,
+    path: tuple,
+    zanj: ZANJ | None = None,
+) -> dict[str, torch.Tensor]:
+    base_dir: Path = Path(
+        (zanj.custom_settings if zanj is not None else dict()).get(
+            CHECKPOINT_DELTA_DIR_SETTING, "."
+        )
+    )
+    keyframe_path: Path = base_dir / json_item["keyframe"]
+    if not keyframe_path.is_file():
+        raise FileNotFoundError(
+            f"keyframe {keyframe_path} of delta checkpoint not found. "
+            "read delta checkpoints with `ZanjHookedTransformer.read`, so keyframes are found relative to the checkpoint"
+        )
+    keyframe_sha256, keyframe_state_dict = read_keyframe_state_dict(keyframe_path)
+    if keyframe_sha256 != json_item["keyframe_sha256"]:
+        raise ValueError(
+            f"keyframe {keyframe_path} has changed since the delta checkpoint was saved: "
+            f"{keyframe_sha256 = }, expected {json_item['keyframe_sha256']}"
+        )
+
+    deltas: dict[str, torch.Tensor] = load_item_recursive(
+        json_item["deltas"], tuple(path) + ("deltas",), zanj
+    )
+    return decode_delta(
+        deltas={k: torch.as_tensor(v) for k, v in deltas.items()},
+        scales=json_item["scales"],
+        keyframe_state_dict=keyframe_state_dict,
+    )
+
+
+register_loader_handler(
+    LoaderHandler(
+        check=lambda json_item, path=None, z=None: (  # type: ignore[misc]
+            isinstance(json_item, typing.Mapping)
+            and json_item.get("__format__", None) == CHECKPOINT_DELTA_FORMAT
+        ),
+        load=_load_checkpoint_delta,
+        uid=CHECKPOINT_DELTA_FORMAT,
+        source_pckg="maze_transformer",
+        desc="state dict stored as a delta against a keyframe checkpoint",
+    )
+)
+
+
+class DeltaCheckpointer:
+    """saves the checkpoints of a training run as keyframes and deltas
+
+    `checkpoint_delta_cfg` is `TrainConfig.checkpoint_delta_cfg`, with missing keys taken
+    from `CHECKPOINT_DELTA_CFG_DEFAULTS`. the state dict of the most recent keyframe is
+    kept in memory (on cpu) to compute deltas against.
+    """
+
+    def __init__(
+        self,
+        checkpoint_delta_cfg: dict[str, typing.Any],
+        zanj: ZANJ | None = None,
+    ) -> None:
+        cfg: dict[str, typing.Any] = {
+            **CHECKPOINT_DELTA_CFG_DEFAULTS,
+            **checkpoint_delta_cfg,
+        }
+        self.keyframe_every: int = cfg["keyframe_every"]
+        self.quantize_bits: int | None = cfg["quantize_bits"]
+        assert self.keyframe_every >= 1, f"{self.keyframe_every = } must be at least 1"
+        self.zanj: ZANJ = zanj if zanj is not None else ZANJ()
+        self.n_saved: int = 0
+        self._keyframe_path: Path | None = None
+        self._keyframe_sha256: str | None = None
+        self._keyframe_state_dict: dict[str, torch.Tensor] | None = None
+
+    @property
+    def keyframe_path(self) -> Path | None:
+        """path of the most recent keyframe, against which new deltas are stored"""
+        return self._keyframe_path
+
+    def save(self, model: torch.nn.Module, file_path: str | Path) -> bool:
+        """save a checkpoint, returning whether it was saved as a (full) keyframe"""
+        file_path = Path(file_path)
+        is_keyframe: bool = self.n_saved % self.keyframe_every == 0
+        self.n_saved += 1
+
+        if is_keyframe:
+            self.zanj.save(model, file_path)
+            self._keyframe_path = file_path
+            self._keyframe_sha256 = file_sha256(file_path)
+            self._keyframe_state_dict = {
+                k: v.detach().cpu().clone() for k, v in model.state_dict().items()
+            }
+            return True
+
+        obj: dict[str, typing.Any] = model.serialize(zanj=self.zanj)
+        obj["state_dict"] = dict(
+            __format__=CHECKPOINT_DELTA_FORMAT,
+            keyframe=Path(
+                os.path.relpath(self._keyframe_path, file_path.parent)
+            ).as_posix(),
+            keyframe_sha256=self._keyframe_sha256,
+            quantize_bits=self.quantize_bits,
+            **encode_delta(
+                model.state_dict(), self._keyframe_state_dict, self.quantize_bits
+            ),
+        )
+        self.zanj.save(obj, file_path)
+        return False
@@ -0,0 +1,179 @@
+"""index of the checkpoints saved in a training run directory
+
+`train()` keeps a json file (`TRAIN_SAVE_FILES.checkpoint_index`) in the run directory,
+rewritten at every checkpoint, which lists the iteration, path, size and content hash of
+each saved model along with whichever metrics were computed at that iteration (and, for
+delta checkpoints, the keyframe they depend on, see `checkpoint_delta`). listing
+and selecting the checkpoints of a run is then a single read of this file, rather than a
+directory listing (slow on network filesystems, and for many runs). runs without an index
+fall back to globbing the checkpoints directory.
+"""
+
+import json
+import os
+import typing
+from pathlib import Path
+
+from muutils.mlutils import get_checkpoint_paths_for_run
+from muutils.statcounter import StatCounter
+
+from maze_transformer.training.train_save_files import TRAIN_SAVE_FILES
+from maze_transformer.utils.file_hash import file_sha256
+
+CHECKPOINT_INDEX_FORMAT: str = "checkpoint_index_v1"
+
+# metric values as stored in the index: `StatCounter`s are stored as their summary
+IndexedMetric = float | int | dict[str, float | int]
+
+
+def _index_metrics(
+    metrics: dict[str, int | float | StatCounter] | None,
+) -> dict[str, IndexedMetric]:
+    if metrics is None:
+        return dict()
+    return {
+        key: value.summary() if isinstance(value, StatCounter) else float(value)
+        for key, value in metrics.items()
+    }
+
+
+class CheckpointIndexEntry(typing.NamedTuple):
+    iteration: int
+    path: str  # relative to the run directory
+    size: int
+    sha256: str
+    metrics: dict[str, IndexedMetric]
+    keyframe: str | None = None  # relative to the run directory, for delta checkpoints
+
+
+class CheckpointIndex:
+    """checkpoints of a training run, see module docstring
+
+    - `checkpoints` are sorted by iteration, with at most one entry per iteration
+    - `final` is the model saved at the end of training, if training has finished
+    """
+
+    def __init__(
+        self,
+        run_dir: str | Path,
+        config_holder: str = TRAIN_SAVE_FILES.config_holder,
+        checkpoints: list[CheckpointIndexEntry] | None = None,
+        final: CheckpointIndexEntry | None = None,
+    ) -> None:
+        self.run_dir: Path = Path(run_dir)
+        self.config_holder: str = config_holder
+        self.checkpoints: list[CheckpointIndexEntry] = sorted(
+            checkpoints or [], key=lambda e: e.iteration
+        )
+        self.final: CheckpointIndexEntry | None = final
+
+    @property
+    def path(self) -> Path:
+        return self.run_dir / TRAIN_SAVE_FILES.checkpoint_index
+
+    @property
+    def config_path(self) -> Path:
+        return self.run_dir / self.config_holder
+
+    def add(
+        self,
+        iteration: int,
+        model_path: str | Path,
+        metrics: dict[str, int | float | StatCounter] | None = None,
+        final: bool = False,
+        keyframe_path: str | Path | None = None,
+    ) -> CheckpointIndexEntry:
+        """record a saved model, replacing any previous entry for the same iteration
+
+        `keyframe_path` is the keyframe of `model_path`, if it was saved as a delta
+        """
+        model_path = Path(model_path)
+        entry: CheckpointIndexEntry = CheckpointIndexEntry(
+            iteration=int(iteration),
+            path=Path(os.path.relpath(model_path, self.run_dir)).as_posix(),
+            size=model_path.stat().st_size,
+            sha256=file_sha256(model_path),
+            metrics=_index_metrics(metrics),
+            keyframe=(
+                Path(os.path.relpath(keyframe_path, self.run_dir)).as_posix()
+                if keyframe_path is not None
+                else None
+            ),
+        )
+        if final:
+            self.final = entry
+        else:
+            self.checkpoints = sorted(
+                [e for e in self.checkpoints if e.iteration != entry.iteration]
+                + [entry],
+                key=lambda e: e.iteration,
+            )
+        return entry
+
+    def checkpoint_paths(self) -> list[tuple[int, Path]]:
+        """`(iteration, path)` for every checkpoint, sorted by iteration"""
+        return [(e.iteration, self.run_dir / e.path) for e in self.checkpoints]
+
+    def serialize(self) -> dict:
+        return dict(
+            format=CHECKPOINT_INDEX_FORMAT,
+            config_holder=self.config_holder,
+            checkpoints=[e._asdict() for e in self.checkpoints],
+            final=self.final._asdict() if self.final is not None else None,
+        )
+
+    @classmethod
+    def load(cls, data: dict, run_dir: str | Path) -> "CheckpointIndex":
+        assert (
+            data["format"] == CHECKPOINT_INDEX_FORMAT
+        ), f"unknown checkpoint index format {data['format']!r}"
+        return cls(
+            run_dir=run_dir,
+            config_holder=data["config_holder"],
+            checkpoints=[CheckpointIndexEntry(**e) for e in data["checkpoints"]],
+            final=(
+                CheckpointIndexEntry(**data["final"])
+                if data["final"] is not None
+                else None
+            ),
+        )
+
+    def save(self) -> Path:
+        """write the index, atomically so that readers never see a partial file"""
+        tmp_path: Path = self.path.with_name(f"{self.path.name}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.serialize(), f, indent="\t")
+        os.replace(tmp_path, self.path)
+        return self.path
+
+    @classmethod
+    def read(cls, run_dir: str | Path) -> "CheckpointIndex | None":
+        """the index of the run in `run_dir`, or `None` if it has none"""
+        run_dir = Path(run_dir)
+        try:
+            with open(run_dir / TRAIN_SAVE_FILES.checkpoint_index, "r") as f:
+                data: dict = json.load(f)
+        except FileNotFoundError:
+            return None
+        return cls.load(data, run_dir)
+
+
+def get_checkpoint_paths(
+    run_dir: str | Path,
+    extension: typing.Literal["pt", "zanj"] = "zanj",
+) -> list[tuple[int, Path]]:
+    """`(iteration, path)` of the checkpoints of a run, sorted by iteration
+
+    read from the run's `CheckpointIndex` if it has one, otherwise found by globbing the
+    checkpoints directory
+    """
+    index: CheckpointIndex | None = CheckpointIndex.read(run_dir)
+    if index is not None:
+        return [
+            (iteration, path)
+            for iteration, path in index.checkpoint_paths()
+            if path.suffix == f".{extension}"
+        ]
+    return sorted(
+        get_checkpoint_paths_for_run(Path(run_dir), extension), key=lambda x: x[0]
+    )
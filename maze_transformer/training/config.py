@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import copy
 import json
 import typing
 import warnings
@@ -22,10 +23,13 @@ from muutils.tensor_utils import TORCH_OPTIMIZERS_MAP  # type: ignore[import]
 from transformer_lens import HookedTransformer  # type: ignore[import]
 from transformer_lens import HookedTransformerConfig
 from transformers import PreTrainedTokenizer
+from zanj import ZANJ
 from zanj.loading import load_item_recursive
 from zanj.torchutil import ConfiguredModel, set_config_class
 
 from maze_transformer.tokenizer import HuggingMazeTokenizer
+from maze_transformer.training.checkpoint_delta import CHECKPOINT_DELTA_DIR_SETTING
+from maze_transformer.utils.zanj_mmap import read_zanj_mmap
 
 
 # TODO: replace with muutils
@@ -181,6 +185,11 @@ class TrainConfig(SerializableDataclass):
         loading_fn=lambda data: data.get("intervals_count", None),
     )
 
+    checkpoint_delta_cfg: dict[str, Any] | None = serializable_field(
+        default=None,
+        loading_fn=lambda data: data.get("checkpoint_delta_cfg", None),
+    )
+
     def get_intervals(
         self,
         dataset_n_samples: int | None = None,
@@ -519,6 +528,12 @@ class ConfigHolder(SerializableDataclass):
             positional_embedding_type=self.model_cfg.positional_embedding_type,
             n_ctx=self.dataset_cfg.seq_len_max,
             d_vocab=self.maze_tokenizer.vocab_size,
+            # models saved with folded layernorms have no layernorm weights
+            normalization_type=(
+                "LNPre"
+                if self.model_cfg.weight_processing["are_layernorms_folded"]
+                else "LN"
+            ),
         )
 
     def transformer_config(self) -> HookedTransformerConfig:
@@ -643,10 +658,39 @@ class ZanjHookedTransformer(ConfiguredModel[ConfigHolder], HookedTransformer):
                 "tokenizer is not a HuggingMazeTokenizer, so we can't apply overrides. this might break padding and your whole model"
             )
 
+        # see `vocab_residual_directions()`
+        self._vocab_residual_directions: tuple[tuple, torch.Tensor] | None = None
+
     @property
     def config(self) -> ConfigHolder:
         return self.zanj_model_config
 
+    def _unembed_weights_version(self) -> tuple:
+        """changes whenever `W_U` is modified in place (optimizer step, `load_state_dict`) or replaced (`.to()`, weight processing)"""
+        W_U: torch.Tensor = self.W_U
+        return (W_U.data_ptr(), W_U._version, W_U.device, W_U.dtype, W_U.shape)
+
+    def vocab_residual_directions(self) -> torch.Tensor:
+        """residual stream direction of every token in the tokenizer vocab, shape `(d_vocab, d_model)`
+
+        same as `tokens_to_residual_directions(torch.arange(d_vocab))`, but computed lazily
+        and cached until the unembedding weights change. the returned tensor is detached,
+        and shared between calls -- do not modify it in place
+        """
+        version: tuple = self._unembed_weights_version()
+        if (
+            self._vocab_residual_directions is None
+            or self._vocab_residual_directions[0] != version
+        ):
+            d_vocab: int = self.zanj_model_config.maze_tokenizer.vocab_size
+            with torch.no_grad():
+                directions: torch.Tensor = (
+                    self.W_U[:, :d_vocab].T.detach().clone().contiguous()
+                )
+            self._vocab_residual_directions = (version, directions)
+
+        return self._vocab_residual_directions[1]
+
     def _load_state_dict_wrapper(
         self,
         state_dict: dict[str, Any],
@@ -658,6 +702,9 @@ class ZanjHookedTransformer(ConfiguredModel[ConfigHolder], HookedTransformer):
         - `recover_exact = False` disables `center_writing_weights` and `center_unembed` if set to true
         - `fold_ln = False` folds the layernorms if set to true
         - `refactor_factored_attn_matrices = False` refactors the factored attention matrices if set to true, this might cause accuracy issues according to @valedan
+        - `skip_processing = False` if set to true, and the saved `weight_processing` flags say the weights
+          are already processed (and no further processing is requested), copy the state dict in as-is
+          instead of processing it again
 
         """
 
@@ -666,6 +713,7 @@ class ZanjHookedTransformer(ConfiguredModel[ConfigHolder], HookedTransformer):
         refactor_factored_attn_matrices: bool = kwargs.get(
             "refactor_factored_attn_matrices", False
         )
+        skip_processing: bool = kwargs.get("skip_processing", False)
 
         if (
             self.zanj_model_config.model_cfg.weight_processing["are_layernorms_folded"]
@@ -680,6 +728,28 @@ class ZanjHookedTransformer(ConfiguredModel[ConfigHolder], HookedTransformer):
                 "Can't recover exact weights if the layernorm is to be folded, or the attention matrices are to be refactored\n{kwargs = }"
             )
 
+        if (
+            skip_processing
+            and self.zanj_model_config.model_cfg.weight_processing[
+                "are_weights_processed"
+            ]
+            and not (recover_exact or fold_ln or refactor_factored_attn_matrices)
+        ):
+            # centering and folding value biases again would not change the weights,
+            # and missing layernorm weights (if folded) are filled in as in `load_and_process_state_dict`
+            incompatible = self.load_state_dict(
+                self.fill_missing_keys(state_dict), strict=False
+            )
+            if incompatible.missing_keys or incompatible.unexpected_keys:
+                raise ValueError(
+                    "state dict does not match the model, its `weight_processing` flags might be wrong: "
+                    f"{self.zanj_model_config.model_cfg.weight_processing = }\n"
+                    f"{incompatible.missing_keys = }\n{incompatible.unexpected_keys = }"
+                )
+            self.setup()
+            self.eval()
+            return
+
         self.zanj_model_config.model_cfg.weight_processing["are_layernorms_folded"] = (
             self.zanj_model_config.model_cfg.weight_processing["are_layernorms_folded"]
             or fold_ln
@@ -710,3 +780,84 @@ class ZanjHookedTransformer(ConfiguredModel[ConfigHolder], HookedTransformer):
         )
         self.setup()  # Re-attach layernorm hooks by calling setup
         self.eval()
+
+    def export_processed(
+        self,
+        file_path: str | Path,
+        fold_ln: bool = True,
+        compress: bool = False,
+    ) -> Path:
+        """save a copy of this model with its weights already processed (centered, and layernorms folded if `fold_ln`)
+
+        the `weight_processing` flags of the saved config record this, so
+        `ZanjHookedTransformer.read(file_path, mmap=True, skip_processing=True)` copies the
+        tensors straight into the model. the archive is uncompressed by default, so that
+        they can be memory-mapped. this model is not modified.
+        """
+        file_path = Path(file_path)
+        weight_processing: dict[str, bool] = (
+            self.zanj_model_config.model_cfg.weight_processing
+        )
+        fold_ln = fold_ln and not weight_processing["are_layernorms_folded"]
+
+        exported: ZanjHookedTransformer = copy.deepcopy(self)
+        exported.process_weights_(
+            fold_ln=fold_ln,
+            center_writing_weights=True,
+            center_unembed=True,
+            refactor_factored_attn_matrices=False,
+        )
+        exported.zanj_model_config.model_cfg.weight_processing = dict(
+            are_layernorms_folded=weight_processing["are_layernorms_folded"] or fold_ln,
+            are_weights_processed=True,
+        )
+
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        exported.save(file_path, zanj=ZANJ(compress=compress))
+        return file_path
+
+    @classmethod
+    def read(
+        cls,
+        file_path: str | Path,
+        zanj: ZANJ | None = None,
+        mmap: bool = False,
+        skip_processing: bool = False,
+    ) -> ZanjHookedTransformer:
+        """read a model from a zanj file
+
+        - `mmap = False` memory-maps the tensors of uncompressed archives instead of
+          decompressing them into memory (compressed entries are read as usual), see
+          `maze_transformer.utils.zanj_mmap`
+        - `skip_processing = False` skips weight processing when the saved `weight_processing`
+          flags say it's already done, see `_load_state_dict_wrapper`
+
+        delta checkpoints (see `maze_transformer.training.checkpoint_delta`) are
+        reconstructed from their keyframe, found relative to `file_path`
+        """
+        if zanj is None:
+            zanj = ZANJ()
+
+        zanj = copy.copy(zanj)
+        zanj.custom_settings = {
+            **zanj.custom_settings,
+            CHECKPOINT_DELTA_DIR_SETTING: Path(file_path).parent.as_posix(),
+        }
+
+        if skip_processing:
+            zanj.custom_settings = {
+                **zanj.custom_settings,
+                "_load_state_dict_wrapper": {
+                    **zanj.custom_settings.get("_load_state_dict_wrapper", dict()),
+                    "skip_processing": True,
+                },
+            }
+
+        if not mmap:
+            return super().read(file_path, zanj)
+
+        model: ZanjHookedTransformer = read_zanj_mmap(file_path, zanj)
+        assert isinstance(
+            model, cls
+        ), f"loaded object must be a {cls}, got {type(model)}"
+        return model
@@ -20,6 +20,7 @@ class _TRAIN_SAVE_FILES:
     # keep these
     config_holder: str = "config.json"
     checkpoints: str = "checkpoints"
+    checkpoint_index: str = "checkpoint_index.json"
     log: str = "log.jsonl"
     model_checkpt_zanj: Callable[[int], str] = (
         lambda _, iteration: f"model.iter_{iteration}.zanj"
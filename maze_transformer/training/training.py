@@ -14,6 +14,8 @@ from zanj import ZANJ
 from maze_transformer.evaluation.eval_model import evaluate_model
 from maze_transformer.evaluation.path_evals import PathEvals
 from maze_transformer.tokenizer import HuggingMazeTokenizer
+from maze_transformer.training.checkpoint_delta import DeltaCheckpointer
+from maze_transformer.training.checkpoint_index import CheckpointIndex
 from maze_transformer.training.config import ConfigHolder, ZanjHookedTransformer
 from maze_transformer.training.train_save_files import TRAIN_SAVE_FILES
 from maze_transformer.training.wandb_logger import WandbLogger
@@ -125,6 +127,17 @@ def train(
 
     # TODO: add model output dir / run name to model.training_records
 
+    # index of saved checkpoints, continuing any existing index in the run directory
+    checkpoint_index: CheckpointIndex = CheckpointIndex.read(
+        output_dir
+    ) or CheckpointIndex(output_dir)
+    # keyframe + delta checkpoints, if enabled
+    delta_checkpointer: DeltaCheckpointer | None = (
+        DeltaCheckpointer(cfg.train_cfg.checkpoint_delta_cfg, zanj=zanj)
+        if cfg.train_cfg.checkpoint_delta_cfg is not None
+        else None
+    )
+
     # start up training
     # ==============================
     model.train()
@@ -181,16 +194,29 @@ def train(
                 / TRAIN_SAVE_FILES.model_checkpt_zanj(iteration)
             )
             logger.progress(f"Saving model checkpoint to {model_save_path.as_posix()}")
-            zanj.save(model, model_save_path)
-            logger.upload_model(
-                model_save_path, aliases=["latest", f"iter-{iteration}"]
+            keyframe_path: Path | None = None
+            if delta_checkpointer is not None:
+                if not delta_checkpointer.save(model, model_save_path):
+                    keyframe_path = delta_checkpointer.keyframe_path
+            else:
+                zanj.save(model, model_save_path)
+            checkpoint_index.add(
+                iteration, model_save_path, metrics, keyframe_path=keyframe_path
             )
+            checkpoint_index.save()
+            # a delta checkpoint can't be loaded without its keyframe, so only upload full checkpoints
+            if keyframe_path is None:
+                logger.upload_model(
+                    model_save_path, aliases=["latest", f"iter-{iteration}"]
+                )
 
     # save the final model
     # ==============================
     final_model_path: Path = output_dir / TRAIN_SAVE_FILES.model_final_zanj
     logger.progress(f"Saving final model to {final_model_path.as_posix()}")
     zanj.save(model, final_model_path)
+    checkpoint_index.add(iteration, final_model_path, final=True)
+    checkpoint_index.save()
     logger.upload_model(final_model_path, aliases=["latest", "final"])
 
     logger.progress("Done training!")
@@ -0,0 +1,65 @@
+"""render matplotlib figures from precomputed data, optionally in a process pool
+
+a `FigureJob` is a module-level function which draws and saves a figure, along with
+its keyword arguments. since jobs only receive already computed arrays, they can be
+rendered in worker processes using the non-interactive Agg backend, while the model
+stays in the main process.
+"""
+
+import multiprocessing
+import os
+import typing
+
+import matplotlib.pyplot as plt
+import torch
+
+
+class FigureJob(typing.NamedTuple):
+    """`func(**kwargs)` draws and saves a figure, returning anything picklable (or `None`)
+
+    `func` must be importable by name (i.e. defined at module level), so that it can
+    be sent to worker processes
+    """
+
+    func: typing.Callable[..., typing.Any]
+    kwargs: dict[str, typing.Any]
+
+
+def _init_figure_worker(n_threads: int) -> None:
+    plt.switch_backend("Agg")
+    torch.set_num_threads(n_threads)
+
+
+def _run_figure_job(job: FigureJob) -> typing.Any:
+    fignums_before: set[int] = set(plt.get_fignums())
+    try:
+        return job.func(**job.kwargs)
+    finally:
+        # figures are only saved, so free the ones this job opened as soon as it is
+        # done. in serial mode this is the caller's process, so leave the others open
+        for fignum in set(plt.get_fignums()) - fignums_before:
+            plt.close(fignum)
+
+
+def render_figure_jobs(
+    jobs: list[FigureJob],
+    parallel: bool | int = False,
+) -> list[typing.Any]:
+    """run `jobs`, returning their results in order
+
+    if `parallel` is `True` or an int, jobs are rendered in a process pool (with
+    `parallel` processes if an int, otherwise one per cpu core) using the Agg backend.
+    otherwise they run one after another in this process, with whatever backend is active.
+    """
+    if not parallel or len(jobs) <= 1:
+        return [_run_figure_job(job) for job in jobs]
+
+    n_processes: int = os.cpu_count() if parallel is True else parallel
+    n_processes = min(n_processes, len(jobs))
+    n_threads: int = max(1, os.cpu_count() // n_processes)
+    with multiprocessing.Pool(
+        processes=n_processes,
+        initializer=_init_figure_worker,
+        initargs=(n_threads,),
+    ) as pool:
+        return pool.map(_run_figure_job, jobs)
@@ -0,0 +1,25 @@
+import hashlib
+import os
+from pathlib import Path
+
+# maps (path, mtime, size) to the sha256 of the file, so we only hash each checkpoint once per session
+_FILE_HASHES: dict[tuple[str, float, int], str] = dict()
+
+
+def file_sha256(path: str | Path, chunk_size: int = 2**20) -> str:
+    """sha256 hex digest of a file's contents, memoized on (path, mtime, size)"""
+    path = Path(path)
+    stat: os.stat_result = path.stat()
+    memo_key: tuple[str, float, int] = (
+        path.resolve().as_posix(),
+        stat.st_mtime,
+        stat.st_size,
+    )
+    if memo_key not in _FILE_HASHES:
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(chunk_size), b""):
+                hasher.update(block)
+        _FILE_HASHES[memo_key] = hasher.hexdigest()
+
+    return _FILE_HASHES[memo_key]
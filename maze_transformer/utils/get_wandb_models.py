@@ -1,8 +1,15 @@
+import copy
 import itertools
 import math
+import multiprocessing
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import asdict
 from pathlib import Path
-from typing import Any
+from typing import Any, NamedTuple, Sequence
 
 import torch
 import wandb
@@ -20,12 +27,14 @@ from wandb.sdk.wandb_run import Artifact, Run
 from zanj import ZANJ
 from zanj.torchutil import ConfigMismatchException, assert_model_cfg_equality
 
+from maze_transformer.evaluation.model_registry import ModelRegistry
 from maze_transformer.test_helpers.assertions import (
     ModelOutputArgsortEqualityError,
     ModelOutputEqualityError,
     _check_except_config_equality_modulo_weight_processing,
     assert_model_output_equality,
 )
+from maze_transformer.tokenizer import HuggingMazeTokenizer
 from maze_transformer.training.config import (
     BaseGPTConfig,
     ConfigHolder,
@@ -56,6 +65,14 @@ def load_model(
     config_holder: ConfigHolder, model_path: str, fold_ln: bool = True
 ) -> HookedTransformer:
     model: HookedTransformer = config_holder.create_model()
+    # pad on the same side as `ZanjHookedTransformer`, so that outputs of the loaded and
+    # converted models match for sequences containing padding tokens
+    if isinstance(config_holder.tokenizer, HuggingMazeTokenizer):
+        config_holder.tokenizer.apply_overrides()
+        model.set_tokenizer(
+            config_holder.tokenizer,
+            default_padding_side=config_holder.tokenizer.padding_side,
+        )
     state_dict: dict = torch.load(model_path, map_location=model.cfg.device)
     model.load_and_process_state_dict(
         state_dict,
@@ -102,31 +119,37 @@ def match_checkpoint(
     return artifact
 
 
-def load_wandb_run(
-    project: str = "aisc-search/alex",
-    run_id: str = "sa973hyn",
-    output_path: str = "./downloaded_models",
+def get_wandb_artifact(
+    api: wandb.Api,
+    run: Run,
+    artifact_name: str,
     checkpoint: int | None = None,
-) -> tuple[HookedTransformer, ConfigHolder]:
-    api: wandb.Api = wandb.Api()
-
-    artifact_name: str = f"{project.rstrip('/')}/{run_id}"
-
-    run: Run = api.run(artifact_name)
-    wandb_cfg: wandb.config.Config = run.config  # Get run configuration
+    step_prefix: str = "step=",
+) -> tuple[Artifact, int, str]:
+    """get the artifact for `checkpoint` of a run, or the latest if `None`
 
-    # -- Get / Match checkpoint --
+    returns `(artifact, checkpoint, artifact_name)`, with `":latest"` appended to the name
+    if the latest checkpoint was requested
+    """
     artifact: Artifact
     if checkpoint is not None:
-        artifact = match_checkpoint(checkpoint, run)
+        artifact = match_checkpoint(checkpoint, run, step_prefix=step_prefix)
     else:
         # Get latest checkpoint
         print("Loading latest checkpoint")
         artifact_name = f"{artifact_name}:latest"
         artifact = api.artifact(artifact_name)
-        checkpoint = get_step(artifact)
+        checkpoint = get_step(artifact, step_prefix=step_prefix)
+    return artifact, checkpoint, artifact_name
 
-    # -- Initalize configurations --
+
+def config_from_wandb_run(
+    wandb_cfg: dict,
+    run_id: str,
+    artifact_name: str,
+    checkpoint: int,
+) -> ConfigHolder:
+    """reconstruct the `ConfigHolder` of an old (`.pt` checkpoint) run from its wandb config"""
     # Model cfg
     model_properties = {
         k: wandb_cfg[k] for k in ["act_fn", "d_model", "d_head", "n_layers"]
@@ -149,13 +172,40 @@ def load_wandb_run(
         name=wandb_cfg.get("dataset_name", "no_name"), grid_n=int(grid_n), n_mazes=-1
     )
 
-    cfg: ConfigHolder = ConfigHolder(
+    return ConfigHolder(
         model_cfg=model_cfg,
         dataset_cfg=ds_cfg,
         train_cfg=TrainConfig(
             name=f"artifact '{artifact_name}', checkpoint '{checkpoint}'"
         ),
     )
+
+
+def load_wandb_run(
+    project: str = "aisc-search/alex",
+    run_id: str = "sa973hyn",
+    output_path: str = "./downloaded_models",
+    checkpoint: int | None = None,
+    api: wandb.Api | None = None,
+) -> tuple[HookedTransformer, ConfigHolder]:
+    if api is None:
+        api = wandb.Api()
+
+    artifact_name: str = f"{project.rstrip('/')}/{run_id}"
+
+    run: Run = api.run(artifact_name)
+    wandb_cfg: wandb.config.Config = run.config  # Get run configuration
+
+    # -- Get / Match checkpoint --
+    artifact: Artifact
+    artifact, checkpoint, artifact_name = get_wandb_artifact(
+        api, run, artifact_name, checkpoint
+    )
+
+    # -- Initalize configurations --
+    cfg: ConfigHolder = config_from_wandb_run(
+        wandb_cfg, run_id, artifact_name, checkpoint
+    )
     download_path: Path = (
         Path(output_path)
         / f'{artifact.name.split(":")[0]}'
@@ -465,7 +515,13 @@ def load_wandb_zanj(
     project: str = "aisc-search/alex",
     checkpoint: int | None = None,
     output_path: str | Path = "./downloaded_models",
+    registry: ModelRegistry | None = None,
 ) -> ZanjHookedTransformer:
+    """download a zanj model from wandb, and re-save it with metadata in `output_path`
+
+    if a `registry` is given (such as `MODEL_REGISTRY`), the model is registered under its
+    new path, so later reads of that path reuse it
+    """
     output_path = Path(output_path)
     api: wandb.Api = wandb.Api()
     artifact_name: str = f"{project.rstrip('/')}/{run_id}"
@@ -520,7 +576,221 @@ def load_wandb_zanj(
         else f"model.{artifact_name_sanitized}.final.zanj"
     )
     model.save(updated_save_path)
+    if registry is not None:
+        registry.put(updated_save_path, model)
 
     print(f"\tSaved model to '{updated_save_path}'")
 
     return model
+
+
+class WandbCheckpointJob(NamedTuple):
+    """a checkpoint of a wandb run to download, `checkpoint = None` for the latest"""
+
+    run_id: str
+    checkpoint: int | None = None
+    project: str = "aisc-search/alex"
+
+
+class ArtifactDownloadCache:
+    """content-addressed cache of downloaded wandb artifacts
+
+    each artifact is downloaded once into `cache_dir / <artifact digest>`, so the same
+    checkpoint requested under different names or aliases (or by different jobs) is only
+    fetched once. downloads go to a temporary directory which is renamed into place, so
+    concurrent downloads of the same artifact (from other processes) are safe and partial
+    downloads are never used.
+    """
+
+    def __init__(self, cache_dir: str | Path) -> None:
+        self.cache_dir: Path = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # one lock per artifact, so threads wait for a download in progress instead of repeating it
+        self._locks: dict[str, threading.Lock] = dict()
+        self._locks_lock: threading.Lock = threading.Lock()
+
+    def path(self, artifact: Artifact) -> Path:
+        return self.cache_dir / sanitize_fname(artifact.digest)
+
+    def download(self, artifact: Artifact) -> Path:
+        """directory holding the files of `artifact`, downloading it if not cached"""
+        with self._locks_lock:
+            lock: threading.Lock = self._locks.setdefault(
+                artifact.digest, threading.Lock()
+            )
+        with lock:
+            return self._download(artifact)
+
+    def _download(self, artifact: Artifact) -> Path:
+        path: Path = self.path(artifact)
+        if path.is_dir():
+            return path
+
+        temp_path: Path = path.with_name(f"{path.name}.tmp-{uuid.uuid4().hex}")
+        try:
+            artifact.download(root=temp_path)
+            try:
+                os.rename(temp_path, path)
+            except OSError:
+                # another thread or process finished downloading it first
+                if not path.is_dir():
+                    raise
+        finally:
+            if temp_path.exists():
+                shutil.rmtree(temp_path)
+        return path
+
+
+def _download_wandb_checkpoint(
+    job: WandbCheckpointJob,
+    api: wandb.Api,
+    cache: ArtifactDownloadCache,
+) -> tuple[Path, ConfigHolder, dict]:
+    artifact_name: str = f"{job.project.rstrip('/')}/{job.run_id}"
+    run: Run = api.run(artifact_name)
+    artifact, checkpoint, artifact_name = get_wandb_artifact(
+        api, run, artifact_name, job.checkpoint
+    )
+    cfg: ConfigHolder = config_from_wandb_run(
+        run.config, job.run_id, artifact_name, checkpoint
+    )
+    download_dir: Path = cache.download(artifact)
+    pt_paths: list[Path] = list(download_dir.glob("*.pt"))
+    assert (
+        len(pt_paths) == 1
+    ), f"expected a single .pt file in artifact {artifact.name}, got {pt_paths}"
+    wandb_kwargs: dict = dict(
+        project=job.project,
+        run_id=job.run_id,
+        checkpoint=checkpoint,
+    )
+    return pt_paths[0], cfg, wandb_kwargs
+
+
+def _convert_wandb_checkpoint(
+    args: tuple[Path, ConfigHolder, dict, Path],
+) -> Path:
+    """load a downloaded `.pt` checkpoint, convert it to zanj and save it
+
+    only checks that the state dict survived conversion -- the expensive reload checks
+    are done once, on a reference model, by `convert_wandb_checkpoints`
+    """
+    pt_path, cfg, wandb_kwargs, save_path = args
+    # `load_model` changes the (cached) transformer config of `cfg` when folding
+    # layernorms, so work on a copy to keep `cfg` usable for the reference checks
+    cfg = copy.deepcopy(cfg)
+    model_wandb: HookedTransformer = load_model(cfg, pt_path, fold_ln=True)
+    model_zanj: ZanjHookedTransformer = convert_model_to_zanj(
+        model=model_wandb,
+        cfg=cfg,
+        wandb_kwargs=wandb_kwargs,
+    )
+    compare_state_dicts(model_wandb.state_dict(), model_zanj.state_dict())
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+    model_zanj.save(save_path)
+    return save_path
+
+
+def convert_wandb_checkpoints(
+    jobs: Sequence[WandbCheckpointJob],
+    output_path: str | Path = "./downloaded_models",
+    cache_dir: str | Path | None = None,
+    n_download_threads: int = 8,
+    parallel: bool | int = False,
+    test_reload: bool = True,
+    verbose: bool = True,
+    api: wandb.Api | None = None,
+) -> dict[WandbCheckpointJob, Path]:
+    """download many `.pt` checkpoints from wandb and convert them to zanj
+
+    batch version of `load_wandb_pt_model_as_zanj`:
+    - artifacts are resolved and downloaded concurrently, with `n_download_threads`
+      threads, into a content-addressed `ArtifactDownloadCache` (in `cache_dir`, by
+      default `output_path / "artifact_cache"`)
+    - downloaded checkpoints are converted and saved as `output_path / wandb.<run_id>.iter_<checkpoint>.zanj`,
+      once per distinct checkpoint, in a process pool if `parallel` is `True` or an int (with `parallel` processes if
+      an int, otherwise one per cpu core)
+    - the output equality and reload checks (`perform_reload_checks`) run once, on the
+      first job as a shared reference, since every model goes through the same
+      conversion. all other models only have their state dicts compared after conversion
+
+    returns a dict mapping each job to the path of its saved zanj model. `api` defaults
+    to `wandb.Api()`, and can be replaced by any object with the same `run` and
+    `artifact` methods (for testing).
+    """
+    output_path = Path(output_path)
+    if api is None:
+        api = wandb.Api()
+    cache: ArtifactDownloadCache = ArtifactDownloadCache(
+        cache_dir if cache_dir is not None else output_path / "artifact_cache"
+    )
+    jobs = list(dict.fromkeys(jobs))
+
+    if verbose:
+        print(
+            f"# Downloading {len(jobs)} checkpoints with {n_download_threads} threads"
+        )
+    with ThreadPoolExecutor(max_workers=n_download_threads) as executor:
+        downloads: list[tuple[Path, ConfigHolder, dict]] = list(
+            executor.map(
+                lambda job: _download_wandb_checkpoint(job, api, cache),
+                jobs,
+            )
+        )
+
+    # jobs which resolve to the same checkpoint (such as an explicit checkpoint and `None`
+    # for the latest) share a save path, and are only converted once
+    job_save_paths: list[Path] = list()
+    convert_args_by_path: dict[Path, tuple[Path, ConfigHolder, dict, Path]] = dict()
+    for job, (pt_path, cfg, wandb_kwargs) in zip(jobs, downloads):
+        save_path: Path = (
+            output_path
+            / f"wandb.{sanitize_fname(job.run_id)}.iter_{wandb_kwargs['checkpoint']}.zanj"
+        )
+        job_save_paths.append(save_path)
+        convert_args_by_path.setdefault(
+            save_path, (pt_path, cfg, wandb_kwargs, save_path)
+        )
+    convert_args: list[tuple[Path, ConfigHolder, dict, Path]] = list(
+        convert_args_by_path.values()
+    )
+
+    if verbose:
+        print(f"# Converting {len(convert_args)} checkpoints to zanj")
+    saved_paths: list[Path]
+    if parallel and len(convert_args) > 1:
+        n_processes: int = os.cpu_count() if parallel is True else parallel
+        with multiprocessing.Pool(
+            processes=min(n_processes, len(convert_args))
+        ) as pool:
+            saved_paths = pool.map(_convert_wandb_checkpoint, convert_args)
+    else:
+        saved_paths = [_convert_wandb_checkpoint(args) for args in convert_args]
+
+    if test_reload and len(convert_args) > 0:
+        pt_path, cfg, wandb_kwargs, save_path = convert_args[0]
+        if verbose:
+            print(f"# Checking reference model {wandb_kwargs}")
+        model_wandb: HookedTransformer = load_model(cfg, pt_path, fold_ln=True)
+        model_zanj: ZanjHookedTransformer = convert_model_to_zanj(
+            model=model_wandb,
+            cfg=cfg,
+            wandb_kwargs=wandb_kwargs,
+        )
+        assert_model_output_equality(
+            model_wandb,
+            model_zanj,
+            check_config_equality=False,
+            vocab_size=cfg.maze_tokenizer.vocab_size,
+            seq_len_max=cfg.dataset_cfg.seq_len_max,
+        )
+        perform_reload_checks(
+            model_wandb=model_wandb,
+            cfg=cfg,
+            model_zanj=model_zanj,
+            model_path=save_path,
+            verbose=verbose,
+        )
+
+    saved_by_path: dict[Path, Path] = dict(zip(convert_args_by_path, saved_paths))
+    return {job: saved_by_path[path] for job, path in zip(jobs, job_save_paths)}
@@ -51,3 +51,62 @@ def pad_and_batch_tensors(
         contexts_tensored.append(batch_tensor)
 
     return contexts_tensored
+
+
+def concat_left_padded(
+    tensors: list[torch.Tensor],
+    pos_dims: tuple[int, ...] = (1,),
+    value: float = 0.0,
+) -> torch.Tensor:
+    """concatenate along the batch (first) dim, left padding each of `pos_dims` to the longest length
+
+    used for merging the outputs of separate forward passes on chunks of left-padded prompts
+    """
+    max_lens: dict[int, int] = {
+        dim: max(t.shape[dim] for t in tensors) for dim in pos_dims
+    }
+    padded: list[torch.Tensor] = list()
+    for t in tensors:
+        # `F.pad` takes (left, right) pairs starting from the last dimension
+        pad: list[int] = [0] * (2 * t.ndim)
+        for dim in pos_dims:
+            pad[2 * (t.ndim - 1 - dim)] = max_lens[dim] - t.shape[dim]
+        padded.append(F.pad(t, pad, value=value))
+
+    return torch.cat(padded, dim=0)
+
+
+def slice_prompt_positions(
+    activations: torch.Tensor,
+    prompt_end_idxs: list[int],
+    prompt_lengths: list[int],
+    pos_dims: tuple[int, ...] = (1,),
+    value: float = 0.0,
+) -> torch.Tensor:
+    """from activations on full sequences, take the positions of a prompt which is a prefix of each sequence
+
+    for each row `b`, takes the `prompt_lengths[b]` positions up to and including
+    `prompt_end_idxs[b]` along every dim in `pos_dims`, and left pads the rows to the
+    longest prompt, as if the model had been run on the prompts directly
+    """
+    rows: list[torch.Tensor] = list()
+    for b, (end_idx, length) in enumerate(zip(prompt_end_idxs, prompt_lengths)):
+        idx: list[slice] = [slice(None)] * activations.ndim
+        idx[0] = slice(b, b + 1)
+        for dim in pos_dims:
+            idx[dim] = slice(end_idx + 1 - length, end_idx + 1)
+        rows.append(activations[tuple(idx)])
+
+    return concat_left_padded(rows, pos_dims=pos_dims, value=value)
+
+
+def length_sorted_order(lengths: list[int]) -> tuple[list[int], torch.Tensor]:
+    """indices sorted by length, and the inverse permutation to restore the original order
+
+    sorting prompts by length before batching minimizes padding. `inverse_order[i]` is the
+    position of item `i` after sorting, so `torch.cat(outputs)[inverse_order]` restores the order
+    """
+    order: list[int] = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    inverse_order: torch.Tensor = torch.empty(len(lengths), dtype=torch.long)
+    inverse_order[order] = torch.arange(len(lengths))
+    return order, inverse_order
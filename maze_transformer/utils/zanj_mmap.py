@@ -0,0 +1,126 @@
+"""read zanj archives with arrays memory-mapped from the file instead of decompressed into memory
+
+`zanj.ZANJ.read` extracts every external array of the archive (for a model, every tensor of
+the state dict) with `np.load` on a zip file handle. for entries stored without compression,
+the `.npy` data is a contiguous byte range of the archive, so it can be memory-mapped
+directly: nothing is read until the tensor is copied into the model, and repeated loads of
+the same checkpoint are served from the page cache. compressed entries are read as usual.
+"""
+
+import json
+import struct
+import typing
+import zipfile
+from pathlib import Path
+
+import numpy as np
+from zanj import ZANJ
+from zanj.externals import GET_EXTERNAL_LOAD_FUNC, ZANJ_MAIN, ZANJ_META, ExternalItem
+from zanj.loading import LoadedZANJ, load_item_recursive
+
+# fixed size part of a zip local file header, see the zip spec (APPNOTE.TXT, section 4.3.7)
+_ZIP_LOCAL_HEADER_SIZE: int = 30
+_ZIP_LOCAL_HEADER_SIGNATURE: bytes = b"PK\x03\x04"
+
+
+def mmap_stored_npy(
+    archive_path: str | Path,
+    info: zipfile.ZipInfo,
+) -> np.ndarray | None:
+    """read-only memory map of an uncompressed `.npy` entry of a zip archive
+
+    returns `None` if the entry is compressed, or holds an array which can't be mapped
+    (object dtype, or no elements), in which case it should be read normally
+    """
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+
+    with open(archive_path, "rb") as f:
+        # the local header may have a different "extra" field than the central directory
+        f.seek(info.header_offset)
+        local_header: bytes = f.read(_ZIP_LOCAL_HEADER_SIZE)
+        assert (
+            local_header[:4] == _ZIP_LOCAL_HEADER_SIGNATURE
+        ), f"bad local header for {info.filename} in {archive_path}"
+        fname_len, extra_len = struct.unpack("<HH", local_header[26:30])
+        f.seek(info.header_offset + _ZIP_LOCAL_HEADER_SIZE + fname_len + extra_len)
+
+        version: tuple[int, int] = np.lib.format.read_magic(f)
+        shape: tuple[int, ...]
+        fortran_order: bool
+        dtype: np.dtype
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        elif version == (2, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        else:
+            return None
+        array_offset: int = f.tell()
+
+    if dtype.hasobject or int(np.prod(shape)) == 0:
+        return None
+
+    return np.memmap(
+        archive_path,
+        dtype=dtype,
+        mode="r",
+        offset=array_offset,
+        shape=shape,
+        order="F" if fortran_order else "C",
+    )
+
+
+class MmapLoadedZANJ(LoadedZANJ):
+    """`LoadedZANJ`, but with uncompressed `.npy` externals memory-mapped"""
+
+    def __init__(
+        self,
+        path: str | Path,
+        zanj: ZANJ,
+    ) -> None:
+        self._path: str = str(path)
+        self._zanj: ZANJ = zanj
+
+        with zipfile.ZipFile(file=self._path, mode="r") as zipf:
+            with zipf.open(ZANJ_META, "r") as fp:
+                self._meta: dict = json.load(fp)
+            with zipf.open(ZANJ_MAIN, "r") as fp:
+                self._json_data: typing.Any = json.load(fp)
+
+            self._externals: dict[str, ExternalItem] = dict()
+            for fname, ext_item in self._meta["externals_info"].items():
+                item_type: str = ext_item["item_type"]
+                data: typing.Any = None
+                if item_type == "npy":
+                    data = mmap_stored_npy(self._path, zipf.getinfo(fname))
+                if data is None:
+                    with zipf.open(fname, "r") as fp:
+                        data = GET_EXTERNAL_LOAD_FUNC(item_type)(self, fp)
+
+                self._externals[fname] = ExternalItem(
+                    item_type=item_type,
+                    data=data,
+                    path=ext_item["path"],
+                )
+
+
+def read_zanj_mmap(
+    file_path: str | Path,
+    zanj: ZANJ | None = None,
+) -> typing.Any:
+    """same as `ZANJ.read`, but memory-mapping uncompressed arrays (see `MmapLoadedZANJ`)"""
+    if zanj is None:
+        zanj = ZANJ()
+    file_path = Path(file_path)
+    if not file_path.is_file():
+        raise FileNotFoundError(f"file not found: {file_path}")
+
+    loaded_zanj: MmapLoadedZANJ = MmapLoadedZANJ(path=file_path, zanj=zanj)
+    loaded_zanj.populate_externals()
+
+    return load_item_recursive(
+        loaded_zanj._json_data,
+        path=tuple(),
+        zanj=zanj,
+        error_mode=zanj.error_mode,
+    )
@@ -17,6 +17,7 @@ from zanj.torchutil import assert_model_cfg_equality
 
 from maze_transformer.evaluation.eval_model import evaluate_model, predict_maze_paths
 from maze_transformer.evaluation.path_evals import PathEvals
+from maze_transformer.evaluation.plotting import eval_model_at_checkpoints
 from maze_transformer.test_helpers.assertions import assert_model_output_equality
 from maze_transformer.training.config import ConfigHolder, ZanjHookedTransformer
 from maze_transformer.training.train_model import TrainingResult, train_model
@@ -114,3 +115,21 @@ def test_evaluate_model(temp_dir):
 
     assert path_evals.keys() == scores.keys()
     assert scores[eval_names[0]].summary()["total_items"] == cfg.dataset_cfg.n_mazes
+
+
+def test_eval_model_at_checkpoints_parallel():
+    model_path: Path = Path(
+        "examples/multsrc_demo-g6-n10K-a_dfs-h92077_tiny-v1_sweep-v1_2023-05-20-21-30-02/model.final.zanj"
+    )
+    cfg: ConfigHolder = ZanjHookedTransformer.read(model_path).zanj_model_config
+    cfg.dataset_cfg.n_mazes = 5
+    dataset: MazeDataset = MazeDataset.from_config(cfg=cfg.dataset_cfg)
+
+    scores_serial = eval_model_at_checkpoints(model_path, dataset)
+    scores_parallel = eval_model_at_checkpoints(model_path, dataset, parallel=2)
+
+    assert scores_serial.keys() == scores_parallel.keys()
+    for name, scores_indexed in scores_serial.items():
+        assert scores_indexed.keys() == scores_parallel[name].keys()
+        for idx, counter in scores_indexed.items():
+            assert counter == scores_parallel[name][idx]
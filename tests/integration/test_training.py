@@ -8,6 +8,7 @@ from muutils.mlutils import get_device
 
 from maze_transformer.evaluation.path_evals import PathEvals
 from maze_transformer.test_helpers.stub_logger import StubLogger
+from maze_transformer.training.checkpoint_index import CheckpointIndex
 from maze_transformer.training.config import GPT_CONFIGS, TRAINING_CONFIGS, ConfigHolder
 from maze_transformer.training.train_save_files import TRAIN_SAVE_FILES
 from maze_transformer.training.training import get_dataloader, train
@@ -42,6 +43,13 @@ def test_train_model_without_evals(temp_dir: Path):
     assert len(metrics) == 2
     assert list(metrics[0].keys()) == ["loss"]
 
+    index: CheckpointIndex | None = CheckpointIndex.read(output_path)
+    assert index is not None
+    assert index.checkpoint_paths()[0][0] == 0
+    assert all(path.exists() for _, path in index.checkpoint_paths())
+    assert list(index.checkpoints[0].metrics.keys()) == ["loss"]
+    assert index.final is not None
+
 
 @pytest.mark.usefixtures("temp_dir")
 def test_train_model_with_evals(temp_dir: Path):
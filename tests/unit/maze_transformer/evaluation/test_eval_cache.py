@@ -0,0 +1,132 @@
+from pathlib import Path
+
+from maze_dataset import MazeDataset
+from muutils.statcounter import StatCounter
+
+from maze_transformer.evaluation.eval_cache import (
+    EvalResultCache,
+    eval_function_fingerprint,
+    evaluate_model_cached,
+    read_config_holder,
+)
+from maze_transformer.evaluation.eval_model import evaluate_model
+from maze_transformer.evaluation.model_registry import ModelRegistry
+from maze_transformer.evaluation.path_evals import PathEvals
+from maze_transformer.training.config import ConfigHolder, ZanjHookedTransformer
+
+MODEL_PATH: Path = Path(
+    "examples/multsrc_demo-g6-n10K-a_dfs-h92077_tiny-v1_sweep-v1_2023-05-20-21-30-02/model.final.zanj"
+)
+
+
+def _get_dataset(n_mazes: int) -> MazeDataset:
+    cfg: ConfigHolder = read_config_holder(MODEL_PATH)
+    cfg.dataset_cfg.n_mazes = n_mazes
+    return MazeDataset.from_config(cfg=cfg.dataset_cfg, save_local=False)
+
+
+def _as_comparable(scores: dict[str, StatCounter]) -> dict[str, list]:
+    # some evals give `nan`, which is never equal to itself
+    return {
+        name: sorted((str(float(value)), count) for value, count in counter.items())
+        for name, counter in scores.items()
+    }
+
+
+def test_read_config_holder():
+    model: ZanjHookedTransformer = ZanjHookedTransformer.read(MODEL_PATH)
+    cfg: ConfigHolder = read_config_holder(MODEL_PATH)
+    # `weight_processing` is updated when the weights are processed on load, so skip `model_cfg`
+    assert cfg.dataset_cfg == model.zanj_model_config.dataset_cfg
+    assert cfg.maze_tokenizer == model.zanj_model_config.maze_tokenizer
+    assert cfg.train_cfg == model.zanj_model_config.train_cfg
+
+
+def test_evaluate_model_cached(temp_dir, mocker):
+    dataset: MazeDataset = _get_dataset(n_mazes=6)
+    cache: EvalResultCache = EvalResultCache(temp_dir)
+
+    scores_uncached = evaluate_model(
+        model=ZanjHookedTransformer.read(MODEL_PATH),
+        dataset=dataset,
+        eval_functions=PathEvals.fast,
+    )
+    scores_first = evaluate_model_cached(
+        MODEL_PATH, dataset, cache, eval_functions=PathEvals.fast
+    )
+    assert _as_comparable(scores_first) == _as_comparable(scores_uncached)
+
+    # everything is cached, so the model should not be loaded again
+    spy_read = mocker.spy(ZanjHookedTransformer, "read")
+    scores_second = evaluate_model_cached(
+        MODEL_PATH, dataset, cache, eval_functions=PathEvals.fast
+    )
+    assert _as_comparable(scores_second) == _as_comparable(scores_first)
+
+    # a single new eval function is computed from the cached predictions
+    scores_subset = evaluate_model_cached(
+        MODEL_PATH,
+        dataset,
+        cache,
+        eval_functions={"node_overlap": PathEvals.node_overlap},
+    )
+    assert scores_subset["node_overlap"] == scores_first["node_overlap"]
+    assert spy_read.call_count == 0
+
+
+def test_evaluate_model_cached_missing_mazes(temp_dir):
+    dataset: MazeDataset = _get_dataset(n_mazes=4)
+    cache: EvalResultCache = EvalResultCache(temp_dir)
+
+    evaluate_model_cached(MODEL_PATH, dataset, cache, eval_functions=PathEvals.fast)
+    key = cache.get_key(
+        MODEL_PATH, dataset, 8, read_config_holder(MODEL_PATH).maze_tokenizer.name
+    )
+    stored: dict[str, dict] = cache.load(key)
+    assert set(stored.keys()) == {"0", "1", "2", "3"}
+
+    # drop an entry, it should be recomputed identically
+    removed: dict = stored.pop("2")
+    cache.save(key, stored)
+    evaluate_model_cached(MODEL_PATH, dataset, cache, eval_functions=PathEvals.fast)
+    assert cache.load(key)["2"] == removed
+
+
+def test_evaluate_model_cached_changed_eval_function(temp_dir):
+    dataset: MazeDataset = _get_dataset(n_mazes=3)
+    cache: EvalResultCache = EvalResultCache(temp_dir)
+
+    scores_old = evaluate_model_cached(
+        MODEL_PATH,
+        dataset,
+        cache,
+        eval_functions={"const": lambda **_: 1.0, **PathEvals.fast},
+    )
+    assert scores_old["const"].mean() == 1.0
+
+    # same name, different code: the stored scores are stale and get recomputed
+    scores_new = evaluate_model_cached(
+        MODEL_PATH, dataset, cache, eval_functions={"const": lambda **_: 2.0}
+    )
+    assert scores_new["const"].mean() == 2.0
+
+    # fingerprints of other eval functions are kept, so their scores are still reused
+    key = cache.get_key(
+        MODEL_PATH, dataset, 8, read_config_holder(MODEL_PATH).maze_tokenizer.name
+    )
+    _, fingerprints = cache.load_with_fingerprints(key)
+    assert set(fingerprints.keys()) == {"const", *PathEvals.fast.keys()}
+    assert fingerprints["node_overlap"] == eval_function_fingerprint(
+        PathEvals.node_overlap
+    )
+
+
+def test_evaluate_model_cached_registry(temp_dir):
+    dataset: MazeDataset = _get_dataset(n_mazes=2)
+    registry: ModelRegistry = ModelRegistry()
+
+    evaluate_model_cached(
+        MODEL_PATH, dataset, temp_dir, eval_functions=PathEvals.fast, registry=registry
+    )
+    assert MODEL_PATH in registry
+    assert registry.misses == 1
@@ -0,0 +1,127 @@
+from pathlib import Path
+
+import pytest
+import torch
+from maze_dataset import MazeDataset
+
+from maze_transformer.evaluation.eval_single_token_tasks import (
+    TaskEvalResult,
+    TaskPrompt,
+    eval_model_across_tasks,
+    eval_model_task,
+    get_task_prompts_targets,
+)
+from maze_transformer.training.config import ZanjHookedTransformer
+
+MODEL_PATH: Path = Path(
+    "examples/multsrc_demo-g6-n10K-a_dfs-h92077_tiny-v1_sweep-v1_2023-05-20-21-30-02/model.final.zanj"
+)
+
+
+@pytest.fixture(scope="module")
+def model_and_tasks() -> (
+    tuple[ZanjHookedTransformer, dict[str, TaskPrompt], list[list[str]]]
+):
+    model: ZanjHookedTransformer = ZanjHookedTransformer.read(MODEL_PATH)
+    dataset_cfg = model.zanj_model_config.dataset_cfg
+    dataset_cfg.n_mazes = 7
+    dataset: MazeDataset = MazeDataset.from_config(dataset_cfg, save_local=False)
+    dataset_tokens: list[list[str]] = dataset.as_tokens(
+        model.zanj_model_config.maze_tokenizer, join_tokens_individual_maze=False
+    )
+    task_prompts: dict[str, TaskPrompt] = get_task_prompts_targets(
+        dataset, model.zanj_model_config.maze_tokenizer, dataset_tokens=dataset_tokens
+    )
+    return model, task_prompts, dataset_tokens
+
+
+@pytest.mark.parametrize("task_name", ["origin_after_path_start", "rand_path_token"])
+def test_eval_model_task_chunked_matches_single_pass(model_and_tasks, task_name):
+    model, task_prompts, _ = model_and_tasks
+    task: TaskPrompt = task_prompts[task_name]
+    cache_hooks: list[str] = ["blocks.0.attn.hook_pattern", "blocks.1.hook_resid_post"]
+
+    result_single: TaskEvalResult = eval_model_task(
+        model,
+        task,
+        do_cache=True,
+        batch_size=None,
+        return_full_logits=True,
+        cache_hooks=cache_hooks,
+    )
+    result_chunked: TaskEvalResult = eval_model_task(
+        model,
+        task,
+        do_cache=True,
+        batch_size=3,
+        return_full_logits=True,
+        cache_hooks=cache_hooks,
+    )
+
+    assert result_chunked.predicted_tokens == result_single.predicted_tokens
+    assert torch.equal(
+        result_chunked.predicted_correct, result_single.predicted_correct
+    )
+    assert torch.allclose(
+        result_chunked.last_tok_logits, result_single.last_tok_logits, atol=1e-4
+    )
+    assert result_chunked.logits.shape == result_single.logits.shape
+    assert torch.allclose(
+        result_chunked.logits[:, -1], result_single.logits[:, -1], atol=1e-4
+    )
+
+    assert set(result_chunked.cache.keys()) == set(cache_hooks)
+    for k in cache_hooks:
+        assert result_chunked.cache[k].shape == result_single.cache[k].shape
+    # activations at the last position are unaffected by padding
+    assert torch.allclose(
+        result_chunked.cache["blocks.1.hook_resid_post"][:, -1],
+        result_single.cache["blocks.1.hook_resid_post"][:, -1],
+        atol=1e-4,
+    )
+
+
+def test_eval_model_task_default_drops_full_logits(model_and_tasks):
+    model, task_prompts, _ = model_and_tasks
+    result: TaskEvalResult = eval_model_task(model, task_prompts["path_start"])
+
+    assert result.logits is None
+    assert result.cache is None
+    assert result.last_tok_logits.shape == (7, model.cfg.d_vocab)
+
+
+def test_eval_model_across_tasks_shared_prefix(model_and_tasks):
+    model, task_prompts, dataset_tokens = model_and_tasks
+    cache_hooks: list[str] = ["blocks.1.attn.hook_pattern", "blocks.2.hook_resid_mid"]
+
+    kwargs: dict = dict(
+        do_cache=True, batch_size=4, return_full_logits=True, cache_hooks=cache_hooks
+    )
+    results_separate: dict[str, TaskEvalResult] = eval_model_across_tasks(
+        model, task_prompts, **kwargs
+    )
+    results_shared: dict[str, TaskEvalResult] = eval_model_across_tasks(
+        model, task_prompts, dataset_tokens=dataset_tokens, **kwargs
+    )
+
+    assert results_shared.keys() == results_separate.keys()
+    for task_name, res_separate in results_separate.items():
+        res_shared: TaskEvalResult = results_shared[task_name]
+        assert res_shared.predicted_tokens == res_separate.predicted_tokens
+        assert torch.allclose(
+            res_shared.last_tok_logits, res_separate.last_tok_logits, atol=1e-4
+        )
+        assert res_shared.logits.shape == res_separate.logits.shape
+        for k in cache_hooks:
+            assert res_shared.cache[k].shape == res_separate.cache[k].shape
+        assert torch.allclose(
+            res_shared.cache["blocks.2.hook_resid_mid"][:, -1],
+            res_separate.cache["blocks.2.hook_resid_mid"][:, -1],
+            atol=1e-4,
+        )
+        # attention of the last token, over the positions of the prompt
+        assert torch.allclose(
+            res_shared.cache["blocks.1.attn.hook_pattern"][:, :, -1],
+            res_separate.cache["blocks.1.attn.hook_pattern"][:, :, -1],
+            atol=1e-4,
+        )
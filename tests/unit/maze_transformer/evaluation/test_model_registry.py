@@ -0,0 +1,71 @@
+import os
+import shutil
+from pathlib import Path
+
+from maze_transformer.evaluation.model_registry import ModelRegistry, model_nbytes
+from maze_transformer.training.config import ZanjHookedTransformer
+
+MODEL_PATH: Path = Path(
+    "examples/multsrc_demo-g6-n10K-a_dfs-h92077_tiny-v1_sweep-v1_2023-05-20-21-30-02/model.final.zanj"
+)
+
+
+def test_registry_reuses_model(temp_dir):
+    model_path: Path = temp_dir / "model.zanj"
+    shutil.copy(MODEL_PATH, model_path)
+    registry: ModelRegistry = ModelRegistry()
+
+    model = registry.get(model_path)
+    assert isinstance(model, ZanjHookedTransformer)
+    assert registry.get(model_path) is model
+    assert (registry.hits, registry.misses) == (1, 1)
+    assert model_path in registry
+    assert registry.nbytes == model_nbytes(model)
+
+    # reading with different processing is a separate entry
+    assert registry.get(model_path, skip_processing=True) is not model
+    assert len(registry) == 2
+    registry.evict(model_path)
+    registry.get(model_path, skip_processing=True)
+    assert model_path in registry
+    model = registry.get(model_path)
+
+    # a changed file is read again, replacing the stale entries of both modes
+    stat: os.stat_result = model_path.stat()
+    os.utime(model_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    model_new = registry.get(model_path)
+    assert model_new is not model
+    assert len(registry) == 1
+
+    registry.evict(model_path)
+    assert len(registry) == 0
+
+
+def test_registry_lru_eviction(temp_dir):
+    paths: list[Path] = [temp_dir / f"model_{i}.zanj" for i in range(3)]
+    for p in paths:
+        shutil.copy(MODEL_PATH, p)
+
+    registry: ModelRegistry = ModelRegistry(max_bytes=None)
+    model_size: int = model_nbytes(registry.get(paths[0]))
+    registry.clear()
+
+    registry.max_bytes = 2 * model_size
+    registry.get(paths[0])
+    registry.get(paths[1])
+    registry.get(paths[0])  # now `paths[1]` is the least recently used
+    registry.get(paths[2])
+    assert len(registry) == 2
+    assert paths[0] in registry
+    assert paths[1] not in registry
+    assert paths[2] in registry
+
+    # a single model over the budget is still kept
+    registry.max_bytes = 1
+    model = registry.get(paths[1])
+    assert len(registry) == 1
+    assert registry.get(paths[1]) is model
+
+    # registering a model loaded elsewhere
+    registry.put(paths[0], model)
+    assert registry.get(paths[0]) is model
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+from maze_dataset import SPECIAL_TOKENS, MazeDataset, MazeDatasetConfig
+from maze_dataset.generation import LatticeMazeGenerators
+from maze_dataset.tokenization import MazeTokenizer, TokenizationMode
+
+from maze_transformer.evaluation.eval_model import evaluate_path_predictions
+from maze_transformer.evaluation.path_evals import PathEvals, rollout_evals
+from maze_transformer.evaluation.rollouts import Rollouts
+
+MAZE_TOKENIZER: MazeTokenizer = MazeTokenizer(
+    tokenization_mode=TokenizationMode.AOTP_UT_uniform, max_grid_size=5
+)
+
+
+def _get_dataset_and_predictions() -> tuple[MazeDataset, list[list]]:
+    dataset: MazeDataset = MazeDataset.from_config(
+        MazeDatasetConfig(
+            name="test",
+            grid_n=3,
+            n_mazes=4,
+            maze_ctor=LatticeMazeGenerators.gen_dfs,
+        ),
+        load_local=False,
+        save_local=False,
+        do_download=False,
+    )
+    predictions: list[list] = [
+        # exactly correct
+        [tuple(c) for c in dataset[0].solution] + [SPECIAL_TOKENS.PATH_END],
+        # empty
+        [],
+        # invalid token in the middle, no EOS
+        [tuple(dataset[2].solution[0]), SPECIAL_TOKENS.ADJLIST_START, (2, 2)],
+        # only EOS
+        [SPECIAL_TOKENS.PATH_END],
+    ]
+    return dataset, predictions
+
+
+def test_rollouts_roundtrip_predictions():
+    _, predictions = _get_dataset_and_predictions()
+    rollouts: Rollouts = Rollouts.from_predictions(predictions, MAZE_TOKENIZER)
+
+    assert len(rollouts) == 4
+    assert rollouts.lengths.tolist() == [len(p) for p in predictions]
+    assert rollouts.count_noncoord().tolist() == [1, 0, 1, 1]
+    assert rollouts.final_token_is(SPECIAL_TOKENS.PATH_END).tolist() == [
+        True,
+        False,
+        False,
+        True,
+    ]
+    assert rollouts.to_predictions() == predictions
+
+    for path, prediction in zip(rollouts.paths(), predictions):
+        assert np.array_equal(
+            path.reshape(-1, 2),
+            np.array([c for c in prediction if not isinstance(c, str)]).reshape(-1, 2),
+        )
+
+
+@pytest.mark.parametrize("ext", ["npz", "zanj"])
+def test_rollouts_save_read(temp_dir, ext):
+    _, predictions = _get_dataset_and_predictions()
+    rollouts: Rollouts = Rollouts.from_predictions(predictions, MAZE_TOKENIZER)
+
+    path = rollouts.save(temp_dir / f"rollouts.{ext}")
+    rollouts_read: Rollouts = Rollouts.read(path)
+
+    assert rollouts_read.maze_tokenizer == MAZE_TOKENIZER
+    for arr_name in ["coords", "token_ids", "is_coord", "offsets"]:
+        assert np.array_equal(
+            getattr(rollouts_read, arr_name), getattr(rollouts, arr_name)
+        )
+    assert rollouts_read.to_predictions() == predictions
+
+
+def test_rollouts_evals_match_nested():
+    dataset, predictions = _get_dataset_and_predictions()
+    rollouts: Rollouts = Rollouts.from_predictions(predictions, MAZE_TOKENIZER)
+
+    assert rollout_evals(rollouts, dataset.mazes) == rollout_evals(
+        predictions, dataset.mazes
+    )
+
+    # drop non-coord tokens for the path evals, as `predict_maze_paths` does by default
+    predictions_coords: list[list[tuple[int, int]]] = [
+        [c for c in p if not isinstance(c, str)] for p in predictions
+    ]
+    path_evals = {
+        name: PathEvals.fast[name]
+        for name in ["node_overlap", "exact_path_predicted", "corner_jumps"]
+    }
+    scores_rollouts = evaluate_path_predictions(dataset.mazes, rollouts, path_evals)
+    scores_nested = evaluate_path_predictions(
+        dataset.mazes, predictions_coords, path_evals
+    )
+    assert scores_rollouts == scores_nested
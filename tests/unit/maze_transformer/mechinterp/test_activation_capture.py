@@ -0,0 +1,230 @@
+import re
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+from maze_dataset import MazeDataset
+
+from maze_transformer.mechinterp.activation_capture import (
+    ActivationSpec,
+    CapturedActivations,
+    capture_activations,
+    capture_activations_shared_prefix,
+    logit_attribution_specs,
+)
+from maze_transformer.mechinterp.direct_logit_attribution import (
+    compute_direct_logit_attribution,
+    create_report,
+    create_reports,
+    report_capture_specs,
+)
+from maze_transformer.mechinterp.logit_attrib_task import LOGIT_ATTRIB_TASKS
+from maze_transformer.mechinterp.logit_lens import compute_logit_lens
+from maze_transformer.training.config import ZanjHookedTransformer
+
+MODEL_PATH: Path = Path(
+    "examples/multsrc_demo-g6-n10K-a_dfs-h92077_tiny-v1_sweep-v1_2023-05-20-21-30-02/model.final.zanj"
+)
+
+
+@pytest.fixture(scope="module")
+def model_and_task() -> tuple[ZanjHookedTransformer, list[list[str]], torch.Tensor]:
+    model: ZanjHookedTransformer = ZanjHookedTransformer.read(MODEL_PATH)
+    dataset_cfg = model.zanj_model_config.dataset_cfg
+    dataset_cfg.n_mazes = 6
+    dataset: MazeDataset = MazeDataset.from_config(dataset_cfg, save_local=False)
+    dataset_tokens: list[list[str]] = dataset.as_tokens(
+        model.zanj_model_config.maze_tokenizer, join_tokens_individual_maze=False
+    )
+    prompts, targets = LOGIT_ATTRIB_TASKS["rand_path_token"](dataset_tokens)
+    answer_tokens: torch.Tensor = torch.tensor(
+        model.zanj_model_config.maze_tokenizer.encode(targets), dtype=torch.long
+    )
+    return model, prompts, answer_tokens
+
+
+def test_activation_spec_apply():
+    activation = torch.arange(2 * 5 * 3 * 4).reshape(2, 5, 3, 4)
+    sliced = ActivationSpec("blocks.0.attn.hook_z", pos_slice=-1, heads=[0, 2]).apply(
+        activation
+    )
+    assert sliced.shape == (2, 1, 2, 4)
+    assert torch.equal(sliced[:, 0, 1], activation[:, -1, 2])
+
+    pattern = torch.rand(2, 3, 5, 5)
+    sliced = ActivationSpec("blocks.0.attn.hook_pattern", pos_slice=-2).apply(pattern)
+    assert sliced.shape == (2, 3, 1, 5)
+    assert torch.equal(sliced[:, :, 0], pattern[:, :, -2])
+
+    with pytest.raises(ValueError):
+        ActivationSpec("blocks.0.hook_resid_post", heads=[0]).apply(activation)
+
+
+def test_capture_matches_run_with_cache(model_and_task):
+    model, prompts, _ = model_and_task
+    logits, cache = model.run_with_cache([" ".join(p) for p in prompts])
+
+    captured: CapturedActivations = capture_activations(
+        model,
+        prompts,
+        specs=[
+            ActivationSpec("blocks.1.hook_resid_post", pos_slice=-1),
+            ActivationSpec("blocks.0.attn.hook_pattern", pos_slice=-1, heads=[1]),
+        ],
+        batch_size=4,
+    )
+
+    assert set(captured.keys()) == {
+        "blocks.1.hook_resid_post",
+        "blocks.0.attn.hook_pattern",
+    }
+    assert torch.allclose(captured.last_tok_logits, logits[:, -1], atol=1e-4)
+    assert torch.allclose(
+        captured["blocks.1.hook_resid_post"][:, 0],
+        cache["blocks.1.hook_resid_post"][:, -1],
+        atol=1e-4,
+    )
+    # keys are padded to the longest prompt, as in the single forward pass
+    assert torch.allclose(
+        captured["blocks.0.attn.hook_pattern"][:, 0, 0],
+        cache["blocks.0.attn.hook_pattern"][:, 1, -1],
+        atol=1e-4,
+    )
+
+
+def test_capture_shared_prefix_matches_per_task(model_and_task):
+    model, _, _ = model_and_task
+    dataset_cfg = model.zanj_model_config.dataset_cfg
+    dataset_cfg.n_mazes = 5
+    dataset: MazeDataset = MazeDataset.from_config(dataset_cfg, save_local=False)
+    dataset_tokens: list[list[str]] = dataset.as_tokens(
+        model.zanj_model_config.maze_tokenizer, join_tokens_individual_maze=False
+    )
+    task_prompts: dict[str, list[list[str]]] = {
+        task_name: LOGIT_ATTRIB_TASKS[task_name](dataset_tokens).prompts
+        for task_name in ["path_start", "origin_after_path_start", "rand_path_token"]
+    }
+    specs = report_capture_specs(model.cfg.n_layers)
+
+    shared = capture_activations_shared_prefix(model, task_prompts, specs, batch_size=2)
+    assert set(shared.keys()) == set(task_prompts.keys())
+    for task_name, prompts in task_prompts.items():
+        separate: CapturedActivations = capture_activations(
+            model, prompts, specs, batch_size=None
+        )
+        torch.testing.assert_close(
+            shared[task_name].last_tok_logits,
+            separate.last_tok_logits,
+            rtol=1e-4,
+            atol=1e-4,
+        )
+        for k in separate.keys():
+            assert shared[task_name][k].shape == separate[k].shape, k
+            if k.endswith("hook_attn_scores"):
+                # padding keys are masked differently, so only compare the prompt (and BOS) keys
+                for i, prompt in enumerate(prompts):
+                    torch.testing.assert_close(
+                        shared[task_name][k][i, ..., -(len(prompt) + 1) :],
+                        separate[k][i, ..., -(len(prompt) + 1) :],
+                        rtol=1e-4,
+                        atol=1e-4,
+                    )
+            else:
+                torch.testing.assert_close(
+                    shared[task_name][k], separate[k], rtol=1e-4, atol=1e-4
+                )
+
+
+@torch.no_grad()
+def test_captured_dla_and_logit_lens_match_full_cache(model_and_task):
+    model, prompts, answer_tokens = model_and_task
+    _, cache = model.run_with_cache([" ".join(p) for p in prompts])
+
+    captured: CapturedActivations = capture_activations(
+        model,
+        prompts,
+        specs=logit_attribution_specs(model.cfg.n_layers, do_neurons=True),
+        batch_size=4,
+    )
+    assert captured.nbytes < sum(
+        v.numel() * v.element_size() for v in cache.cache_dict.values()
+    )
+
+    dla_full = compute_direct_logit_attribution(
+        model, cache, answer_tokens, do_neurons=True
+    )
+    dla_captured = compute_direct_logit_attribution(
+        model, captured, answer_tokens, do_neurons=True
+    )
+    for k in ["heads", "neurons"]:
+        np.testing.assert_allclose(dla_captured[k], dla_full[k], rtol=1e-3, atol=1e-4)
+
+    for x_full, x_captured in zip(
+        compute_logit_lens(model, cache, answer_tokens),
+        compute_logit_lens(model, captured, answer_tokens),
+    ):
+        np.testing.assert_allclose(x_captured, x_full, rtol=1e-3, atol=1e-4)
+
+
+@pytest.mark.parametrize("parallel", [False, 2])
+def test_create_report(temp_dir, model_and_task, parallel):
+    model, _, _ = model_and_task
+    dataset_cfg = model.zanj_model_config.dataset_cfg
+    dataset_cfg.n_mazes = 6
+
+    # `create_report` disables gradients globally
+    grad_enabled: bool = torch.is_grad_enabled()
+    try:
+        out_path: Path = create_report(
+            model,
+            dataset_cfg,
+            "rand_path_token",
+            out_path=temp_dir / f"report-parallel_{parallel}",
+            device="cpu",
+            batch_size=4,
+            parallel=parallel,
+        )
+    finally:
+        torch.set_grad_enabled(grad_enabled)
+
+    assert (out_path / "report.md").exists()
+    assert (out_path / "figures" / "logit_attribution.png").exists()
+    assert len(list((out_path / "figures" / "head_analysis").glob("*.png"))) > 0
+    # every figure referenced in the report is rendered
+    report: str = (out_path / "report.md").read_text()
+    for fig_name in re.findall(r"\]\((figures/[^)]+\.png)\)", report):
+        assert (out_path / fig_name).exists(), fig_name
+
+
+def test_create_reports(temp_dir, model_and_task):
+    model, _, _ = model_and_task
+    dataset_cfg = model.zanj_model_config.dataset_cfg
+    dataset_cfg.n_mazes = 5
+    task_names: list[str] = ["path_start", "rand_path_token"]
+
+    grad_enabled: bool = torch.is_grad_enabled()
+    try:
+        out_paths: dict[tuple[str, str], Path] = create_reports(
+            [model, MODEL_PATH],
+            dataset_cfg,
+            task_names,
+            out_dir=temp_dir / "reports",
+            device="cpu",
+            batch_size=2,
+        )
+    finally:
+        torch.set_grad_enabled(grad_enabled)
+
+    model_labels: list[str] = [
+        model.zanj_model_config.name,
+        f"{model.zanj_model_config.name}-{MODEL_PATH.stem}",
+    ]
+    assert set(out_paths.keys()) == {
+        (label, task_name) for label in model_labels for task_name in task_names
+    }
+    for out_path in out_paths.values():
+        report: str = (out_path / "report.md").read_text()
+        assert "## Head layer_" in report
+        for fig_name in re.findall(r"\]\((figures/[^)]+\.png)\)", report):
+            assert (out_path / fig_name).exists(), fig_name
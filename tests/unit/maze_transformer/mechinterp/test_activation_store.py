@@ -0,0 +1,102 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+from maze_dataset import MazeDataset
+
+from maze_transformer.mechinterp.activation_capture import (
+    ActivationSpec,
+    capture_activations,
+)
+from maze_transformer.mechinterp.activation_store import ActivationStore
+from maze_transformer.mechinterp.logit_attrib_task import LOGIT_ATTRIB_TASKS
+from maze_transformer.training.config import ZanjHookedTransformer
+
+MODEL_PATH: Path = Path(
+    "examples/multsrc_demo-g6-n10K-a_dfs-h92077_tiny-v1_sweep-v1_2023-05-20-21-30-02/model.final.zanj"
+)
+TEMP_PATH: Path = Path("tests/_temp/test_activation_store")
+
+
+@pytest.fixture(scope="module")
+def model_and_prompts() -> tuple[ZanjHookedTransformer, list[list[str]]]:
+    model: ZanjHookedTransformer = ZanjHookedTransformer.read(MODEL_PATH)
+    dataset_cfg = model.zanj_model_config.dataset_cfg
+    dataset_cfg.n_mazes = 7
+    dataset: MazeDataset = MazeDataset.from_config(dataset_cfg, save_local=False)
+    dataset_tokens: list[list[str]] = dataset.as_tokens(
+        model.zanj_model_config.maze_tokenizer, join_tokens_individual_maze=False
+    )
+    prompts, _ = LOGIT_ATTRIB_TASKS["rand_path_token"](dataset_tokens)
+    return model, prompts
+
+
+def test_store_matches_capture(model_and_prompts):
+    model, prompts = model_and_prompts
+    specs: list[ActivationSpec] = [
+        ActivationSpec("blocks.0.hook_resid_post"),
+        ActivationSpec("blocks.1.attn.hook_pattern", pos_slice=-1),
+        ActivationSpec("blocks.1.attn.hook_attn_scores", pos_slice=-1, heads=[1]),
+        ActivationSpec("blocks.2.hook_mlp_out", pos_slice=slice(-3, None)),
+    ]
+    maze_ids: list[int] = [10 + i for i in range(len(prompts))]
+
+    store: ActivationStore = ActivationStore.capture(
+        model,
+        prompts,
+        specs,
+        path=TEMP_PATH / "store",
+        maze_ids=maze_ids,
+        batch_size=3,
+    )
+    # with the same chunks, padding positions also match
+    captured = capture_activations(model, prompts, specs, batch_size=3)
+
+    # reopen from disk
+    store = ActivationStore(TEMP_PATH / "store")
+    assert store.keys() == [spec.hook_name for spec in specs]
+    assert store.specs == specs
+    assert len(store) == len(prompts)
+    assert isinstance(store["blocks.0.hook_resid_post"], np.memmap)
+
+    for spec in specs:
+        assert store[spec.hook_name].shape == tuple(captured[spec.hook_name].shape)
+        np.testing.assert_allclose(
+            store[spec.hook_name],
+            captured[spec.hook_name].numpy(),
+            rtol=1e-5,
+            atol=1e-5,
+        )
+    np.testing.assert_allclose(
+        store.last_tok_logits, captured.last_tok_logits.numpy(), rtol=1e-5, atol=1e-5
+    )
+
+    # rows by maze id, positions of prompt tokens
+    rows: list[int] = store.rows_for_mazes([12, 10])
+    assert rows == [2, 0]
+    loaded = store.to_captured(rows)
+    assert torch.equal(
+        loaded["blocks.0.hook_resid_post"],
+        torch.from_numpy(np.array(store["blocks.0.hook_resid_post"][rows])),
+    )
+    row: int = rows[0]
+    first_pos: int = store.position_index(row, 0)
+    assert first_pos == store.seq_len - len(prompts[row])
+    _, cache = model.run_with_cache(
+        " ".join(prompts[row]), names_filter="blocks.0.hook_resid_post"
+    )
+    # the BOS token is just before the first prompt token
+    np.testing.assert_allclose(
+        store["blocks.0.hook_resid_post"][row, first_pos - 1 :],
+        cache["blocks.0.hook_resid_post"][0].detach().numpy(),
+        rtol=1e-4,
+        atol=1e-4,
+    )
+
+    scores = store.head_activations("blocks.1.attn.hook_attn_scores", 0)
+    assert scores.shape == (len(prompts), 1, store.seq_len)
+    np.testing.assert_array_equal(scores, store["blocks.1.attn.hook_attn_scores"][:, 0])
+
+    with pytest.raises(KeyError):
+        store["blocks.3.hook_resid_post"]
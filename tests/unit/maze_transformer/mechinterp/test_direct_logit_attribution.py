@@ -0,0 +1,46 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+from maze_dataset import MazeDataset
+
+from maze_transformer.mechinterp.direct_logit_attribution import (
+    compute_direct_logit_attribution,
+    compute_direct_logit_attribution_chunked,
+)
+from maze_transformer.mechinterp.logit_attrib_task import LOGIT_ATTRIB_TASKS
+from maze_transformer.training.config import ZanjHookedTransformer
+
+MODEL_PATH: Path = Path(
+    "examples/multsrc_demo-g6-n10K-a_dfs-h92077_tiny-v1_sweep-v1_2023-05-20-21-30-02/model.final.zanj"
+)
+
+
+@pytest.mark.parametrize("batch_size", [1, 3, 100])
+@torch.no_grad()
+def test_dla_chunked_matches_single_shot(batch_size):
+    model: ZanjHookedTransformer = ZanjHookedTransformer.read(MODEL_PATH)
+    dataset_cfg = model.zanj_model_config.dataset_cfg
+    dataset_cfg.n_mazes = 7
+    dataset: MazeDataset = MazeDataset.from_config(dataset_cfg, save_local=False)
+    dataset_tokens: list[list[str]] = dataset.as_tokens(
+        model.zanj_model_config.maze_tokenizer, join_tokens_individual_maze=False
+    )
+    prompts, targets = LOGIT_ATTRIB_TASKS["rand_path_token"](dataset_tokens)
+    answer_tokens: torch.Tensor = torch.tensor(
+        model.zanj_model_config.maze_tokenizer.encode(targets), dtype=torch.long
+    )
+
+    _, cache = model.run_with_cache([" ".join(p) for p in prompts])
+    dla_single = compute_direct_logit_attribution(
+        model, cache, answer_tokens, do_neurons=True, verbose=False
+    )
+    dla_chunked = compute_direct_logit_attribution_chunked(
+        model, prompts, answer_tokens, do_neurons=True, batch_size=batch_size
+    )
+
+    assert dla_chunked.keys() == dla_single.keys()
+    for k in dla_single:
+        assert dla_chunked[k].shape == dla_single[k].shape
+        np.testing.assert_allclose(dla_chunked[k], dla_single[k], rtol=1e-3, atol=1e-4)
@@ -0,0 +1,124 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+from maze_dataset import MazeDataset
+
+from maze_transformer.mechinterp.logit_attrib_task import LOGIT_ATTRIB_TASKS
+from maze_transformer.mechinterp.logit_diff import (
+    _logits_diff_multi_tokens,
+    logit_diff_direct,
+    logit_diff_directions,
+    logit_diff_residual_stream,
+    logits_diff_multi,
+)
+from maze_transformer.training.config import ZanjHookedTransformer
+
+MODEL_PATH: Path = Path(
+    "examples/multsrc_demo-g6-n10K-a_dfs-h92077_tiny-v1_sweep-v1_2023-05-20-21-30-02/model.final.zanj"
+)
+
+
+@torch.no_grad()
+def test_logits_diff_multi_matches_loop():
+    model: ZanjHookedTransformer = ZanjHookedTransformer.read(MODEL_PATH)
+    dataset_cfg = model.zanj_model_config.dataset_cfg
+    dataset_cfg.n_mazes = 6
+    dataset: MazeDataset = MazeDataset.from_config(dataset_cfg, save_local=False)
+    dataset_tokens: list[list[str]] = dataset.as_tokens(
+        model.zanj_model_config.maze_tokenizer, join_tokens_individual_maze=False
+    )
+    prompts, targets = LOGIT_ATTRIB_TASKS["rand_path_token"](dataset_tokens)
+    target_ids: torch.Tensor = torch.tensor(
+        model.zanj_model_config.maze_tokenizer.encode(targets), dtype=torch.long
+    )
+    logits, cache = model.run_with_cache([" ".join(p) for p in prompts])
+    last_tok_logits: torch.Tensor = logits[:, -1, :]
+
+    torch.manual_seed(42)
+    df: pd.DataFrame = logits_diff_multi(
+        model, cache, target_ids, last_tok_logits, noise_sigmas=[1, 5], n_randoms=2
+    )
+
+    # one `logit_diff_direct` and `logit_diff_residual_stream` call per combination
+    torch.manual_seed(42)
+    test_logits, compare_dict = _logits_diff_multi_tokens(
+        target_ids, last_tok_logits, noise_sigmas=[1, 5], n_randoms=2
+    )
+    expected: list[dict] = list()
+    for k_comp, compare_to in compare_dict.items():
+        for k, tokens in test_logits.items():
+            expected.append(
+                dict(
+                    test=k,
+                    compare_to=k_comp,
+                    result_orig=logit_diff_direct(
+                        last_tok_logits, tokens, compare_to, diff_per_prompt=False
+                    ),
+                    result_res=logit_diff_residual_stream(
+                        model, cache, tokens, compare_to
+                    ),
+                )
+            )
+    df_expected: pd.DataFrame = pd.DataFrame(expected)
+
+    assert list(df.columns) == [
+        "test",
+        "compare_to",
+        "result_orig",
+        "result_res",
+        "diff",
+        "ratio",
+    ]
+    assert df["test"].tolist() == df_expected["test"].tolist()
+    assert df["compare_to"].tolist() == df_expected["compare_to"].tolist()
+    for col in ["result_orig", "result_res"]:
+        np.testing.assert_allclose(
+            df[col].to_numpy(dtype=float),
+            df_expected[col].to_numpy(dtype=float),
+            rtol=1e-4,
+            atol=1e-4,
+        )
+
+
+def test_vocab_residual_directions_cache():
+    model: ZanjHookedTransformer = ZanjHookedTransformer.read(MODEL_PATH)
+    d_vocab: int = model.zanj_model_config.maze_tokenizer.vocab_size
+
+    directions: torch.Tensor = model.vocab_residual_directions()
+    assert torch.equal(
+        directions, model.tokens_to_residual_directions(torch.arange(d_vocab))
+    )
+    # cached between calls
+    assert model.vocab_residual_directions() is directions
+
+    # invalidated when the unembedding weights change
+    with torch.no_grad():
+        model.W_U.mul_(2.0)
+    directions_new: torch.Tensor = model.vocab_residual_directions()
+    assert directions_new is not directions
+    torch.testing.assert_close(directions_new, directions * 2.0)
+
+    model.load_state_dict(ZanjHookedTransformer.read(MODEL_PATH).state_dict())
+    torch.testing.assert_close(model.vocab_residual_directions(), directions)
+
+
+def test_logit_diff_directions_batched():
+    model: ZanjHookedTransformer = ZanjHookedTransformer.read(MODEL_PATH)
+    d_vocab: int = model.zanj_model_config.maze_tokenizer.vocab_size
+    tokens_correct: torch.Tensor = torch.randint(0, d_vocab, (3, 5))
+    tokens_compare_to: torch.Tensor = torch.randint(0, d_vocab, (3, 5))
+
+    for compare_to in [None, tokens_compare_to]:
+        batched: torch.Tensor = logit_diff_directions(model, tokens_correct, compare_to)
+        assert batched.shape == (3, 5, model.cfg.d_model)
+        for i in range(3):
+            torch.testing.assert_close(
+                batched[i],
+                logit_diff_directions(
+                    model,
+                    tokens_correct[i],
+                    None if compare_to is None else compare_to[i],
+                ),
+            )
@@ -0,0 +1,43 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+from maze_dataset import MazeDataset
+
+from maze_transformer.mechinterp.logit_attrib_task import LOGIT_ATTRIB_TASKS
+from maze_transformer.mechinterp.logit_lens import (
+    compute_logit_lens,
+    compute_logit_lens_streaming,
+)
+from maze_transformer.training.config import ZanjHookedTransformer
+
+MODEL_PATH: Path = Path(
+    "examples/multsrc_demo-g6-n10K-a_dfs-h92077_tiny-v1_sweep-v1_2023-05-20-21-30-02/model.final.zanj"
+)
+
+
+@pytest.mark.parametrize("batch_size", [2, 100])
+@torch.no_grad()
+def test_logit_lens_streaming_matches_cache(batch_size):
+    model: ZanjHookedTransformer = ZanjHookedTransformer.read(MODEL_PATH)
+    dataset_cfg = model.zanj_model_config.dataset_cfg
+    dataset_cfg.n_mazes = 7
+    dataset: MazeDataset = MazeDataset.from_config(dataset_cfg, save_local=False)
+    dataset_tokens: list[list[str]] = dataset.as_tokens(
+        model.zanj_model_config.maze_tokenizer, join_tokens_individual_maze=False
+    )
+    prompts, targets = LOGIT_ATTRIB_TASKS["first_path_choice"](dataset_tokens)
+    answer_tokens: torch.Tensor = torch.tensor(
+        model.zanj_model_config.maze_tokenizer.encode(targets), dtype=torch.long
+    )
+
+    _, cache = model.run_with_cache([" ".join(p) for p in prompts])
+    lens_cache = compute_logit_lens(model, cache, answer_tokens)
+    lens_streaming = compute_logit_lens_streaming(
+        model, prompts, answer_tokens, batch_size=batch_size
+    )
+
+    for x_cache, x_streaming in zip(lens_cache, lens_streaming):
+        assert x_streaming.shape == x_cache.shape
+        np.testing.assert_allclose(x_streaming, x_cache, rtol=1e-3, atol=1e-4)
@@ -0,0 +1,134 @@
+import numpy as np
+import torch
+from maze_dataset import LatticeMaze, LatticeMazeGenerators
+from maze_dataset.tokenization.util import coord_str_to_tuple_noneable
+
+from maze_transformer.mechinterp.maze_grid import (
+    NONCOORD_CELL,
+    lattice_neighbor_pairs,
+    maze_distance_grid,
+    pairwise_to_grid,
+    project_to_grid,
+    token_grid_scatter_map,
+)
+
+GRID_SHAPE: tuple[int, int] = (3, 4)
+TOKENS: list[str] = [
+    "<ADJLIST_START>",
+    "(0,1)",
+    "<-->",
+    "(2,3)",
+    ";",
+    "(0,1)",
+    "<-->",
+    "(1,1)",
+    ";",
+    "<PATH_START>",
+    "(2,3)",
+]
+
+
+def _project_loop(values: np.ndarray, tokens: list[str]) -> np.ndarray:
+    node_values = np.zeros(GRID_SHAPE)
+    for idx_token, token in enumerate(tokens):
+        coord = coord_str_to_tuple_noneable(token)
+        if coord is not None:
+            node_values[coord[0], coord[1]] += values[idx_token]
+    return node_values
+
+
+def test_token_grid_scatter_map():
+    scatter_map = token_grid_scatter_map(TOKENS, GRID_SHAPE)
+    assert scatter_map.tolist() == [-1, 1, -1, 11, -1, 1, -1, 5, -1, -1, 11]
+    assert NONCOORD_CELL == -1
+
+
+def test_project_to_grid_heads():
+    values = np.random.rand(2, 3, len(TOKENS))
+    projected = project_to_grid(
+        values, token_grid_scatter_map(TOKENS, GRID_SHAPE), GRID_SHAPE
+    )
+    assert projected.shape == (2, 3, *GRID_SHAPE)
+    for i in range(2):
+        for j in range(3):
+            np.testing.assert_allclose(
+                projected[i, j], _project_loop(values[i, j], TOKENS)
+            )
+
+    # torch tensors are accepted too
+    np.testing.assert_allclose(
+        project_to_grid(
+            torch.from_numpy(values[0, 0]),
+            token_grid_scatter_map(TOKENS, GRID_SHAPE),
+            GRID_SHAPE,
+        ),
+        projected[0, 0],
+    )
+
+
+def test_project_to_grid_per_maze_maps():
+    tokens_other: list[str] = TOKENS[:6]
+    scatter_maps = np.full((2, len(TOKENS)), NONCOORD_CELL)
+    scatter_maps[0] = token_grid_scatter_map(TOKENS, GRID_SHAPE)
+    scatter_maps[1, : len(tokens_other)] = token_grid_scatter_map(
+        tokens_other, GRID_SHAPE
+    )
+    values = np.random.rand(2, 5, len(TOKENS))
+
+    projected = project_to_grid(values, scatter_maps, GRID_SHAPE)
+    assert projected.shape == (2, 5, *GRID_SHAPE)
+    for head in range(5):
+        np.testing.assert_allclose(
+            projected[0, head], _project_loop(values[0, head], TOKENS)
+        )
+        np.testing.assert_allclose(
+            projected[1, head], _project_loop(values[1, head], tokens_other)
+        )
+
+
+def test_maze_distance_grid():
+    maze = LatticeMazeGenerators.gen_dfs(np.array([5, 6]))
+    source: tuple[int, int] = (2, 3)
+    distances = maze_distance_grid(maze, source)
+    assert distances.shape == (5, 6)
+    for row in range(5):
+        for col in range(6):
+            expected: int = maze.find_shortest_path(source, (row, col)).shape[0] - 1
+            assert distances[row, col] == expected
+
+
+def test_maze_distance_grid_unreachable():
+    # open grid, with the corner cell cut off
+    connection_list = np.ones((2, 3, 3), dtype=np.bool_)
+    connection_list[0, 1, 2] = False
+    connection_list[1, 2, 1] = False
+    maze = LatticeMaze(connection_list=connection_list)
+    distances = maze_distance_grid(maze, (0, 0))
+    assert np.isinf(distances[2, 2])
+    # manhattan distances everywhere else, since the grid is open
+    expected = np.add.outer(np.arange(3), np.arange(3)).astype(float)
+    expected[2, 2] = np.inf
+    np.testing.assert_array_equal(distances, expected)
+
+
+def test_pairwise_to_grid():
+    coords = np.array([(0, 0), (2, 3), (1, 1), (0, 3)])
+    pairwise = np.random.rand(4, 4)
+    grid = pairwise_to_grid(pairwise, coords, GRID_SHAPE)
+    assert grid.shape == (*GRID_SHAPE, *GRID_SHAPE)
+    for i, (x, y) in enumerate(coords):
+        for j, (x2, y2) in enumerate(coords):
+            assert grid[x, y, x2, y2] == pairwise[i, j]
+    assert np.isnan(grid).sum() == np.prod(GRID_SHAPE) ** 2 - 16
+
+
+def test_lattice_neighbor_pairs():
+    coords = np.array([(1, 1), (0, 1), (2, 2), (1, 2), (0, 0), (3, 0)])
+    expected = sorted(
+        (i, j)
+        for i in range(len(coords))
+        for j in range(i + 1, len(coords))
+        if np.abs(coords[i] - coords[j]).sum() == 1
+    )
+    assert lattice_neighbor_pairs(coords).tolist() == [list(p) for p in expected]
+    assert lattice_neighbor_pairs(np.zeros((0, 2), dtype=int)).shape == (0, 2)
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+import torch
+from scipy.spatial.distance import pdist, squareform
+from scipy.stats import pearsonr
+
+from maze_transformer.mechinterp.pairwise_distances import (
+    pairwise_distances,
+    pairwise_distances_correlation,
+)
+
+SCIPY_METRICS: dict[str, str | object] = {
+    "cosine": "cosine",
+    "euclidean": "euclidean",
+    "cityblock": "cityblock",
+    "abs_dot": lambda u, v: np.abs(np.dot(u, v)),
+}
+
+
+@pytest.mark.parametrize("metric", list(SCIPY_METRICS.keys()))
+@pytest.mark.parametrize("chunk_size", [1, 7, 1024])
+def test_pairwise_distances_match_pdist(metric, chunk_size):
+    x = np.random.randn(23, 5).astype(np.float32)
+    expected = pdist(x.astype(np.float64), metric=SCIPY_METRICS[metric])
+
+    np.testing.assert_allclose(
+        pairwise_distances(x, metric, chunk_size=chunk_size), expected, atol=1e-10
+    )
+    np.testing.assert_allclose(
+        pairwise_distances(
+            torch.from_numpy(x), metric, square=True, chunk_size=chunk_size
+        ),
+        squareform(expected),
+        atol=1e-10,
+    )
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1024])
+def test_pairwise_distances_correlation(chunk_size):
+    coords = np.array([(i, j) for i in range(5) for j in range(5)], dtype=np.float64)
+    # embeddings which are noisy functions of the coordinates
+    x = np.concatenate([coords, np.random.randn(25, 3)], axis=1)
+
+    distances, correlation, pval = pairwise_distances_correlation(
+        x,
+        metric="euclidean",
+        compare_to=coords,
+        compare_metric="euclidean",
+        output="condensed",
+        chunk_size=chunk_size,
+    )
+    expected_r, expected_p = pearsonr(pdist(x), pdist(coords))
+    np.testing.assert_allclose(distances, pdist(x), atol=1e-10)
+    assert correlation == pytest.approx(expected_r, abs=1e-10)
+    assert pval == pytest.approx(expected_p, rel=1e-6, abs=1e-300)
+
+    no_output, correlation_only, _ = pairwise_distances_correlation(
+        x, "euclidean", compare_to=coords, output=None, chunk_size=chunk_size
+    )
+    assert no_output is None
+    assert correlation_only == pytest.approx(expected_r, abs=1e-10)
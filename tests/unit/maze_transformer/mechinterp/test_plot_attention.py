@@ -0,0 +1,47 @@
+from pathlib import Path
+
+import torch
+from maze_dataset import MazeDataset
+
+from maze_transformer.mechinterp.plot_attention import ProcessedMazeAttention
+from maze_transformer.training.config import ZanjHookedTransformer
+
+MODEL_PATH: Path = Path(
+    "examples/multsrc_demo-g6-n10K-a_dfs-h92077_tiny-v1_sweep-v1_2023-05-20-21-30-02/model.final.zanj"
+)
+
+
+def test_from_model_and_dataset_batched():
+    model: ZanjHookedTransformer = ZanjHookedTransformer.read(MODEL_PATH)
+    dataset_cfg = model.zanj_model_config.dataset_cfg
+    dataset_cfg.n_mazes = 5
+    dataset: MazeDataset = MazeDataset.from_config(dataset_cfg, save_local=False)
+
+    batched = ProcessedMazeAttention.from_model_and_dataset(
+        model, dataset, n_mazes=5, batch_size=3
+    )
+
+    n_layers: int = model.zanj_model_config.model_cfg.n_layers
+    n_heads: int = model.zanj_model_config.model_cfg.n_heads
+    # adjacency lists are shuffled on each tokenization, so compare to running each context alone
+    for processed in batched:
+        n_tokens: int = len(processed.tokens_context) + 1
+        assert processed.attention_tensored.shape == (
+            n_layers * n_heads,
+            n_tokens,
+            n_tokens,
+        )
+        with torch.no_grad():
+            logits, cache = model.run_with_cache(" ".join(processed.tokens_context))
+        torch.testing.assert_close(processed.logits, logits, rtol=1e-4, atol=1e-4)
+        for layer in range(n_layers):
+            name: str = f"blocks.{layer}.attn.hook_pattern"
+            torch.testing.assert_close(
+                processed.attention_dict[name], cache[name], rtol=1e-4, atol=1e-5
+            )
+            torch.testing.assert_close(
+                processed.attention_tensored[layer * n_heads : (layer + 1) * n_heads],
+                cache[name][0],
+                rtol=1e-4,
+                atol=1e-5,
+            )
@@ -0,0 +1,160 @@
+from pathlib import Path
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+import torch
+from maze_dataset import MazeDataset
+from scipy.spatial.distance import pdist, squareform
+from scipy.stats import pearsonr
+from sklearn.decomposition import PCA
+
+from maze_transformer.mechinterp.residual_stream_structure import (
+    _RESIDUAL_PCA_CACHE,
+    compute_distances_and_correlation,
+    compute_grid_distances,
+    compute_residual_pca,
+    plot_pca_colored,
+    process_tokens_for_pca,
+)
+from maze_transformer.training.config import ZanjHookedTransformer
+
+MODEL_PATH: Path = Path(
+    "examples/multsrc_demo-g6-n10K-a_dfs-h92077_tiny-v1_sweep-v1_2023-05-20-21-30-02/model.final.zanj"
+)
+
+
+def test_compute_residual_pca():
+    model: ZanjHookedTransformer = ZanjHookedTransformer.read(MODEL_PATH)
+    tokenizer = model.zanj_model_config.maze_tokenizer
+    dataset_cfg = model.zanj_model_config.dataset_cfg
+    dataset_cfg.n_mazes = 4
+    dataset: MazeDataset = MazeDataset.from_config(dataset_cfg, save_local=False)
+    prompts: list[list[str]] = dataset.as_tokens(
+        tokenizer, join_tokens_individual_maze=False
+    )
+    token_plotting_info = process_tokens_for_pca(tokenizer)
+    hook_name: str = "blocks.1.hook_resid_post"
+    d_model: int = model.cfg.d_model
+
+    results = compute_residual_pca(
+        model,
+        token_plotting_info,
+        prompts,
+        hook_name=hook_name,
+        n_components=d_model,
+        batch_size=3,
+    )
+    assert set(results.keys()) == {"all", "coords_only", "special_only"}
+    n_tokens: int = sum(len(p) for p in prompts)
+    assert results["all"].result.shape == (d_model, n_tokens)
+    assert (
+        results["coords_only"].result.shape[1] + results["special_only"].result.shape[1]
+        == n_tokens
+    )
+    assert results["all"].index_map == [i for p in prompts for i in tokenizer.encode(p)]
+
+    # with all components, the incremental fit matches a full PCA of the same residuals
+    with torch.no_grad():
+        _, cache = model.run_with_cache(
+            [" ".join(p) for p in prompts], names_filter=hook_name
+        )
+    residuals: np.ndarray = np.concatenate(
+        [cache[hook_name][i, -len(p) :].numpy() for i, p in enumerate(prompts)]
+    )
+    pca_full: PCA = PCA(svd_solver="full").fit(residuals)
+    np.testing.assert_allclose(
+        results["all"].pca_obj.explained_variance_,
+        pca_full.explained_variance_,
+        rtol=1e-3,
+        atol=1e-5,
+    )
+    np.testing.assert_allclose(
+        np.abs(results["all"].result),
+        np.abs(pca_full.transform(residuals).T),
+        rtol=1e-2,
+        atol=1e-3,
+    )
+
+    # cached per model
+    assert (
+        compute_residual_pca(
+            model,
+            token_plotting_info,
+            prompts,
+            hook_name=hook_name,
+            n_components=d_model,
+            batch_size=3,
+        )
+        is results
+    )
+
+    # without the cache, nothing is stored for the model
+    model_uncached: ZanjHookedTransformer = ZanjHookedTransformer.read(MODEL_PATH)
+    compute_residual_pca(
+        model_uncached,
+        token_plotting_info,
+        prompts,
+        hook_name=hook_name,
+        n_components=2,
+        batch_size=3,
+        use_cache=False,
+    )
+    assert model_uncached not in _RESIDUAL_PCA_CACHE
+
+    fig, _ = plot_pca_colored(
+        results,
+        "coords_only",
+        token_plotting_info,
+        dim1=1,
+        dim2=2,
+    )
+    plt.close(fig)
+
+
+def test_compute_grid_distances():
+    model: ZanjHookedTransformer = ZanjHookedTransformer.read(MODEL_PATH)
+    tokenizer = model.zanj_model_config.maze_tokenizer
+    distances_matrix: np.ndarray = compute_distances_and_correlation(
+        model.W_E.detach().numpy(), tokenizer, show=False
+    )["embedding_distances_matrix"]
+
+    grid_distances: np.ndarray = compute_grid_distances(distances_matrix, tokenizer)
+    n: int = tokenizer.max_grid_size
+    assert grid_distances.shape == (n, n, n, n)
+    for idx, (x, y) in enumerate(tokenizer.coordinate_tokens_coords.keys()):
+        for idx2, (x2, y2) in enumerate(tokenizer.coordinate_tokens_coords.keys()):
+            assert grid_distances[x, y, x2, y2] == distances_matrix[idx, idx2]
+
+
+@pytest.mark.parametrize(
+    "embedding_metric",
+    ["cosine", "dot", "correlation", "chebyshev", lambda u, v: np.abs(u - v).max()],
+)
+def test_compute_distances_and_correlation_metrics(embedding_metric):
+    model: ZanjHookedTransformer = ZanjHookedTransformer.read(MODEL_PATH)
+    tokenizer = model.zanj_model_config.maze_tokenizer
+    embeddings: np.ndarray = model.W_E.detach().numpy().astype(np.float64)
+    result: dict = compute_distances_and_correlation(
+        embeddings, tokenizer, embedding_metric=embedding_metric, show=False
+    )
+
+    # metrics outside the chunked engine go through `pdist`, and agree with it
+    coord_embeddings: np.ndarray = embeddings[
+        list(tokenizer.coordinate_tokens_ids.values())
+    ]
+    expected: np.ndarray = pdist(
+        coord_embeddings,
+        metric=(
+            (lambda u, v: np.abs(np.dot(u, v)))
+            if embedding_metric == "dot"
+            else embedding_metric
+        ),
+    )
+    np.testing.assert_allclose(
+        result["embedding_distances_matrix"], squareform(expected), atol=1e-8
+    )
+    expected_corr, _ = pearsonr(
+        expected, pdist(np.array(list(tokenizer.coordinate_tokens_coords.keys())))
+    )
+    assert np.isclose(result["correlation"], expected_corr)
@@ -0,0 +1,27 @@
+from pathlib import Path
+
+import matplotlib.pyplot as plt
+
+from maze_transformer.utils.figure_jobs import FigureJob, render_figure_jobs
+
+
+def _save_line_plot(path: Path, n: int) -> int:
+    fig, ax = plt.subplots()
+    ax.plot(range(n))
+    fig.savefig(path)
+    return n
+
+
+def test_render_figure_jobs_keeps_open_figures(temp_dir):
+    fig_user, _ = plt.subplots()
+    fignums_before: list[int] = plt.get_fignums()
+    jobs: list[FigureJob] = [
+        FigureJob(_save_line_plot, dict(path=temp_dir / f"fig_{n}.png", n=n))
+        for n in range(3)
+    ]
+
+    assert render_figure_jobs(jobs) == [0, 1, 2]
+    assert all((temp_dir / f"fig_{n}.png").exists() for n in range(3))
+    # only the figures opened by the jobs are closed
+    assert plt.get_fignums() == fignums_before
+    plt.close(fig_user)
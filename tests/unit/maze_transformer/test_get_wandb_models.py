@@ -0,0 +1,136 @@
+import multiprocessing.pool
+from pathlib import Path
+
+import pytest
+import torch
+
+from maze_transformer.training.config import ZanjHookedTransformer
+from maze_transformer.utils import get_wandb_models
+from maze_transformer.utils.get_wandb_models import (
+    WandbCheckpointJob,
+    config_from_wandb_run,
+    convert_wandb_checkpoints,
+)
+
+WANDB_CFG: dict = dict(
+    act_fn="gelu",
+    d_model=16,
+    d_head=4,
+    n_layers=1,
+    d_vocab=20,  # grid_n = 3
+    dataset_name="test",
+)
+
+
+def _random_state_dict(cfg) -> dict:
+    # unit scale weights, so the output logits are well separated (the default
+    # initialization gives near-ties, which break the argsort equality checks)
+    return {
+        k: torch.randn_like(v) if v.dtype.is_floating_point and v.ndim > 0 else v
+        for k, v in cfg.create_model().state_dict().items()
+    }
+
+
+class _FakeArtifact:
+    def __init__(self, name: str, step: int, state_dict: dict) -> None:
+        self.name: str = name
+        self.aliases: list[str] = [f"step={step}"]
+        self.digest: str = f"digest-{step}"
+        self.step: int = step
+        self.state_dict: dict = state_dict
+        self.n_downloads: int = 0
+
+    def download(self, root: str | Path) -> Path:
+        root = Path(root)
+        root.mkdir(parents=True, exist_ok=True)
+        torch.save(self.state_dict, root / f"model.iter_{self.step}.pt")
+        self.n_downloads += 1
+        return root
+
+
+class _FakeRun:
+    def __init__(self, name: str, artifacts: list[_FakeArtifact]) -> None:
+        self.name: str = name
+        self.config: dict = WANDB_CFG
+        self.artifacts: list[_FakeArtifact] = artifacts
+
+    def logged_artifacts(self) -> list[_FakeArtifact]:
+        return self.artifacts
+
+
+class _FakeApi:
+    """stand-in for `wandb.Api`, serving runs with random model checkpoints"""
+
+    def __init__(self, project: str, runs: dict[str, list[int]]) -> None:
+        torch.manual_seed(0)
+        self.runs: dict[str, _FakeRun] = dict()
+        for run_id, steps in runs.items():
+            cfg = config_from_wandb_run(WANDB_CFG, run_id, run_id, 0)
+            self.runs[f"{project}/{run_id}"] = _FakeRun(
+                run_id,
+                [
+                    _FakeArtifact(f"{run_id}:v{i}", step, _random_state_dict(cfg))
+                    for i, step in enumerate(steps)
+                ],
+            )
+
+    def run(self, path: str) -> _FakeRun:
+        return self.runs[path]
+
+    def artifact(self, name: str) -> _FakeArtifact:
+        path, alias = name.split(":")
+        assert alias == "latest"
+        return self.runs[path].artifacts[-1]
+
+
+@pytest.mark.parametrize("parallel", [False, 2])
+def test_convert_wandb_checkpoints(temp_dir, parallel, mocker, capsys):
+    project: str = "test/project"
+    api = _FakeApi(project, {"run_a": [10, 20], "run_b": [5]})
+    jobs: list[WandbCheckpointJob] = [
+        WandbCheckpointJob("run_a", 10, project),
+        WandbCheckpointJob("run_a", 20, project),
+        WandbCheckpointJob("run_a", None, project),  # latest, same artifact as 20
+        WandbCheckpointJob("run_b", None, project),
+    ]
+
+    # conversions happen in worker processes when parallel, so spy on what is sent there
+    spy_convert = (
+        mocker.spy(multiprocessing.pool.Pool, "map")
+        if parallel
+        else mocker.spy(get_wandb_models, "_convert_wandb_checkpoint")
+    )
+    saved: dict[WandbCheckpointJob, Path] = convert_wandb_checkpoints(
+        jobs,
+        output_path=temp_dir,
+        n_download_threads=4,
+        parallel=parallel,
+        api=api,
+    )
+
+    assert list(saved.keys()) == jobs
+    assert saved[jobs[1]] == saved[jobs[2]] == temp_dir / "wandb.run_a.iter_20.zanj"
+    # the duplicate checkpoint is only converted once
+    convert_args: list[tuple] = (
+        list(spy_convert.call_args.args[2])
+        if parallel
+        else [call.args[0] for call in spy_convert.call_args_list]
+    )
+    assert sorted(args[3] for args in convert_args) == sorted(set(saved.values()))
+    # every artifact is only downloaded once, even if requested twice
+    for run in api.runs.values():
+        for artifact in run.artifacts:
+            assert artifact.n_downloads == 1
+
+    for job, path in saved.items():
+        model: ZanjHookedTransformer = ZanjHookedTransformer.read(path)
+        assert model.training_records["load_wandb_run_kwargs"]["run_id"] == job.run_id
+
+    # a second run is served from the download cache
+    capsys.readouterr()
+    convert_wandb_checkpoints(
+        jobs[:1], output_path=temp_dir, test_reload=False, verbose=False, api=api
+    )
+    # the per-checkpoint helpers always print, but the batch progress headers don't
+    assert "# " not in capsys.readouterr().out
+    assert api.runs[f"{project}/run_a"].artifacts[0].n_downloads == 1
@@ -1,6 +1,7 @@
 import pytest
+import torch
 
-from maze_transformer.utils.padding import pad_and_batch_tensors
+from maze_transformer.utils.padding import concat_left_padded, pad_and_batch_tensors
 
 
 @pytest.mark.parametrize(
@@ -35,3 +36,26 @@ def test_pad_and_batch_tensors(batch_size, padding_idx, padding_dir, expected_sh
             else:
                 assert seq[-len(context) :].tolist() == context
                 assert (seq[: -len(context)] == padding_idx).all()
+
+
+def test_concat_left_padded():
+    a = torch.ones(2, 3, 4)
+    b = torch.full((1, 5, 4), 2.0)
+    out = concat_left_padded([a, b], pos_dims=(1,), value=-1.0)
+
+    assert out.shape == (3, 5, 4)
+    assert torch.all(out[:2, :2] == -1.0)
+    assert torch.all(out[:2, 2:] == 1.0)
+    assert torch.all(out[2] == 2.0)
+
+
+def test_concat_left_padded_multiple_dims():
+    # attention patterns have both query and key positions
+    a = torch.ones(1, 2, 3, 3)
+    b = torch.ones(2, 2, 4, 4)
+    out = concat_left_padded([a, b], pos_dims=(2, 3))
+
+    assert out.shape == (3, 2, 4, 4)
+    assert torch.all(out[0, :, 0, :] == 0.0)
+    assert torch.all(out[0, :, :, 0] == 0.0)
+    assert torch.all(out[0, :, 1:, 1:] == 1.0)
@@ -0,0 +1,119 @@
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+from zanj import ZANJ
+
+from maze_transformer.training.config import ZanjHookedTransformer
+from maze_transformer.utils.zanj_mmap import mmap_stored_npy
+
+MODEL_PATH: Path = Path(
+    "examples/multsrc_demo-g6-n10K-a_dfs-h92077_tiny-v1_sweep-v1_2023-05-20-21-30-02/model.final.zanj"
+)
+
+
+def _assert_state_dicts_equal(model_a, model_b) -> None:
+    sd_a, sd_b = model_a.state_dict(), model_b.state_dict()
+    assert sd_a.keys() == sd_b.keys()
+    for k in sd_a:
+        assert torch.equal(sd_a[k], sd_b[k]), k
+
+
+@pytest.fixture(scope="module")
+def uncompressed_model_path(tmp_path_factory) -> Path:
+    path: Path = tmp_path_factory.mktemp("zanj_mmap") / "model.uncompressed.zanj"
+    ZanjHookedTransformer.read(MODEL_PATH).save(path, zanj=ZANJ(compress=False))
+    return path
+
+
+def test_mmap_stored_npy(uncompressed_model_path):
+    with zipfile.ZipFile(uncompressed_model_path) as zipf:
+        info: zipfile.ZipInfo = zipf.getinfo("state_dict/embed.W_E.npy")
+        with zipf.open(info) as fp:
+            expected: np.ndarray = np.load(fp)
+    mapped = mmap_stored_npy(uncompressed_model_path, info)
+    assert isinstance(mapped, np.memmap)
+    np.testing.assert_array_equal(mapped, expected)
+
+    # compressed entries are not mapped
+    with zipfile.ZipFile(MODEL_PATH) as zipf:
+        assert (
+            mmap_stored_npy(MODEL_PATH, zipf.getinfo("state_dict/embed.W_E.npy"))
+            is None
+        )
+
+
+@pytest.mark.parametrize("path_kind", ["compressed", "uncompressed"])
+def test_read_mmap_matches_read(uncompressed_model_path, path_kind):
+    path: Path = MODEL_PATH if path_kind == "compressed" else uncompressed_model_path
+    model: ZanjHookedTransformer = ZanjHookedTransformer.read(path)
+    model_mmap = ZanjHookedTransformer.read(path, mmap=True)
+    assert isinstance(model_mmap, ZanjHookedTransformer)
+    _assert_state_dicts_equal(model, model_mmap)
+
+
+def test_read_skip_processing(uncompressed_model_path, monkeypatch):
+    model: ZanjHookedTransformer = ZanjHookedTransformer.read(uncompressed_model_path)
+    # the model was processed when it was read before saving
+    assert model.zanj_model_config.model_cfg.weight_processing["are_weights_processed"]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("weights should not be processed again")
+
+    monkeypatch.setattr(ZanjHookedTransformer, "process_weights_", fail)
+    model_skipped = ZanjHookedTransformer.read(
+        uncompressed_model_path, mmap=True, skip_processing=True
+    )
+    for k, v in model.state_dict().items():
+        torch.testing.assert_close(model_skipped.state_dict()[k], v)
+
+
+@pytest.mark.parametrize("fold_ln", [False, True])
+def test_export_processed(tmp_path, fold_ln, monkeypatch):
+    model: ZanjHookedTransformer = ZanjHookedTransformer.read(MODEL_PATH)
+    export_path: Path = model.export_processed(
+        tmp_path / "model.processed.zanj", fold_ln=fold_ln
+    )
+    # the original model is not modified
+    assert model.cfg.normalization_type == "LN"
+    assert not model.zanj_model_config.model_cfg.weight_processing[
+        "are_layernorms_folded"
+    ]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("weights should not be processed again")
+
+    monkeypatch.setattr(ZanjHookedTransformer, "process_weights_", fail)
+    model_exported = ZanjHookedTransformer.read(
+        export_path, mmap=True, skip_processing=True
+    )
+    assert model_exported.zanj_model_config.model_cfg.weight_processing == dict(
+        are_layernorms_folded=fold_ln,
+        are_weights_processed=True,
+    )
+    assert model_exported.cfg.normalization_type == ("LNPre" if fold_ln else "LN")
+
+    tokens = torch.randint(0, model.cfg.d_vocab, (4, 20))
+    with torch.no_grad():
+        torch.testing.assert_close(
+            model_exported(tokens), model(tokens), rtol=1e-4, atol=1e-4
+        )
+
+
+def test_skip_processing_mismatched_state_dict(tmp_path):
+    model: ZanjHookedTransformer = ZanjHookedTransformer.read(MODEL_PATH)
+    model_folded: ZanjHookedTransformer = ZanjHookedTransformer.read(
+        model.export_processed(tmp_path / "folded.zanj", fold_ln=True),
+        skip_processing=True,
+    )
+    model_unfolded: ZanjHookedTransformer = ZanjHookedTransformer.read(
+        model.export_processed(tmp_path / "unfolded.zanj", fold_ln=False),
+        skip_processing=True,
+    )
+    # unfolded layernorm weights don't fit a model with folded layernorms
+    with pytest.raises(ValueError):
+        model_folded._load_state_dict_wrapper(
+            model_unfolded.state_dict(), skip_processing=True
+        )
@@ -58,6 +58,7 @@ def _custom_serialized_config() -> Dict[Any, Any]:
             "eval_slow": 10,
         },
         "intervals_count": None,
+        "checkpoint_delta_cfg": None,
         "evals_max_new_tokens": 16,
         "validation_dataset_cfg": 100,
         "__format__": "TrainConfig(SerializableDataclass)",
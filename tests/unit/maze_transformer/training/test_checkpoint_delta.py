@@ -0,0 +1,85 @@
+from pathlib import Path
+
+import pytest
+import torch
+from zanj import ZANJ
+
+from maze_transformer.training.checkpoint_delta import (
+    DeltaCheckpointer,
+    decode_delta,
+    encode_delta,
+)
+from maze_transformer.training.config import ZanjHookedTransformer
+
+MODEL_PATH: Path = Path(
+    "examples/multsrc_demo-g6-n10K-a_dfs-h92077_tiny-v1_sweep-v1_2023-05-20-21-30-02/model.final.zanj"
+)
+
+
+@pytest.mark.parametrize("quantize_bits", [None, 8, 16])
+def test_encode_decode_delta(quantize_bits):
+    torch.manual_seed(0)
+    keyframe = {
+        "w": torch.randn(20, 30),
+        "b": torch.randn(30, dtype=torch.float16),
+        "unchanged": torch.randn(5),
+        "mask": torch.rand(4, 4) > 0.5,
+    }
+    state_dict = {
+        "w": keyframe["w"] + 0.01 * torch.randn(20, 30),
+        "b": keyframe["b"] + 0.01,
+        "unchanged": keyframe["unchanged"].clone(),
+        "mask": ~keyframe["mask"],
+    }
+    encoded = encode_delta(state_dict, keyframe, quantize_bits)
+    decoded = decode_delta(encoded["deltas"], encoded["scales"], keyframe)
+
+    assert decoded.keys() == state_dict.keys()
+    for key, value in state_dict.items():
+        assert decoded[key].dtype == value.dtype
+        if quantize_bits is None or not value.dtype.is_floating_point:
+            assert torch.equal(decoded[key], value), key
+        else:
+            step: float = encoded["scales"][key]
+            err: float = (decoded[key].double() - value.double()).abs().max().item()
+            # half a quantization step, plus rounding to the stored dtype
+            assert err <= step / 2 + value.abs().max().item() * 1e-3, key
+    assert torch.equal(decoded["unchanged"], state_dict["unchanged"])
+
+
+@pytest.mark.parametrize("quantize_bits", [None, 8])
+def test_delta_checkpointer(temp_dir, quantize_bits):
+    model: ZanjHookedTransformer = ZanjHookedTransformer.read(MODEL_PATH)
+    zanj: ZANJ = ZANJ()
+    checkpointer: DeltaCheckpointer = DeltaCheckpointer(
+        dict(keyframe_every=2, quantize_bits=quantize_bits), zanj=zanj
+    )
+
+    paths: list[Path] = [temp_dir / f"model.iter_{i}.zanj" for i in range(3)]
+    full_path: Path = temp_dir / "full.zanj"
+    is_keyframe: list[bool] = list()
+    for path in paths:
+        with torch.no_grad():
+            for param in model.parameters():
+                param.add_(0.001 * torch.randn_like(param))
+        is_keyframe.append(checkpointer.save(model, path))
+        if path == paths[1]:
+            zanj.save(model, full_path)
+            assert checkpointer.keyframe_path == paths[0]
+    assert is_keyframe == [True, False, True]
+    assert checkpointer.keyframe_path == paths[2]
+    assert paths[1].stat().st_size < paths[0].stat().st_size
+
+    model_delta: ZanjHookedTransformer = ZanjHookedTransformer.read(paths[1])
+    model_full: ZanjHookedTransformer = ZanjHookedTransformer.read(full_path)
+    sd_delta = model_delta.state_dict()
+    for key, value in model_full.state_dict().items():
+        if quantize_bits is None:
+            assert torch.equal(sd_delta[key], value), key
+        else:
+            torch.testing.assert_close(sd_delta[key], value, rtol=0, atol=1e-4)
+
+    # a changed keyframe is detected
+    zanj.save(model, paths[0])
+    with pytest.raises(ValueError):
+        ZanjHookedTransformer.read(paths[1])
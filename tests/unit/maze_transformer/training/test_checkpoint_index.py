@@ -0,0 +1,100 @@
+from pathlib import Path
+
+from muutils.statcounter import StatCounter
+
+from maze_transformer.evaluation.eval_model import find_config
+from maze_transformer.training.checkpoint_index import (
+    CheckpointIndex,
+    get_checkpoint_paths,
+)
+from maze_transformer.training.train_save_files import TRAIN_SAVE_FILES
+from maze_transformer.utils.file_hash import file_sha256
+
+
+def _make_run(run_dir: Path, iterations: list[int]) -> list[Path]:
+    (run_dir / TRAIN_SAVE_FILES.checkpoints).mkdir(parents=True)
+    (run_dir / TRAIN_SAVE_FILES.config_holder).write_text("{}")
+    paths: list[Path] = list()
+    for iteration in iterations:
+        path: Path = (
+            run_dir
+            / TRAIN_SAVE_FILES.checkpoints
+            / TRAIN_SAVE_FILES.model_checkpt_zanj(iteration)
+        )
+        path.write_bytes(bytes([iteration % 256]) * (iteration + 1))
+        paths.append(path)
+    return paths
+
+
+def test_checkpoint_index_roundtrip(temp_dir):
+    run_dir: Path = temp_dir / "run"
+    iterations: list[int] = [0, 5, 10, 15]
+    paths: list[Path] = _make_run(run_dir, iterations)
+
+    # without an index, checkpoints are found on disk
+    assert get_checkpoint_paths(run_dir) == list(zip(iterations, paths))
+    assert CheckpointIndex.read(run_dir) is None
+
+    index: CheckpointIndex = CheckpointIndex(run_dir)
+    for iteration, path in reversed(list(zip(iterations, paths))):
+        index.add(
+            iteration,
+            path,
+            metrics={"loss": 1.0 / (iteration + 1), "evals": StatCounter([1, 2, 3])},
+        )
+        index.save()
+    # re-adding an iteration replaces its entry
+    index.add(10, paths[2], metrics={"loss": 0.5})
+    index.add(15, paths[3], final=True)
+    index.save()
+
+    index_read: CheckpointIndex | None = CheckpointIndex.read(run_dir)
+    assert index_read is not None
+    assert index_read.checkpoints == index.checkpoints
+    assert index_read.final == index.final
+    assert index_read.config_path == run_dir / TRAIN_SAVE_FILES.config_holder
+
+    assert [e.iteration for e in index_read.checkpoints] == iterations
+    entry = index_read.checkpoints[1]
+    assert entry.size == paths[1].stat().st_size
+    assert entry.sha256 == file_sha256(paths[1])
+    assert entry.metrics["evals"]["mean"] == 2.0
+    assert index_read.checkpoints[2].metrics == {"loss": 0.5}
+
+    # the index, rather than the directory, is used once it exists
+    paths[0].unlink()
+    assert get_checkpoint_paths(run_dir) == list(zip(iterations, paths))
+    assert get_checkpoint_paths(run_dir, "pt") == []
+
+
+def test_checkpoint_index_keyframe(temp_dir):
+    run_dir: Path = temp_dir / "run"
+    paths: list[Path] = _make_run(run_dir, [0, 1])
+
+    index: CheckpointIndex = CheckpointIndex(run_dir)
+    index.add(0, paths[0])
+    index.add(1, paths[1], keyframe_path=paths[0])
+    index.save()
+
+    index_read: CheckpointIndex | None = CheckpointIndex.read(run_dir)
+    assert index_read is not None
+    assert index_read.checkpoints[0].keyframe is None
+    assert run_dir / index_read.checkpoints[1].keyframe == paths[0]
+
+    # entries written before keyframes were recorded still load
+    data: dict = index.serialize()
+    del data["checkpoints"][0]["keyframe"]
+    assert CheckpointIndex.load(data, run_dir).checkpoints == index.checkpoints
+
+
+def test_find_config_with_index(temp_dir):
+    run_dir: Path = temp_dir / "run"
+    paths: list[Path] = _make_run(run_dir, [0, 1])
+    config_path: Path = run_dir / TRAIN_SAVE_FILES.config_holder
+
+    assert find_config(paths[0]) == config_path
+    assert find_config(run_dir) == config_path
+
+    index: CheckpointIndex = CheckpointIndex(run_dir, config_holder="other.json")
+    index.save()
+    assert find_config(paths[1]) == run_dir / "other.json"